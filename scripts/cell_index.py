@@ -0,0 +1,113 @@
+import numpy as np
+import count_tables
+
+#When the user points at or clicks on a square of the heatmap, we want to show which isolates
+#fall in it and which of them are errors under the current cutoffs. Scanning the whole dataset
+#for every mouse movement would be far too slow for a large dataset, so instead a cell_index is
+#built once per dataset and set of bins: the isolates are sorted by the heatmap cell they fall in,
+#and offsets[k]:offsets[k+1] is the range of the sorted list that belongs to cell k. Looking up
+#the isolates in a cell is then just two array lookups, however many isolates there are.
+#(See disk_plotting.heatmap_cell_index, which builds and caches the index for the current plot.)
+
+ERROR_LABELS = ['', 'very major', 'major', 'minor']
+CATEGORY_LABELS = ['S', 'I', 'R']
+
+
+class cell_index():
+
+  #x and y are the plotted values of each isolate and xbins and ybins the bin edges of the heatmap
+  #(as passed to hist2d). x_labels and y_labels are the values shown for each bin in the tooltips.
+  def __init__(self, x, y, xbins, ybins, x_labels, y_labels):
+    self.xbins, self.ybins = np.asarray(xbins), np.asarray(ybins)
+    self.x_labels, self.y_labels = x_labels, y_labels
+    self.num_y_bins = self.ybins.shape[0] - 1
+    num_cells = (self.xbins.shape[0] - 1) * self.num_y_bins
+    x_bin, y_bin = count_tables.locate_bins(x, self.xbins), count_tables.locate_bins(y, self.ybins)
+    #Isolates that are off the edge of the heatmap go in an extra cell at the end.
+    cell = np.where((x_bin >= 0) & (y_bin >= 0), x_bin * self.num_y_bins + y_bin, num_cells)
+    self.order = np.argsort(cell, kind='stable')
+    self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=num_cells + 1))])
+
+  #The (x bin, y bin) of the cell containing the point (x, y) in plot coordinates, or None.
+  def find_cell(self, x, y):
+    x_bin = count_tables.locate_bins(np.asarray([x]), self.xbins)[0]
+    y_bin = count_tables.locate_bins(np.asarray([y]), self.ybins)[0]
+    if x_bin < 0 or y_bin < 0:
+      return None
+    return x_bin, y_bin
+
+  #The positions in the dataset of the isolates in a cell.
+  def isolates(self, x_bin, y_bin):
+    cell = x_bin * self.num_y_bins + y_bin
+    return self.order[self.offsets[cell]:self.offsets[cell+1]]
+
+
+#The isolates in a cell, leaving out any that aren't in the subset the user has selected
+#(see model_parameter_set.set_subset_filter).
+def selected_isolates(current_model, index, x_bin, y_bin):
+  isolates = index.isolates(x_bin, y_bin)
+  if current_model.subset_mask is not None:
+    isolates = isolates[current_model.subset_mask[isolates]]
+  return isolates
+
+
+#Returns the actual and predicted category and the error code (see count_tables.ERROR_CODE_MATRIX)
+#of each of the isolates at the given positions in the dataset, under the current breakpoints
+#and cutoffs.
+def classify_isolates(current_model, isolates):
+  actual_category = count_tables.actual_categories(current_model.current_dataset['mics'][isolates],
+                                                   float(current_model.ycutoffS), float(current_model.ycutoffR))
+  predicted_category = count_tables.predicted_categories(current_model.current_dataset['disks'][isolates],
+                                                         float(current_model.xcutoffS), float(current_model.xcutoffR),
+                                                         current_model.mic_vs_mic)
+  return actual_category, predicted_category, count_tables.ERROR_CODE_MATRIX[predicted_category, actual_category]
+
+
+#The text of the tooltip shown for a cell of the heatmap. If the isolates have sample weights,
+#the error counts are total weights, as in the error table.
+def describe_cell(current_model, index, x_bin, y_bin):
+  isolates = selected_isolates(current_model, index, x_bin, y_bin)
+  weights = current_model.isolate_weights(isolates)
+  error_counts = np.bincount(classify_isolates(current_model, isolates)[2], weights=weights, minlength=4)
+  if current_model.mic_vs_mic:
+    cell_text = 'MIC %s mg/L, alternate method MIC %s mg/L'%(index.y_labels[y_bin], index.x_labels[x_bin])
+  else:
+    cell_text = 'MIC %s mg/L, disk zone %s mm'%(index.y_labels[y_bin], index.x_labels[x_bin])
+  if weights is not None:
+    cell_text += '\n%s isolates, total weight %s'%(isolates.shape[0], round(weights.sum(), 2))
+    error_counts = np.round(error_counts, 2)
+  else:
+    cell_text += '\n%s isolates'%isolates.shape[0]
+  return ('%s: %s very major, %s major, %s minor errors'%(cell_text, error_counts[1], error_counts[2], error_counts[3]))
+
+
+#The rows of the table of isolates shown when the user clicks on a cell: the isolate's number
+#(its row in the dataset, counting from 1), mic, disk zone, collection date and weight if there are
+#any, actual and predicted category, and error type (blank if there is no error).
+def isolate_table(current_model, index, x_bin, y_bin):
+  isolates = selected_isolates(current_model, index, x_bin, y_bin)
+  actual_category, predicted_category, error_code = classify_isolates(current_model, isolates)
+  rows = []
+  for i, isolate in enumerate(isolates):
+    row = [str(isolate + 1), str(current_model.current_dataset['mics'][isolate]),
+           str(current_model.current_dataset['disks'][isolate])]
+    if current_model.current_dataset['dates'] is not None:
+      row.append(str(current_model.current_dataset['dates'][isolate]))
+    if current_model.isolate_weights() is not None:
+      row.append(str(current_model.current_dataset['weights'][isolate]))
+    row += [CATEGORY_LABELS[actual_category[i]], CATEGORY_LABELS[predicted_category[i]],
+            ERROR_LABELS[error_code[i]]]
+    rows.append(row)
+  return rows
+
+
+def isolate_table_header(current_model):
+  if current_model.mic_vs_mic:
+    header = ['Isolate', 'MIC (mg/L)', 'Alternate MIC (mg/L)']
+  else:
+    header = ['Isolate', 'MIC (mg/L)', 'Disk zone (mm)']
+  if current_model.current_dataset['dates'] is not None:
+    header.append('Collection date')
+  if current_model.isolate_weights() is not None:
+    header.append('Weight')
+  return header + ['Actual', 'Predicted', 'Error']
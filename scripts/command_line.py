@@ -0,0 +1,59 @@
+import os
+import model_object, model_core
+
+#The batch report generator, the workbook export and the power simulation can all be run from the
+#command line without opening the GUI. The options they share (the MIC breakpoints, the fitting
+#algorithm, the filter and so on) and the loading of a dataset with them are defined here, so that
+#each tool only has to add its own options, e.g.
+#  parser = argparse.ArgumentParser(description='...')
+#  parser.add_argument('filenames', nargs='+')
+#  command_line.add_common_arguments(parser)
+#  args = parser.parse_args()
+#  error_code, current_model = command_line.load_model(args.filenames[0], command_line.settings_from_arguments(args))
+
+#Settings applied to every dataset, using the same defaults as the main window.
+DEFAULT_SETTINGS = {'ycutoffS':4.0, 'ycutoffR':16.0, 'mic_vs_mic':False, 'model_type':'mgm',
+                    'colormap_type':'christmas_colors', 'strain_name':'Acinteobacter baumannii',
+                    'subset_filter':''}
+
+
+#Adds the shared options to an argparse parser. The --mic-vs-mic and --strain-name options are only
+#added if dataset_options is True (they don't mean anything to a tool that doesn't report on the
+#datasets themselves), and --workers only if the tool runs in a pool of worker processes.
+def add_common_arguments(parser, filter_help='only fit the isolates selected by this filter', dataset_options=True,
+                         workers_option=True):
+  parser.add_argument('--susceptibility', type=float, default=DEFAULT_SETTINGS['ycutoffS'],
+                      help='susceptibility MIC breakpoint (<=, mg/L)')
+  parser.add_argument('--resistance', type=float, default=DEFAULT_SETTINGS['ycutoffR'],
+                      help='resistance MIC breakpoint (>=, mg/L)')
+  if dataset_options:
+    parser.add_argument('--mic-vs-mic', action='store_true', help='the files contain MIC vs MIC data')
+  parser.add_argument('--algorithm', choices=list(model_core.model_engines), default=DEFAULT_SETTINGS['model_type'],
+                      help='fitting algorithm (mgm = min gini impurity, mem = min entropy, mmm = min misclassification rate)')
+  if dataset_options:
+    parser.add_argument('--strain-name', default=DEFAULT_SETTINGS['strain_name'])
+  parser.add_argument('--filter', default='', help=filter_help + ', e.g. "site=blood AND date>=2018-01-01"')
+  if workers_option:
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per cpu)')
+
+
+#The settings given by the options added by add_common_arguments (the defaults for any that weren't added).
+def settings_from_arguments(args):
+  return dict(DEFAULT_SETTINGS, ycutoffS=args.susceptibility, ycutoffR=args.resistance,
+              mic_vs_mic=getattr(args, 'mic_vs_mic', DEFAULT_SETTINGS['mic_vs_mic']), model_type=args.algorithm,
+              strain_name=getattr(args, 'strain_name', DEFAULT_SETTINGS['strain_name']), subset_filter=args.filter)
+
+
+#Loads a dataset with the given settings. Returns an error message ('0' if there was no error) and the model.
+#The filter in the settings isn't applied, since some tools fit several subsets of the same dataset.
+def load_model(filename, settings=DEFAULT_SETTINGS):
+  current_model = model_object.model_parameter_set()
+  current_model.set_model_type(settings['model_type'])
+  for attribute in ['ycutoffS', 'ycutoffR', 'mic_vs_mic', 'colormap_type', 'strain_name']:
+    setattr(current_model, attribute, settings[attribute])
+  if not os.path.isfile(filename):
+    return "The file '%s' could not be found."%filename, current_model
+  try:
+    return current_model.load_dataset(filename), current_model
+  except Exception as error:
+    return "The file '%s' could not be read (%s)."%(filename, error), current_model
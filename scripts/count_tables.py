@@ -0,0 +1,195 @@
+import numpy as np
+
+#Rows and columns of this matrix are the predicted and actual categories (0 = susceptible,
+#1 = intermediate, 2 = resistant) and the entries are the error codes: 0 = no error, 1 = very major,
+#2 = major, 3 = minor.
+#Very major error means predicted susceptible but actually resistant.
+#Major error means predicted resistant but actually susceptible.
+#Minor error means one of {predicted, actual} is intermediate
+#and the other is something else. This distinction comes down to the impact
+#a missed prediction would have on patient treatment. If you predict susceptible
+#but bug is resistant, for example, this is the worst thing that can happen, because
+#patient is being treated with a drug that won't help, so the infection will continue
+#to grow. Predicting resistant when actually susceptible is bad but not quite as bad --
+#just means the doctor will pass on what could actually have been a useful drug for that patient.
+#Using a lookup table lets us classify every cell of a count table at once rather than
+#one isolate at a time.
+ERROR_CODE_MATRIX = np.asarray([[0, 3, 1],
+                                [3, 0, 3],
+                                [2, 3, 0]])
+ERROR_NAMES = ['no error', 'very major errors', 'major errors', 'minor errors']
+
+
+#The categories used for the error tables (0 = susceptible, 1 = intermediate, 2 = resistant)
+#for an array of mics, using the MIC breakpoints...
+def actual_categories(mics, ycutoffS, ycutoffR):
+  actual_category = np.full(np.shape(mics), 2)
+  actual_category[mics < ycutoffR] = 1
+  actual_category[mics <= ycutoffS] = 0
+  return actual_category
+
+#...and for an array of disk zones (or alternate-method MICs for MIC vs MIC data), using the disk cutoffs.
+def predicted_categories(disks, xcutoffS, xcutoffR, is_mic_vs_mic=False):
+  if is_mic_vs_mic == False:
+    predicted_category = np.full(np.shape(disks), 2)
+    predicted_category[disks > xcutoffR] = 1
+    predicted_category[disks >= xcutoffS] = 0
+  else:
+    predicted_category = np.zeros(np.shape(disks), dtype=np.int64)
+    predicted_category[disks > xcutoffS] = 1
+    predicted_category[disks >= xcutoffR] = 2
+  return predicted_category
+
+
+#The bin each value falls in, using the same convention as numpy.histogram2d and hist2d (each bin
+#includes its left edge, and the last one its right edge as well), or -1 if it is outside all of them.
+#Used for the heatmap tooltips (see cell_index.py) and the text-based histogram (see data_export.py).
+def locate_bins(values, edges):
+  bins = np.searchsorted(edges, values, side='right') - 1
+  bins[np.asarray(values) == edges[-1]] = edges.shape[0] - 2
+  bins[(bins < 0) | (bins > edges.shape[0] - 2)] = -1
+  return bins
+
+
+#A count_table stores the number of isolates observed at each (disk value, mic value)
+#combination. The fit and the error tables only depend on these counts, not on the
+#order of the isolates, so once we have a count table we can refit or recalculate the
+#error rates without going back to the raw data. New isolates are folded in with add_rows,
+#so updating the statistics for a growing dataset costs time proportional to the number
+#of new rows rather than the size of the whole dataset. (For MIC vs MIC data the "disk"
+#axis simply holds the alternate-method MICs.)
+#If the dataset has several disk columns (e.g. two disk potencies tested against the same
+#broth MIC), counts has one slice per disk column, all sharing the same mic and disk value
+#axes, so that the MIC side only has to be worked out once and all of the columns can be
+#fit together (see model_core.impurity_model.fit_disk_counts_batch).
+#If the isolates have sample weights (e.g. to correct for over-sampled outbreak clusters), a weighted
+#count table holds the total weight of the isolates in each cell instead of their number, so
+#everything calculated from it -- the fit and the error tables -- is weighted too, at no extra cost.
+class count_table():
+
+  def __init__(self, num_disk_columns=1, weighted=False):
+    self.disk_values = np.zeros((0))
+    self.mic_values = np.zeros((0))
+    self.counts = np.zeros((num_disk_columns,0,0), dtype=np.float64 if weighted else np.int64)
+
+  def is_weighted(self):
+    return np.issubdtype(self.counts.dtype, np.floating)
+
+  #If the new rows contain disk or mic values we haven't seen before, insert them into the
+  #(sorted) axes and shift the existing counts to their new positions.
+  def extend_axes(self, mics, disks):
+    new_disks = np.union1d(self.disk_values, disks)
+    new_mics = np.union1d(self.mic_values, mics)
+    if new_disks.shape[0] == self.disk_values.shape[0] and new_mics.shape[0] == self.mic_values.shape[0]:
+      return
+    new_counts = np.zeros((self.counts.shape[0], new_disks.shape[0], new_mics.shape[0]), dtype=self.counts.dtype)
+    new_counts[np.ix_(np.arange(self.counts.shape[0]), np.searchsorted(new_disks, self.disk_values),
+                      np.searchsorted(new_mics, self.mic_values))] = self.counts
+    self.disk_values, self.mic_values, self.counts = new_disks, new_mics, new_counts
+
+  #Returns the position of each (mic, disk) pair in the flattened counts matrix, with one column
+  #per disk column (disks can be a 1d array if there is only one). All of the values must already
+  #be present on the axes.
+  def cell_indices(self, mics, disks):
+    disks = np.asarray(disks).reshape((-1, self.counts.shape[0]))
+    disk_index = np.searchsorted(self.disk_values, disks)
+    mic_index = np.searchsorted(self.mic_values, mics)[:,None]
+    column_offset = np.arange(self.counts.shape[0])[None,:] * self.counts.shape[1] * self.counts.shape[2]
+    return column_offset + disk_index * self.mic_values.shape[0] + mic_index
+
+  def add_rows(self, mics, disks, weights=None):
+    mics, disks = np.asarray(mics, dtype=np.float64), np.asarray(disks, dtype=np.float64)
+    if mics.shape[0] == 0:
+      return
+    self.extend_axes(mics, disks)
+    self.add_cells(self.cell_indices(mics, disks), weights)
+
+  #Adds or removes isolates whose positions in the flattened counts matrix have already
+  #been found with cell_indices. This is cheaper than add_rows when the same isolates
+  #are added and removed many times (e.g. for sliding time windows), since we only need to
+  #look up their positions once. weights (one per isolate) is required for a weighted table.
+  def add_cells(self, cells, weights=None):
+    self.counts += self.cell_counts(cells, weights)
+
+  #Removing weighted isolates can leave rounding errors behind in cells that should now be empty,
+  #and an empty cell that looked occupied would change the range of cutoffs the fit tries, so
+  #anything that small is set back to zero.
+  def remove_cells(self, cells, weights=None):
+    self.counts -= self.cell_counts(cells, weights)
+    if self.is_weighted():
+      self.counts[np.abs(self.counts) < 1e-9] = 0
+
+  def cell_counts(self, cells, weights=None):
+    if weights is not None:
+      weights = np.broadcast_to(np.asarray(weights, dtype=np.float64)[:,None], cells.shape).ravel()
+    cell_counts = np.bincount(cells.ravel(), weights=weights, minlength=self.counts.size)
+    return cell_counts.reshape(self.counts.shape).astype(self.counts.dtype)
+
+  #Returns an empty count table with the same axes as this one.
+  def empty_copy(self):
+    new_table = count_table(self.counts.shape[0], self.is_weighted())
+    new_table.disk_values = self.disk_values
+    new_table.mic_values = self.mic_values
+    new_table.counts = np.zeros(self.counts.shape, dtype=self.counts.dtype)
+    return new_table
+
+  #Every disk column contains every isolate, so just count the first one.
+  def num_strains(self):
+    return self.counts[0].sum()
+
+  #Collapses the mic axis into the three categories used for fitting: 0 if mic >= resistance
+  #breakpoint, 2 if mic <= susceptibility breakpoint, 1 otherwise. (We have to be careful about
+  #the >= and <= here. Microbiologists always specify for their cutoffs whether they are using >= or >,
+  #and MICs are discrete value data, not continuous.) Returns the disk values and an array of shape
+  #(number of disk columns, number of disk values, 3) with the number of isolates of each
+  #category at each disk value for each disk column.
+  def class_counts(self, miccutoffS, miccutoffR):
+    mic_class = np.ones(self.mic_values.shape[0], dtype=np.int64)
+    mic_class[self.mic_values <= miccutoffS] = 2
+    mic_class[self.mic_values >= miccutoffR] = 0
+    class_counts = np.zeros(self.counts.shape[:2] + (3,), dtype=self.counts.dtype)
+    for i in range(0,3):
+      class_counts[...,i] = self.counts[:,:,mic_class==i].sum(axis=-1)
+    return self.disk_values, class_counts
+
+  #Calculates the same error tables as model_parameter_set.update_error_for_disk_data and
+  #update_error_for_mic_vs_mic_data, but one (disk value, mic value) cell at a time rather than
+  #one isolate at a time, for the disk column with index column. See the comments in model_object.py
+  #for the definitions of the categories and of the >=I+2, I+1 to I-1 and <=I-2 bands.
+  def tabulate_errors(self, ycutoffS, ycutoffR, xcutoffS, xcutoffR, is_mic_vs_mic=False, column=0):
+    counts = self.counts[column]
+    actual_category = actual_categories(self.mic_values, ycutoffS, ycutoffR)
+    predicted_category = predicted_categories(self.disk_values, xcutoffS, xcutoffR, is_mic_vs_mic)
+    #Band 0 is >=I+2, band 1 is I+1 to I-1, band 2 is <=I-2.
+    band = np.full(self.mic_values.shape[0], 2)
+    band[self.mic_values >= ycutoffS] = 1
+    band[self.mic_values > ycutoffR] = 0
+
+    error_code = ERROR_CODE_MATRIX[predicted_category[:,None], actual_category[None,:]]
+    band_and_error = (band[None,:] * 4 + error_code).flatten()
+    totals = np.bincount(band_and_error, weights=counts.flatten(), minlength=12).reshape((3,4))
+    totals = totals.astype(counts.dtype)
+
+    results = {'error_counts':{'num_strains':counts.sum()}}
+    for i, band_name in enumerate(['i_plus2_error', 'i_plus1_minus1_error', 'i_minus2_error']):
+      results[band_name] = {'num_strains':totals[i,:].sum()}
+      for j in range(1,4):
+        results[band_name][ERROR_NAMES[j]] = totals[i,j]
+    for j in range(1,4):
+      results['error_counts'][ERROR_NAMES[j]] = totals[:,j].sum()
+
+    #Essential agreement (MIC vs MIC only) means the alternate-method MIC is within twofold
+    #of the broth MIC.
+    if is_mic_vs_mic and results['error_counts']['num_strains'] > 0:
+      within_twofold = ((self.disk_values[:,None] <= self.mic_values[None,:]*2.0) &
+                        (self.disk_values[:,None] >= self.mic_values[None,:]*0.5))
+      num_wrong_predictions = totals[:,1:].sum()
+      results['essential_agreement'] = 100.0 * counts[within_twofold].sum() / results['error_counts']['num_strains']
+      results['categorical_agreement'] = (100.0 - 100.0*num_wrong_predictions /
+                                          results['error_counts']['num_strains'])
+    #Convert the numpy numbers back to plain python numbers so that the error dictionaries
+    #look exactly like they did when they were filled in one isolate at a time.
+    for key in results:
+      if isinstance(results[key], dict):
+        results[key] = {k:v.item() for k, v in results[key].items()}
+    return results
@@ -1,46 +1,90 @@
-import numpy as np, generate_tabletext
+import numpy as np, generate_tabletext, count_tables
+
+#The bins of the text-based histogram: mics on y and, on x, typical disk values (between 4 and
+#54 mm) or, if the user is providing MIC vs MIC data, the same bins as y.
+HISTOGRAM_MIC_BINS = np.asarray([0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,256])
+HISTOGRAM_DISK_BINS = np.arange(4,54,1)
 
 #Our microbiology team requested a specific format for export data. Basically, we're going to take the same
 #table shown in the application and write it to csv by joining all lists with ','. 
 def export_results(current_model, filename):
   if current_model.current_dataset['mics'] is None:
     return "You want to export data but you haven't loaded any? Try loading some first. Now there's an idea!"
-  output_file = open(filename, 'w+')
-  output_table = generate_tabletext.generate_celltext(current_model)
-  for i in range(0, len(output_table)):
-    output_table[i] = [z.replace('\n',' ') for z in output_table[i]]
-    output_file.write(','.join(output_table[i]) + '\n')
   try:
-    ybins = np.asarray([0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,256])
-    xbins = np.arange(4,54,1)
-    #If the user is providing MIC vs MIC data, the xbins will be the same as y. Otherwise,
-    #they are based on typical disk values (between 4 and 54 mm).
-    if current_model.mic_vs_mic:
-      xbins = np.copy(ybins)
-    #Our microbiology team wanted to have a text-based histogram. The code below writes a text-based
-    #histogram into the csv file.
-    
+    output_file = open(filename, 'w+')
   except:
     return ("The data could not be exported. The program is trying to write to a file called '%s'. Make sure that you don't "
       "have a file by this name already open."%filename)
+  output_table = generate_tabletext.generate_celltext(current_model)
+  for i in range(0, len(output_table)):
+    output_table[i] = [z.replace('\n',' ') for z in output_table[i]]
+    output_file.write(','.join(output_table[i]) + '\n')
+  #Our microbiology team wanted to have a text-based histogram. The code below writes a text-based
+  #histogram into the csv file.
   output_file.write('\n\n\nThe chart below plots disk zone (on x) vs mic (on y)\n')
-  text_histogram, xedges, yedges = np.histogram2d(np.asarray(current_model.current_dataset['disks']),
-                                       np.asarray(current_model.current_dataset['mics']),
-                                       bins=[xbins,ybins])
-  text_histogram = np.flip(text_histogram, axis=1)
-  yedges = np.flip(yedges, axis=0)
+  output_file.write('\n'.join([','.join([str(z) for z in row]) for row in histogram_rows(current_model)]))
+  output_file.close()
+  return '0'
+
+
+#The number of isolates (of the selected subset, for the selected disk column) in each (x bin, y bin) of
+#the text-based histogram. This is the same as numpy.histogram2d of the raw data, but is binned from
+#the count table, so it costs the same however many isolates there are.
+def histogram_counts(current_model, xbins, ybins):
+  table = current_model.active_count_table()
+  counts = table.counts[current_model.active_disk_column]
+  x_bin, y_bin = count_tables.locate_bins(table.disk_values, xbins), count_tables.locate_bins(table.mic_values, ybins)
+  inside = (x_bin[:,None] >= 0) & (y_bin[None,:] >= 0)
+  cell = x_bin[:,None] * (ybins.shape[0] - 1) + y_bin[None,:]
+  return np.bincount(cell[inside], weights=counts[inside],
+                     minlength=(xbins.shape[0] - 1) * (ybins.shape[0] - 1)).reshape((xbins.shape[0] - 1, ybins.shape[0] - 1))
+
+
+#The rows of the text-based histogram, with the highest mic at the top: each row starts with the mic
+#bin's upper edge, followed by the count in each disk bin (blank if there are none), and the last row
+#lists the disk bin edges.
+def histogram_rows(current_model):
+  xbins, ybins = HISTOGRAM_DISK_BINS, HISTOGRAM_MIC_BINS
+  if current_model.mic_vs_mic:
+    xbins = np.copy(ybins)
+  text_histogram = np.flip(histogram_counts(current_model, xbins, ybins), axis=1)
+  yedges = np.flip(ybins, axis=0)
+  rows = []
   for i in range(0, text_histogram.shape[1]):
     if i < (yedges.shape[0]-1):
-      output_line = [str(yedges[i+1])]
+      output_line = [yedges[i+1]]
     else:
       output_line = ['']
     for j in range(0, text_histogram.shape[0]):
       if text_histogram[j,i] > 0:
-        output_line.append(str(text_histogram[j,i]))
+        output_line.append(text_histogram[j,i])
       else:
         output_line.append('')
-    output_file.write(','.join(output_line))
-    output_file.write('\n')
-  output_file.write(',' + ','.join([str(z) for z in xedges]))
+    rows.append(output_line)
+  rows.append([''] + list(xbins))
+  return rows
+
+
+#Writes the score of every (cutoff_R, width) pair tried in the last fit to a csv file, one row per
+#proposed resistance cutoff and one column per intermediate zone width, followed by the list of
+#cutoffs that tied for the best score.
+def export_score_surface(current_model, filename):
+  engine = current_model.model_engine
+  if engine.score_surface is None or current_model.use_user_defined_disk_cutoffs or current_model.mic_vs_mic:
+    return ("There is no score surface to export. Fit some data first (the score surface isn't calculated for MIC vs "
+            "MIC data or when using manual cutoffs).")
+  try:
+    output_file = open(filename, 'w+')
+  except:
+    return ("The score surface could not be exported. The program is trying to write to a file called '%s'. Make sure that you don't "
+      "have a file by this name already open."%filename)
+  output_file.write('Resistance disk cutoff (<=) \\ Intermediate zone width,' +
+                    ','.join([str(width) for width in engine.allowed_widths]) + '\n')
+  for i in range(0, engine.proposed_cutoffs_R.shape[0]):
+    output_file.write(','.join([str(engine.proposed_cutoffs_R[i])] +
+                               [repr(float(score)) for score in engine.score_surface[i,:]]) + '\n')
+  output_file.write('\n\nOptimal cutoffs (all equally good)\nResistance disk cutoff (<=),Susceptibility disk cutoff (>=)\n')
+  for cutoff_R, cutoff_S in engine.tied_optima:
+    output_file.write('%s,%s\n'%(cutoff_R, cutoff_S))
   output_file.close()
   return '0'
@@ -1,25 +1,6 @@
-import numpy as np
 from copy import copy
 
 
-def process_traindata(raw, miccutoffR, miccutoffS):
-  #2 is susceptible, 1 is intermediate, 0 is resistant.
-  x, y = [], []
-  for i in range(len(raw['mics'])):
-    yreal = raw['mics'][i]
-    #We have to be careful about use of the >= and <= here. Microbiologists always specify for their cutoffs
-    #whether they are using >= or > and MICs are discrete value data not continuous.
-    if yreal >= miccutoffR:
-      y.append(0)
-    elif yreal <= miccutoffS:
-      y.append(2)
-    else:
-      y.append(1)
-  #The x-values -- the disk values -- are relatively straightforward since we do not have to assign categories
-  #for these.
-  x = np.asarray(raw['disks'])
-  return x, np.asarray(y)
-
 def fit_data(current_model):
   try:
     #Check to make sure the user entered valid cutoffs. If not, give 'em an error so we don't even
@@ -37,7 +18,9 @@ def fit_data(current_model):
   #data, so we can just return without doing anything. Although DO check
   #first to make sure they haven't entered non-numeric cutoffs.
   #Also, none of this applies if it is MIC vs MIC data.
+  #In either case the score surface from any earlier fit no longer matches the cutoffs, so it is cleared.
   if current_model.use_user_defined_disk_cutoffs == True and current_model.mic_vs_mic==False:
+    current_model.model_engine.clear_score_surface()
     try:
       _ = float(current_model.xcutoffR)
       _ = float(current_model.xcutoffS)
@@ -51,30 +34,46 @@ def fit_data(current_model):
   #applications, FDA requires them to use same cutoff for e-test MIC and broth MIC.
   #We just make sure to use copy so we don't have multiple bindings to same object.
   if current_model.mic_vs_mic == True:
+    current_model.model_engine.clear_score_surface()
     current_model.xcutoffR = copy(float(current_model.ycutoffR))
     current_model.xcutoffS = copy(float(current_model.ycutoffS))
+    current_model.disk_column_cutoffs = [[current_model.xcutoffR, current_model.xcutoffS]
+                                         for name in current_model.disk_column_names]
     return '0'
 
   try:
-    #Process current dataset. We're going to fit a classifier to separate susceptible from non-susceptible
-    #(aka ysuscep) and resistant from nonresistant (aka yresist). x is the disk values.
-    x, y = process_traindata(current_model.current_dataset, miccutoffR, miccutoffS)
+    #Count the isolates in each category at each disk value. We're going to fit a classifier to separate
+    #susceptible from non-susceptible and resistant from nonresistant, and since the fit only depends on
+    #these counts, we take them from the model's count table rather than reprocessing the raw data
+    #(see count_table.class_counts for the category definitions). If the user has selected a subset of
+    #the isolates, only those are fit.
+    disk_values, class_counts = current_model.active_count_table().class_counts(miccutoffS, miccutoffR)
   except:
     #If we couldn't do that, they PROBABLY entered numeric characters. Give 'em an error.
     return "The data could not be processed. Typically this error results when it contains non-numeric characters (e.g. <=). Try again."
 
   #Check to make sure their dataset really does contain both flavors. If not, give 'em an error.
-  if np.max(y) < 2 or np.min(y) > 0:
+  #(Every disk column contains the same isolates, so we only need to check the first.)
+  category_totals = class_counts[0].sum(axis=0)
+  if category_totals[2] == 0 or category_totals[0] == 0:
     return ("You are trying to fit data that either does not contain any resistant strains or does not contain any susceptible strains "
         "(i.e. there are only resistant + intermediate or resistant + susceptible in this dataset). Autofitting will "
             "not work. You could use manual cutoff selection for this dataset. Check the manual override button to proceed.")
   #try:
     #Currently we only have one modeling approach incorporated although we can add another 
       
-  window_widths = current_model.model_engine.fit_disk_data(x,y)
+  #All of the disk columns are fit in one go; the engine keeps the score surface and tied optima
+  #for the one currently selected.
+  fit = current_model.model_engine.fit_disk_counts_batch(disk_values, class_counts)
+  current_model.disk_column_cutoffs = [[float(cutoff_R), float(cutoff_S)] for cutoff_R, cutoff_S
+                                       in zip(fit['cutoffs_R'], fit['cutoffs_S'])]
+  current_model.model_engine.select_fit(fit, (current_model.active_disk_column,))
   current_model.xcutoffR = float(current_model.model_engine.cutoff_R)
   current_model.xcutoffS = float(current_model.model_engine.cutoff_S)
-  if len(window_widths) > 0:
-    return ', '.join(['!'] + window_widths)
+  #If more than one pair of cutoffs gives the best possible score, list them all, so the user can see
+  #which alternatives there were.
+  if len(current_model.model_engine.tied_optima) > 1:
+    return ', '.join(['!'] + ['R <=%s / S >=%s'%(cutoff_R, cutoff_S) for cutoff_R, cutoff_S
+                              in current_model.model_engine.tied_optima])
   else:
     return '0'
@@ -1,15 +1,12 @@
 import numpy as np, matplotlib
-from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
-from matplotlib.pyplot import cm
 import matplotlib.colors as colors
 from matplotlib.colors import ListedColormap
-import generate_tabletext
+import generate_tabletext, cell_index
 
 
 def create_christmas_colormap():
-  christmas_colormap = cm.get_cmap('viridis', 31)
+  christmas_colormap = matplotlib.colormaps['viridis'].resampled(31)
   christmas_colormap.colors[0,0:-1] = [1,1,1]
   for i in range(1,29):
     christmas_colormap.colors[i,0:-1] = [0,0.9-i*0.02,0]
@@ -18,49 +15,177 @@ def create_christmas_colormap():
   return christmas_colormap
 
 
+#Draws the current model's heatmap and error table into the main window's figure and updates the canvas.
 def gen_plot(qtapp, data_type='disk'):
-  current_model = qtapp.curr_model
-  mic_cutoffS = float(current_model.ycutoffS)
-  mic_cutoffR = float(current_model.ycutoffR)
+  output_code = draw_figure(qtapp.central_plot, qtapp.curr_model)
+  if output_code != '0':
+    return output_code
+  qtapp.canvas.draw()
+  #Build the index used for the heatmap tooltips now rather than on the first mouse movement.
+  heatmap_cell_index(qtapp.curr_model)
+  return '0'
+
+
+#Checks the breakpoints and cutoffs for current_model, brings its error tables up to date and
+#returns an error message ('0' if there was no error), the (clipped and, for MICs,
+#log-transformed) x and y values to plot and their weights (see heatmap_values).
+def prepare_plot_data(current_model):
   try:
     #Some cutoffs and breakpoints are very unlikely to be encuontered in reality and these
     #limits are below.
     if float(current_model.ycutoffS) < 0.06 or float(current_model.ycutoffS) > 120:
-      return "You have entered an invalid MIC breakpoint (<0.06 or >120). Try again."
+      return "You have entered an invalid MIC breakpoint (<0.06 or >120). Try again.", None, None, None
     if float(current_model.ycutoffR) < 0.06 or float(current_model.ycutoffR) > 120:
-      return "You have entered an invalid MIC breakpoint (<0.06 or >120). Try again."
+      return "You have entered an invalid MIC breakpoint (<0.06 or >120). Try again.", None, None, None
     if float(current_model.xcutoffS) < 0.12 or float(current_model.xcutoffS) > 64:
-      return "You have entered an invalid disk cutoff(<0.12 or >64). Try again."
+      return "You have entered an invalid disk cutoff(<0.12 or >64). Try again.", None, None, None
     if float(current_model.xcutoffR) < 0.12 or float(current_model.xcutoffR) > 64:
-      return "You have entered an invalid disk cutoff(<0.12 or >64). Try again."
+      return "You have entered an invalid disk cutoff(<0.12 or >64). Try again.", None, None, None
   except:
-    return "You have entered a non-numeric MIC breakpoint or disk cutoff. Try again."
+    return "You have entered a non-numeric MIC breakpoint or disk cutoff. Try again.", None, None, None
   #If user imported non-numeric values, as they sometimes may, return error message.
   try:
-    yreal = np.log(np.clip(np.asarray(current_model.current_dataset['mics']), a_min=0.016, a_max = 256))
-    if current_model.mic_vs_mic:
-      x = np.log(np.clip(np.asarray(current_model.current_dataset['disks']), a_min=0.016, a_max=256))
-    else:
-      x = np.clip(np.asarray(current_model.current_dataset['disks']), a_min=5, a_max=50)
+    x, yreal, weights = heatmap_values(current_model)
   except:
-    return "Your data could not be plotted. It probably contains non-numeric or negative values. Try again."
+    return "Your data could not be plotted. It probably contains non-numeric or negative values. Try again.", None, None, None
   #Update the error tables before plotting...
   error_code = current_model.update_error_tables(current_model.mic_vs_mic)
-  if error_code != '0':
-    return error_code
-  cell_text = generate_tabletext.generate_celltext(current_model)
-  #vertpoints will be used to fill in the vertical lines that mark cutoffs on the heatmap.
-  vertpoints1 = np.arange(0.0161,255,0.5)
+  return error_code, x, yreal, weights
+
+
+#The values plotted on the heatmap for each isolate.
+def plot_values(current_model):
+  return plot_coordinates(current_model, current_model.current_dataset['disks'], current_model.current_dataset['mics'])
+
+
+#The heatmap is drawn from the count table (of the selected subset, if there is one) rather than from
+#the isolates themselves: one point per occupied (disk, mic) cell, counting as much as the isolates in
+#it. The heatmap comes out the same, but redrawing it after isolates are appended doesn't take longer
+#the more isolates there are. Returns the x and y values and the weight of each point.
+def heatmap_values(current_model):
+  table = current_model.active_count_table()
+  counts = table.counts[current_model.active_disk_column]
+  disk_index, mic_index = np.nonzero(counts)
+  x, yreal = plot_coordinates(current_model, table.disk_values[disk_index], table.mic_values[mic_index])
+  return x, yreal, counts[disk_index, mic_index]
+
+
+#Converts disk zones (or alternate-method MICs) and mics into heatmap coordinates.
+def plot_coordinates(current_model, disks, mics):
+  yreal = np.log(np.clip(np.asarray(mics), a_min=0.016, a_max = 256))
+  if current_model.mic_vs_mic:
+    x = np.log(np.clip(np.asarray(disks), a_min=0.016, a_max=256))
+  else:
+    x = np.clip(np.asarray(disks), a_min=5, a_max=50)
+  return x, yreal
+
+
+#The bin edges of the heatmap drawn by draw_heatmap (in plot coordinates), and the value shown
+#for each bin in the heatmap tooltips.
+def heatmap_bins(current_model):
+  mic_bins = [0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,256]
+  ybins = np.log(np.asarray(mic_bins))
+  if current_model.mic_vs_mic:
+    return ybins, ybins, mic_bins[:-1], mic_bins[:-1]
+  xbins = np.arange(5,50,1)
+  return xbins, ybins, [str(value) for value in xbins[:-1]], mic_bins[:-1]
 
 
+#Returns the cell_index (see cell_index.py) for the heatmap of current_model, building it only if
+#the data, the selected disk column or the bins have changed since it was last built, so it can be
+#called on every mouse movement. Returns None if the data can't be plotted.
+def heatmap_cell_index(current_model):
+  if current_model.current_dataset['mics'] is None:
+    return None
+  xbins, ybins, x_labels, y_labels = heatmap_bins(current_model)
+  index_key = (current_model.data_version, current_model.active_disk_column, current_model.mic_vs_mic)
+  if current_model.cell_index_key != index_key:
+    try:
+      x, yreal = plot_values(current_model)
+    except:
+      return None
+    current_model.cell_index = cell_index.cell_index(x, yreal, xbins, ybins, x_labels, y_labels)
+    current_model.cell_index_key = index_key
+  return current_model.cell_index
+
+
+#Builds the heatmap + error table figure for current_model in any matplotlib Figure. Nothing in here
+#depends on Qt, so the same figure can be drawn in the main window or rendered straight to an image
+#file on the Agg backend (see report_generator.py). Returns '0' or an error message.
+def draw_figure(figure, current_model, title=None):
+  error_code, x, yreal, weights = prepare_plot_data(current_model)
+  if error_code != '0':
+    return error_code
   #The .clf call here clears any existing figure, which prevents Matplotlib from stacking colorbars generated
   #when plotting a new dataset.
-  qtapp.central_plot.clf()
-  ax = qtapp.central_plot.add_subplot(121)
-  ax2 = qtapp.central_plot.add_subplot(122)
-  qtapp.central_plot.subplots_adjust(left=0.08, right=0.95, bottom=0.18)
+  figure.clf()
+  #If the user wants to see the score surface from the last fit, it goes between the heatmap and the table.
+  if (current_model.show_score_surface and current_model.model_engine.score_surface is not None and
+      not current_model.mic_vs_mic and not current_model.use_user_defined_disk_cutoffs):
+    ax = figure.add_subplot(131)
+    ax3 = figure.add_subplot(132)
+    ax2 = figure.add_subplot(133)
+    figure.subplots_adjust(left=0.06, right=0.97, bottom=0.18, wspace=0.45)
+    draw_score_surface(figure, ax3, current_model)
+  else:
+    ax = figure.add_subplot(121)
+    ax2 = figure.add_subplot(122)
+    figure.subplots_adjust(left=0.08, right=0.95, bottom=0.18)
   ax2.clear()
   ax.clear()
+  draw_heatmap(figure, ax, current_model, x, yreal, weights)
+  if title is not None:
+    ax.set_title(title)
+  elif current_model.subset_filter != '':
+    ax.set_title('Subset: %s'%current_model.subset_filter, fontsize=9)
+  draw_error_table(ax2, current_model)
+  return '0'
+
+
+#Draws several datasets side by side for comparison (see workspace.py): one column per dataset,
+#with its heatmap on top and its error table underneath. Each dataset is drawn with its own
+#breakpoints and cutoffs. titles holds the name shown above each heatmap. Returns '0' or an error
+#message naming the dataset that couldn't be drawn.
+def draw_comparison(figure, models, titles):
+  plot_data = []
+  for current_model, title in zip(models, titles):
+    error_code, x, yreal, weights = prepare_plot_data(current_model)
+    if error_code != '0':
+      return '%s: %s'%(title, error_code)
+    plot_data.append((x, yreal, weights))
+  figure.clf()
+  figure.subplots_adjust(left=0.06, right=0.97, top=0.92, bottom=0.04, wspace=0.35, hspace=0.25)
+  for i, (current_model, title) in enumerate(zip(models, titles)):
+    ax = figure.add_subplot(2, len(models), i + 1)
+    ax2 = figure.add_subplot(2, len(models), len(models) + i + 1)
+    draw_heatmap(figure, ax, current_model, *plot_data[i])
+    ax.set_title(title)
+    draw_error_table(ax2, current_model)
+  return '0'
+
+
+#Draws the score of every (cutoff_R, intermediate zone width) pair tried in the last fit as a heatmap,
+#with the pairs that tied for the best score marked with an x. A large area with about the same
+#score as the optimum means the data doesn't really pin down the cutoffs.
+def draw_score_surface(figure, ax, current_model):
+  engine = current_model.model_engine
+  extent = [engine.allowed_widths[0] - 0.5, engine.allowed_widths[-1] + 0.5,
+            engine.proposed_cutoffs_R[0] - 0.5, engine.proposed_cutoffs_R[-1] + 0.5]
+  im = ax.imshow(engine.score_surface, origin='lower', aspect='auto', extent=extent, cmap='viridis_r')
+  figure.colorbar(im, ax=ax, label='Score (lower is better)')
+  ax.plot([cutoff_S - cutoff_R for cutoff_R, cutoff_S in engine.tied_optima],
+          [cutoff_R for cutoff_R, cutoff_S in engine.tied_optima], 'rx')
+  ax.set_xticks(engine.allowed_widths)
+  ax.set_xlabel('Intermediate zone width (mm)')
+  ax.set_ylabel('Resistance disk cutoff (<=, mm)')
+
+
+#Draws the heatmap of the data with the MIC breakpoints and disk cutoffs marked on it into ax.
+#x and yreal are the (clipped and, for MICs, log-transformed) values to plot and weights how much
+#each of them counts.
+def draw_heatmap(figure, ax, current_model, x, yreal, weights):
+  #vertpoints will be used to fill in the vertical lines that mark cutoffs on the heatmap.
+  vertpoints1 = np.arange(0.0161,255,0.5)
   #Since MIC data is on y, y-axis is always a log scale. The values shown below are standard reporting values
   #for MICs so they are convenient to use as bins.
   ybins = np.asarray([0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,256])
@@ -83,7 +208,10 @@ def gen_plot(qtapp, data_type='disk'):
     horizpoints1 = np.log(np.asarray([0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,256]))
     #If using MIC data on x-axis, will need to round the cutoffs to the nearest common MIC reporting
     #value (will do the same thing when we export final results)
-    ax.set_xlabel('MIC, alternate method (mg/L)')
+    if len(current_model.disk_column_names) > 1:
+      ax.set_xlabel('MIC, alternate method (mg/L), %s'%current_model.disk_column_names[current_model.active_disk_column])
+    else:
+      ax.set_xlabel('MIC, alternate method (mg/L)')
     ax.set_xticks(xbins)
     ax.set_xticklabels([0.016,0.03,0.06,0.12,0.25,0.5,1,2,4,8,16,32,64,128,''], rotation=90)
     ax.xaxis.tick_top()
@@ -101,28 +229,34 @@ def gen_plot(qtapp, data_type='disk'):
     #If plotting MIC vs disk, the x-axis is much simpler -- no log scale required; disk values are in [5,50].
     xbins = np.arange(5,50,1)
     horizpoints1 = np.arange(5,50,1)
-    ax.set_xlabel('Disk zone (mm)')
+    if len(current_model.disk_column_names) > 1:
+      ax.set_xlabel('Disk zone (mm), %s'%current_model.disk_column_names[current_model.active_disk_column])
+    else:
+      ax.set_xlabel('Disk zone (mm)')
     ax.plot(np.full(vertpoints1.shape[0], current_model.xcutoffS), np.log(vertpoints1), color='k', linewidth=0.5)
     ax.plot(np.full(vertpoints1.shape[0], current_model.xcutoffR+1), np.log(vertpoints1), color='k', linewidth=0.5)
 
 
   #try:
   if current_model.colormap_type == 'christmas_colors':
-    im = ax.hist2d(x, yreal, bins=[xbins, ybins], cmap=create_christmas_colormap(), norm=colors.PowerNorm(gamma=0.5))
+    im = ax.hist2d(x, yreal, bins=[xbins, ybins], weights=weights, cmap=create_christmas_colormap(), norm=colors.PowerNorm(gamma=0.5))
   elif current_model.colormap_type == 'continuous_blue':
-    im = ax.hist2d(x, yreal, bins=[xbins, ybins], cmap='Blues',norm=colors.PowerNorm(gamma=0.5))
+    im = ax.hist2d(x, yreal, bins=[xbins, ybins], weights=weights, cmap='Blues',norm=colors.PowerNorm(gamma=0.5))
   elif current_model.colormap_type == 'continuous_green':
-    im = ax.hist2d(x, yreal, bins=[xbins, ybins], cmap='Greens',norm=colors.PowerNorm(gamma=0.5))
-  qtapp.central_plot.colorbar(im[3], ax=ax)
+    im = ax.hist2d(x, yreal, bins=[xbins, ybins], weights=weights, cmap='Greens',norm=colors.PowerNorm(gamma=0.5))
+  figure.colorbar(im[3], ax=ax)
   #We plot the MIC breakpoints and disk cutoffs as horizontal and vertical lines.
   ax.plot(horizpoints1, np.full(horizpoints1.shape[0], np.log(mic_cutoffS)), color='k', linewidth=0.5)
   ax.plot(horizpoints1, np.full(horizpoints1.shape[0], np.log(float(current_model.ycutoffR))), color='k', linewidth=0.5)
 
   #except:
   #    return "There was an unspecified error during plotting. The data plot & error count table have not been updated."
-  table = ax2.table(cellText = cell_text,cellLoc='center',
+
+
+#Draws the error count table into ax. The error tables must already be up to date.
+def draw_error_table(ax, current_model):
+  cell_text = generate_tabletext.generate_celltext(current_model)
+  table = ax.table(cellText = cell_text,cellLoc='center',
         loc='center', colWidths=[0.4, 0.17, 0.17, 0.17, 0.17, 0.17])
-  ax2.axis('off')
-  generate_tabletext.fix_table(table, current_model.mic_vs_mic)
-  qtapp.canvas.draw()
-  return '0'
+  ax.axis('off')
+  generate_tabletext.fix_table(table, current_model.mic_vs_mic, (len(cell_text) - 3) // (6 if current_model.mic_vs_mic else 4))
@@ -1,38 +1,37 @@
 import numpy as np
 
+#Counts are whole numbers unless the dataset has sample weights, in which case they are total
+#weights and are shown to two decimal places.
+def format_count(count):
+  if isinstance(count, float):
+    return str(round(count, 2))
+  return str(count)
+
 def generate_next_line(caption, range_value, error_dict):
   nextline = [caption, range_value]
-  nextline.append(str(error_dict['num_strains']))
+  nextline.append(format_count(error_dict['num_strains']))
   if error_dict['num_strains'] > 0:
-    nextline.append('%s (%s)'%(str(error_dict['very major errors']),
+    nextline.append('%s (%s)'%(format_count(error_dict['very major errors']),
                              str(round(100*error_dict['very major errors'] /
                                        error_dict['num_strains'], 2))))
-    nextline.append('%s (%s)'%(str(error_dict['major errors']),
+    nextline.append('%s (%s)'%(format_count(error_dict['major errors']),
                              str(round(100*error_dict['major errors'] /
                                        error_dict['num_strains'], 2))))
-    nextline.append('%s (%s)'%(str(error_dict['minor errors']),
+    nextline.append('%s (%s)'%(format_count(error_dict['minor errors']),
                              str(round(100*error_dict['minor errors'] /
                                        error_dict['num_strains'], 2))))
   else:
     nextline += ['0 (0)', '0 (0)', '0 (0)']
   return nextline
 
-#The plot shown to the user is divided into two panes: a heatmap and a table with error information.
-#The table celltext is in this function.
-def generate_celltext(current_model):
-  diskcutoffS = float(current_model.xcutoffS)
-  diskcutoffR = float(current_model.xcutoffR)
-  if current_model.mic_vs_mic == False:
-    celltext = [['Proposed Disk\nBreakpoint (mm)', 'Range',
-               'No.\nIsolates', '', 'No. of Errors', '']]
-  else:
-    celltext = [['MIC breakpoints (mg/L)', 'Range',
-               'No.\nIsolates', '', 'No. of Errors', '']]
-  celltext.append(['','','','Very\nmajor (%)', 'Major (%)', 'Minor (%)'])
-  celltext.append([current_model.strain_name, '', '', '', '', ''])
+#The text describing a pair of disk cutoffs (or, for MIC vs MIC data, alternate-method MIC breakpoints)
+#in the first column of the table.
+def generate_cutoff_text(current_model, diskcutoffR, diskcutoffS):
+  diskcutoffS = float(diskcutoffS)
+  diskcutoffR = float(diskcutoffR)
   if current_model.mic_vs_mic == False:
-    if current_model.xcutoffS > current_model.xcutoffR + 1:
-      int_range = [current_model.xcutoffR + 1, current_model.xcutoffS - 1]
+    if diskcutoffS > diskcutoffR + 1:
+      int_range = [diskcutoffR + 1, diskcutoffS - 1]
       disk_cutoff_text = '>=%s (S) / %s-%s (I) /\n<=%s (R)'%(str(diskcutoffS),
                                                         str(int_range[0]),
                                                         str(int_range[1]),
@@ -41,25 +40,55 @@ def generate_celltext(current_model):
       disk_cutoff_text = '>=%s (S) / <=%s (R)'%(str(diskcutoffS), str(diskcutoffR))
   else:
     xbins = [0.016,0.03,0.06,0.12,0.125,0.25,0.5,1,2,4,8,16,32,64,128,256]
-    if (xbins.index(current_model.xcutoffR) >
-        (xbins.index(current_model.xcutoffS) + 1)):
-      int_range = [xbins[xbins.index(current_model.xcutoffS) + 1],
-                   xbins[xbins.index(current_model.xcutoffR) - 1]]
+    if (xbins.index(diskcutoffR) >
+        (xbins.index(diskcutoffS) + 1)):
+      int_range = [xbins[xbins.index(diskcutoffS) + 1],
+                   xbins[xbins.index(diskcutoffR) - 1]]
       disk_cutoff_text = '<=%s (S) / %s-%s (I) /\n>=%s (R)'%(str(diskcutoffS),
                                                         str(int_range[0]),
                                                         str(int_range[1]),
                                                         str(diskcutoffR))
     else:
       disk_cutoff_text = '<=%s (S) / >=%s (R)'%(str(diskcutoffS), str(diskcutoffR))
-  celltext.append(generate_next_line(disk_cutoff_text, 'Total', current_model.error_counts))
-  celltext.append(generate_next_line('', '>=I+2', current_model.i_plus2_error))
-  celltext.append(generate_next_line('', 'I+1 to I-1', current_model.i_plus1_minus1_error))
-  celltext.append(generate_next_line('', '<=I-2', current_model.i_minus2_error))
+  return disk_cutoff_text
+
+#Returns the rows of the table for one set of cutoffs and the error tables that go with them.
+def generate_block(current_model, disk_cutoff_text, error_tables):
+  block = [generate_next_line(disk_cutoff_text, 'Total', error_tables['error_counts'])]
+  block.append(generate_next_line('', '>=I+2', error_tables['i_plus2_error']))
+  block.append(generate_next_line('', 'I+1 to I-1', error_tables['i_plus1_minus1_error']))
+  block.append(generate_next_line('', '<=I-2', error_tables['i_minus2_error']))
   if current_model.mic_vs_mic == True:
-    celltext.append(['Essential agreement (%)', str(round(current_model.essential_agreement,2)),
-                     '', '', '', ''])
-    celltext.append(['Categorical agreement (%)', str(round(current_model.categorical_agreement,2)),
-                     '', '', '', ''])
+    block.append(['Essential agreement (%)', str(round(error_tables['essential_agreement'],2)),
+                  '', '', '', ''])
+    block.append(['Categorical agreement (%)', str(round(error_tables['categorical_agreement'],2)),
+                  '', '', '', ''])
+  return block
+
+#The plot shown to the user is divided into two panes: a heatmap and a table with error information.
+#The table celltext is in this function. If the dataset has more than one disk column, there is one
+#block of rows for each, labeled with the column name.
+def generate_celltext(current_model):
+  if current_model.mic_vs_mic == False:
+    celltext = [['Proposed Disk\nBreakpoint (mm)', 'Range',
+               'No.\nIsolates', '', 'No. of Errors', '']]
+  else:
+    celltext = [['MIC breakpoints (mg/L)', 'Range',
+               'No.\nIsolates', '', 'No. of Errors', '']]
+  celltext.append(['','','','Very\nmajor (%)', 'Major (%)', 'Minor (%)'])
+  celltext.append([current_model.strain_name, '', '', '', '', ''])
+  if len(current_model.disk_column_names) > 1 and len(current_model.disk_column_errors) == len(current_model.disk_column_names):
+    for name, (xcutoffR, xcutoffS), error_tables in zip(current_model.disk_column_names, current_model.disk_column_cutoffs,
+                                                        current_model.disk_column_errors):
+      celltext += generate_block(current_model, '%s: %s'%(name, generate_cutoff_text(current_model, xcutoffR, xcutoffS)),
+                                 error_tables)
+  else:
+    error_tables = {'error_counts':current_model.error_counts, 'i_plus2_error':current_model.i_plus2_error,
+                    'i_plus1_minus1_error':current_model.i_plus1_minus1_error, 'i_minus2_error':current_model.i_minus2_error,
+                    'essential_agreement':current_model.essential_agreement,
+                    'categorical_agreement':current_model.categorical_agreement}
+    celltext += generate_block(current_model, generate_cutoff_text(current_model, current_model.xcutoffR,
+                                                                   current_model.xcutoffS), error_tables)
   return celltext
   
 def mergecells(table, ix0, ix1):
@@ -84,28 +113,25 @@ def mergecells(table, ix0, ix1):
                 table[ix[0], ix[1]].visible_edges = e
 
 
-def fix_table(table, is_mic_vs_mic=False):
+#Formats the table generated from generate_celltext: the header rows are bold and the lines between
+#the rows of each block of error counts are hidden. num_blocks is the number of blocks of rows (one per
+#disk column).
+def fix_table(table, is_mic_vs_mic=False, num_blocks=1):
+  block_length = 6 if is_mic_vs_mic else 4
+  last_row = 2 + num_blocks * block_length
   for i in range(0,6):
     table[(0,i)].set_height(0.12)
     table[(0,i)]._text.set_fontweight('bold')
     table[(1,i)].set_height(0.12)
-    table[(3,i)].set_height(0.1)
-    mergecells(table, (3,i), (2,i))
-    mergecells(table, (4,i), (3,i))
-    mergecells(table, (5,i), (4,i))
-    mergecells(table, (6,i), (5,i))
-    if is_mic_vs_mic:
-      mergecells(table, (7,i), (6,i))
-      mergecells(table, (8,i), (7,i))
+    for block in range(0, num_blocks):
+      table[(3 + block*block_length,i)].set_height(0.1)
+    for row in range(3, last_row + 1):
+      #Leave the line between one block and the next.
+      if row == 3 or (row - 3) % block_length != 0:
+        mergecells(table, (row,i), (row-1,i))
     if i > 0:
-      mergecells(table, (2,i-1), (2,i))
-      mergecells(table, (3,i-1), (3,i))
-      mergecells(table, (4,i-1), (4,i))
-      mergecells(table, (5,i-1), (5,i))
-      mergecells(table, (6,i-1), (6,i))
-      if is_mic_vs_mic:
-        mergecells(table, (7,i-1), (7,i))
-        mergecells(table, (8,i-1), (8,i))
+      for row in range(2, last_row + 1):
+        mergecells(table, (row,i-1), (row,i))
   mergecells(table, (1,0), (0,0))
   mergecells(table, (0, 3), (0,4))
   mergecells(table, (0, 4), (0,5))
@@ -114,5 +140,6 @@ def fix_table(table, is_mic_vs_mic=False):
   table.auto_set_font_size(False)
   table.set_fontsize(7)
   table[(2,0)]._loc = 'left'
-  table[(3,0)]._loc = 'left'
+  for block in range(0, num_blocks):
+    table[(3 + block*block_length,0)]._loc = 'left'
   table[(2,0)]._text.set_fontstyle('italic')
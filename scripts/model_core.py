@@ -1,21 +1,65 @@
 import numpy as np
 
-#The "core" or "engine" of a model_parameter_set object, the mgm object contains the functions for fitting user data. It stores only two attributes: the optimal
-#disk cutoffs that resulted from the fit.
-class mgm():
+#The "core" or "engine" of a model_parameter_set object. An engine contains the functions for fitting user data
+#and stores only two attributes: the optimal disk cutoffs that resulted from the fit.
+#All of the engines fit the data the same way -- by trying every allowed pair of disk cutoffs and picking
+#the pair that gives the purest split of the data into S, I and R populations -- and differ only in how
+#they measure impurity. So every engine is an impurity_model: the counting is done once, by the shared kernel
+#candidate_class_counts below, and each engine is given the impurity function that is evaluated on those
+#counts. To add a new engine, write its impurity function and add it to model_engines and engine_names.
 
-  def __init__(self):
+
+#The counting kernel shared by all of the engines. Given the number of isolates of each category
+#(last axis, categories 0, 1, 2) at each of the sorted disk values (second-to-last axis), returns the number
+#of isolates of each category that would be assigned to the R (disk <= cutoff_R), I (cutoff_R < disk <
+#cutoff_S) and S (disk >= cutoff_S) populations for every pair of proposed cutoffs. The proposed cutoffs can
+#be arrays of any shape, e.g. a grid of every cutoff_R and width, and the counts have that shape plus a last
+#axis for the categories. Using cumulative sums over the disk values, this costs the same however many
+#candidates there are. class_counts may also have leading axes (e.g. one per disk column or per simulated
+#dataset), in which case the proposed cutoffs must have the same leading axes (or be broadcastable to them),
+#so that each count table can be scored against its own candidates.
+def candidate_class_counts(disk_values, class_counts, proposed_cutoffs_R, proposed_cutoffs_S):
+  batch_shape = class_counts.shape[:-2]
+  candidate_shape = np.broadcast_shapes(np.shape(proposed_cutoffs_R), np.shape(proposed_cutoffs_S))[len(batch_shape):]
+  cumulative_counts = np.cumsum(class_counts, axis=-2).reshape((-1,) + class_counts.shape[-2:])
+  cumulative_counts = np.concatenate([np.zeros_like(cumulative_counts[:,:1,:]), cumulative_counts], axis=1)
+
+  def gather(disk_index):
+    disk_index = np.broadcast_to(disk_index, batch_shape + candidate_shape)
+    disk_index = disk_index.reshape((cumulative_counts.shape[0], -1, 1))
+    return np.take_along_axis(cumulative_counts, disk_index, axis=1).reshape(batch_shape + candidate_shape + (3,))
+
+  num_at_or_below_R = gather(np.searchsorted(disk_values, proposed_cutoffs_R, side='right'))
+  num_below_S = gather(np.searchsorted(disk_values, proposed_cutoffs_S, side='left'))
+  total_counts = cumulative_counts[:,-1,:].reshape(batch_shape + (1,)*len(candidate_shape) + (3,))
+  r_counts = num_at_or_below_R
+  i_counts = num_below_S - num_at_or_below_R
+  s_counts = total_counts - num_below_S
+  return r_counts, i_counts, s_counts
+
+
+class impurity_model():
+
+  allowed_widths = np.asarray([1.0, 2.0, 3.0, 4.0])
+
+  #impurity is the function that calculates the impurity of each population given the number of
+  #isolates in each category (last axis), e.g. gini_impurity.
+  def __init__(self, impurity):
+    self.impurity = impurity
     self.cutoff_R = 0
     self.cutoff_S = 0
+    #The score of every (cutoff_R, width) pair tried in the last fit (rows are the proposed cutoff_R
+    #values, columns the allowed widths), and every pair of (cutoff_R, cutoff_S) that gave the best score.
+    #These let the user see how flat the optimum is without refitting.
+    self.clear_score_surface()
 
-  #Calculate gini impurity for an input population.
-  def gini(self, population):
-    prob_2 = (np.argwhere(population==2).shape[0] / population.shape[0])**2
-    prob_1 = (np.argwhere(population==1).shape[0] / population.shape[0])**2
-    prob_0 = (np.argwhere(population==0).shape[0] / population.shape[0])**2
-    return (1 - prob_2 - prob_1 - prob_0)
+  #Forgets the score surface of the last fit, e.g. when the cutoffs are no longer the ones it found.
+  def clear_score_surface(self):
+    self.proposed_cutoffs_R = None
+    self.score_surface = None
+    self.tied_optima = []
 
-  #Fit the data by calculating gini impurity for all possible splits that
+  #Fit the data by calculating the impurity for all possible splits that
   #meet the criteria (zone width must be an integer value in [1.0 : 4.0] and
   #only integer value disk cutoffs are allowed). Because of these constraints,
   #and because there are only a limited number of possible disk cutoffs
@@ -24,44 +68,114 @@ class mgm():
   #windows (disk_cuttof_S - disk_cutoff_R) would give an equally optimal result.
   #In order to give them that information we have to try all the possibilities...
   #which works because there aren't too many.
-  def fit_disk_data(self, input_x, input_y):
-    allowed_widths = [1.0, 2.0, 3.0, 4.0]
-    best_score_so_far = np.ones((4))
-    best_cutoffs_so_far = np.zeros((4,2))
-    for i, width in enumerate(allowed_widths):
-      proposed_cutoff_R = np.min(input_x)
-      proposed_cutoff_S = proposed_cutoff_R + width
-      while (proposed_cutoff_R) <= np.max(input_x):
-        current_score = self.score_disk_fit(input_x, input_y, proposed_cutoff_S,
-                                       proposed_cutoff_R)
-        if current_score <= best_score_so_far[i]:
-          best_score_so_far[i] = current_score
-          best_cutoffs_so_far[i,0] = proposed_cutoff_R
-          best_cutoffs_so_far[i,1] = proposed_cutoff_S
-        proposed_cutoff_R += 1
-        proposed_cutoff_S += 1
-    single_best_score = np.min(best_score_so_far)
-    best_result_index = np.argmin(best_score_so_far)
-    self.cutoff_R = best_cutoffs_so_far[best_result_index,0]
-    self.cutoff_S = best_cutoffs_so_far[best_result_index,1]
-    if np.argwhere(best_score_so_far == single_best_score).shape[0] > 1:
-      return [str(allowed_widths[i]) for i in range(0,4) if 
-              best_score_so_far[i] == single_best_score]
+  #Takes the number (or, for weighted data, the total weight) of isolates of each category (columns
+  #0, 1, 2) at each disk value, as returned by count_table.class_counts, rather than the isolates
+  #themselves, so the cost of a fit depends only on the number of distinct disk values. This is what
+  #lets us refit a growing dataset from its count table (see count_tables.py) without going back to
+  #the raw data.
+  #Of the tied optima, the one with the smallest width is used, and if several cutoffs are equally
+  #good for that width, the largest cutoff_R. Returns the widths that can give the best score if
+  #there is more than one, as the end user asked to be told about those.
+  def fit_disk_counts(self, disk_values, class_counts):
+    return self.select_fit(self.fit_disk_counts_batch(disk_values, class_counts), ())
+
+  #Fits any number of count tables at once: class_counts has shape (..., number of disk values, 3) and
+  #every leading index is fit separately. For each one, the proposed cutoff_R runs from its smallest to
+  #its largest observed disk value in steps of 1, and the whole score surface (every cutoff_R and width)
+  #is calculated in one go. Proposed cutoffs past the end of a table's range (which only exist because
+  #another table has a wider range) get a score of infinity. Returns a dictionary of arrays with the same
+  #leading axes as class_counts; use select_fit to pick out the results for one of them.
+  def fit_disk_counts_batch(self, disk_values, class_counts):
+    #A count table's disk axis can include values that none of the isolates counted in it
+    #have (see count_table.empty_copy), and disk values with no isolates should not affect
+    #the range of cutoffs we consider.
+    observed = class_counts.sum(axis=-1) > 0
+    min_disk = np.min(np.where(observed, disk_values, np.inf), axis=-1)
+    max_disk = np.max(np.where(observed, disk_values, -np.inf), axis=-1)
+    with np.errstate(invalid='ignore'):
+      num_candidates = np.where(max_disk >= min_disk, np.floor(max_disk - min_disk) + 1, 0).astype(np.int64)
+    proposed_cutoffs_R = (np.where(num_candidates > 0, min_disk, 0)[...,None] +
+                          np.arange(np.max(num_candidates, initial=0)))
+    valid = np.arange(proposed_cutoffs_R.shape[-1]) < num_candidates[...,None]
+    score_surface = self.score_candidates(disk_values, class_counts, proposed_cutoffs_R[...,None],
+                                          proposed_cutoffs_R[...,None] + self.allowed_widths)
+    score_surface = np.where(valid[...,None], score_surface, np.inf)
+    best_score = np.min(score_surface, axis=(-2,-1), initial=np.inf)
+    #Scores that should be equal can differ in the last few bits depending on how they were calculated
+    #(e.g. the misclassification rate of two splits that misclassify the same number of isolates, or any
+    #score of weighted counts, which depends on the order they were summed in), so they are compared
+    #with a small tolerance.
+    tied = np.isclose(score_surface, best_score[...,None,None], rtol=1e-9, atol=1e-12)
+    best_width_index = np.argmax(tied.any(axis=-2), axis=-1)
+    tied_at_best_width = np.take_along_axis(tied, best_width_index[...,None,None], axis=-1)[...,0]
+    best_R_index = proposed_cutoffs_R.shape[-1] - 1 - np.argmax(tied_at_best_width[...,::-1], axis=-1)
+    cutoffs_R = np.take_along_axis(proposed_cutoffs_R, best_R_index[...,None], axis=-1)[...,0]
+    return {'cutoffs_R':cutoffs_R, 'cutoffs_S':cutoffs_R + self.allowed_widths[best_width_index],
+            'proposed_cutoffs_R':proposed_cutoffs_R, 'num_candidates':num_candidates,
+            'score_surface':score_surface, 'best_score':best_score, 'tied':tied}
+
+  #Sets the cutoffs, score surface and tied optima of this engine to those of one of the count tables
+  #fit by fit_disk_counts_batch (index is its position along the leading axes, () if there were none),
+  #and returns the tied widths as for fit_disk_counts.
+  def select_fit(self, fit, index):
+    num_candidates = fit['num_candidates'][index]
+    self.cutoff_R = fit['cutoffs_R'][index]
+    self.cutoff_S = fit['cutoffs_S'][index]
+    self.proposed_cutoffs_R = fit['proposed_cutoffs_R'][index][:num_candidates]
+    self.score_surface = fit['score_surface'][index][:num_candidates]
+    tied_indices = np.argwhere(fit['tied'][index][:num_candidates])
+    self.tied_optima = [(float(self.proposed_cutoffs_R[i]), float(self.proposed_cutoffs_R[i] + self.allowed_widths[j]))
+                        for i, j in tied_indices]
+    tied_widths = np.unique(tied_indices[:,1])
+    if tied_widths.shape[0] > 1:
+      return [str(self.allowed_widths[j]) for j in tied_widths]
     else:
       return []
-    
-        
-  #Score a proposed fit by calculating gini impurity for all of the populations
-  #resulting from the proposed cutoffs and weighting them based on fraction
-  #of the pre-split population size.
-  def score_disk_fit(self, input_x, input_y, proposed_cutoff_S,
-                proposed_cutoff_R):
-    category_indices = [np.argwhere(input_x>=proposed_cutoff_S).flatten()]
-    category_indices.append(np.argwhere(input_x<=proposed_cutoff_R).flatten())
-    category_indices.append(np.asarray([i for i in range(0, input_x.shape[0]) if input_x[i] <
-                             proposed_cutoff_S and input_x[i] > proposed_cutoff_R]))
+
+  #Score every pair of proposed cutoffs at once by calculating the impurity of each of the populations
+  #resulting from the proposed cutoffs and weighting them based on fraction of the pre-split population
+  #size. Empty populations don't contribute to the score.
+  def score_candidates(self, disk_values, class_counts, proposed_cutoffs_R, proposed_cutoffs_S):
+    r_counts, i_counts, s_counts = candidate_class_counts(disk_values, class_counts, proposed_cutoffs_R,
+                                                          proposed_cutoffs_S)
+    total_strains = (r_counts + i_counts + s_counts).sum(axis=-1)
     base_score = 0
-    for category_index in category_indices:
-      if category_index.shape[0] > 0:
-        base_score += (category_index.shape[0] / input_x.shape[0]) * self.gini(input_y[category_index])
+    with np.errstate(divide='ignore', invalid='ignore'):
+      for category_counts in [s_counts, r_counts, i_counts]:
+        population_size = category_counts.sum(axis=-1)
+        base_score += np.where(population_size > 0,
+                               (population_size / total_strains) * self.impurity(category_counts), 0)
     return base_score
+
+
+#Minimum gini impurity model.
+def gini_impurity(class_counts):
+  population_size = class_counts.sum(axis=-1)
+  prob_2 = (class_counts[...,2] / population_size)**2
+  prob_1 = (class_counts[...,1] / population_size)**2
+  prob_0 = (class_counts[...,0] / population_size)**2
+  return (1 - prob_2 - prob_1 - prob_0)
+
+
+#Minimum entropy model (entropy in bits; 0 * log(0) is taken to be 0).
+def entropy_impurity(class_counts):
+  probs = class_counts / class_counts.sum(axis=-1)[...,None]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return -np.sum(np.where(probs > 0, probs * np.log2(probs), 0), axis=-1)
+
+
+#Minimum misclassification rate model. The impurity of a population is the fraction of it that
+#doesn't belong to its most common category.
+def misclassification_impurity(class_counts):
+  return 1 - class_counts.max(axis=-1) / class_counts.sum(axis=-1)
+
+
+#The impurity function of each of the available engines, keyed by the model_type stored in
+#model_parameter_set (see new_engine), and the name shown for each in the user interface.
+model_engines = {'mgm':gini_impurity, 'mem':entropy_impurity, 'mmm':misclassification_impurity}
+engine_names = {'min gini impurity':'mgm', 'min entropy':'mem', 'min misclassification rate':'mmm'}
+
+
+#A new engine for the given model_type (one of the keys of model_engines).
+def new_engine(model_type):
+  return impurity_model(model_engines[model_type])
@@ -1,11 +1,14 @@
-import model_core
+import numpy as np, os
+import model_core, count_tables, subsets
+
+WEIGHT_COLUMN_NAMES = ['weight', 'weights', 'sample weight', 'sample_weight']
 
 #Class model_parameter_set is the object that stores all associated model parameters.
 #Each instance of disk_fitter has an object of class model_parameter_set stored
 #as its "current model", and any time fitting occurs, it updates the object
 #attributes, all of which are listed below.
-#The model_parameter_set object in turn contains an object of class mgm (described
-#in model_core.py) as one of ITS attributes, and this mgm object and its
+#The model_parameter_set object in turn contains an object of class impurity_model (described
+#in model_core.py) as one of ITS attributes, and this engine object and its
 #routines will do the actual fitting.
 #The reason for this design is so that if we ever add other fitting algorithms, we can
 #trade out different "model_engines" to handle each type of fitting algorithm.
@@ -13,7 +16,27 @@ import model_core
 class model_parameter_set():
 
   def __init__(self):
-    self.current_dataset = {'mics':None, 'disks':None}
+    #current_dataset['disk_columns'] holds one column of disk zones per disk potency tested (most datasets
+    #only have one), and current_dataset['disks'] is the column currently selected for plotting and manual
+    #cutoffs, so code that only deals with one disk column at a time doesn't need to know about the others.
+    self.current_dataset = {'mics':None, 'disks':None, 'disk_columns':None, 'dates':None}
+    #Which column of the imported csv holds which kind of data (see parse_header).
+    self.column_layout = ['mics', 'disk_columns']
+    self.disk_column_names = ['Disk']
+    self.active_disk_column = 0
+    #Any other information about the isolates (e.g. body site, region, testing lab) is stored in
+    #current_dataset['metadata'], with one column of integer codes per metadata column of the csv file;
+    #metadata_categories[j][code] is the value each code in column j stands for. The user can refit on a
+    #subset of the isolates selected with a filter on these (see subsets.py and set_subset_filter).
+    self.metadata_names = []
+    self.metadata_categories = []
+    self.subset_filter = ''
+    #Which isolates pass the filter (None if there is no filter) and their count table.
+    self.subset_mask = None
+    self.subset_table = None
+    #The bitmap index used to evaluate filters, and the data version it was built for.
+    self.metadata_index = None
+    self.metadata_index_key = None
     self.model_type = 'mgm'
     #These cutoffs are either specified by the user (if they so indicate by checking the appropriate boxes)
     #OR determined by model fitting, which is done by the model_engine object below.
@@ -21,7 +44,7 @@ class model_parameter_set():
     self.ycutoffR = 16.0
     self.xcutoffS = 32.0
     self.xcutoffR = 12.0
-    self.model_engine = model_core.mgm()
+    self.model_engine = model_core.new_engine(self.model_type)
     self.strain_name = 'Acinteobacter baumannii'
     #If this is checked, use the user's defined cutoffs.
     self.use_user_defined_disk_cutoffs = False
@@ -43,6 +66,20 @@ class model_parameter_set():
     self.i_minus2_error = {'num_strains':0,'very major errors':0,
                            'major errors':0, 'minor errors':0}
 
+    #The [xcutoffR, xcutoffS] and error tables (as returned by count_table.tabulate_errors) for every disk
+    #column. The ones for the selected column are also stored in the attributes above.
+    self.disk_column_cutoffs = [[self.xcutoffR, self.xcutoffS]]
+    self.disk_column_errors = []
+    #Incremented whenever isolates are added, so that cached results (see update_error_tables
+    #and workspace.py) can tell whether the data has changed since they were calculated.
+    self.data_version = 0
+    #The breakpoints, cutoffs, data version and subset the error tables were last calculated for.
+    self.error_table_key = None
+    #The index of the isolates in each cell of the heatmap, and the data version, disk column and
+    #plot type it was built for (see disk_plotting.heatmap_cell_index).
+    self.cell_index = None
+    self.cell_index_key = None
+
     #Microbiologists define essential and categorical agreement for MIC vs MIC data only, so
     #IF we are dealing with MIC vs MIC data, we'll update these object attributes.
     self.essential_agreement = 0
@@ -50,35 +87,332 @@ class model_parameter_set():
 
     #color scheme for the plot.
     self.colormap_type = 'christmas_colors'
+    #If this is checked, the plot also shows the score of every pair of cutoffs tried in the last fit.
+    self.show_score_surface = False
+
+    #The number of isolates at each (disk, mic) combination in current_dataset. The fit and the
+    #error tables are calculated from this count table rather than from the raw data, so that
+    #when new isolates are appended we only need to count the new rows (see count_tables.py).
+    self.count_table = count_tables.count_table()
+    #The arrays the columns of current_dataset (and subset_mask) are views of, with room at the end
+    #for isolates that are appended later (see extend_array).
+    self.dataset_buffers = {}
+    #The file the current dataset was loaded from and how many bytes of it we have read so far,
+    #so that if the user is watching the file, we can read just the rows that have been added.
+    self.source_filename = None
+    self.source_offset = 0
+
+  #Swaps in the model_engine for a different fitting algorithm (one of the keys of
+  #model_core.model_engines).
+  def set_model_type(self, model_type):
+    self.model_type = model_type
+    self.model_engine = model_core.new_engine(model_type)
 
   #loads the user's specified csv file and does some basic error handling.
   #I didn't use Pandas because when freezing a python app to an exe, pandas
   #just adds a chunk to the memory footprint, and we don't really need to do
   #anything fancy that might require pandas here.
+  #The first column holds the mics and each of the others a set of disk zones (usually there is
+  #only one, but there may be one per disk potency). The file may optionally start with a header row,
+  #which is needed if it contains anything else (see parse_header below).
   def load_dataset(self, filename):
-    error = False
-    self.current_dataset = {'mics':[], 'disks':[]}
-    with open(filename) as input_filehandle:
-      for line in input_filehandle:
-        try:
-          current_values = line.strip().split(',')
-          self.current_dataset['mics'].append(float(current_values[0]))
-          self.current_dataset['disks'].append(float(current_values[1]))
-        except:
-          error = True
-        if len(current_values) > 2:
-          error = True
-    if error == True or len(self.current_dataset['mics']) != len(self.current_dataset['disks']):
+    with open(filename, 'rb') as input_filehandle:
+      file_contents = input_filehandle.read()
+    try:
+      lines = file_contents.decode().splitlines()
+      column_layout, column_names, lines = self.read_column_layout(lines)
+      new_data, error = self.parse_dataset_lines(lines, column_layout)
+    except:
+      error = True
+    if error == True:
       #Make sure if there was an error loading the file to zero out self.current_dataset. That way,
       #other modules will be able to determine that no data has been loaded and do error handling
       #accordingly.
-      self.current_dataset = {'mics':None, 'disks':None}
+      self.current_dataset = {'mics':None, 'disks':None, 'disk_columns':None, 'dates':None}
+      self.count_table = count_tables.count_table()
+      self.source_filename = None
+      self.clear_subset_filter()
       return ('There was an error opening the selected file! Clearly you have made a mistake. '
           'One reason why this may have occurred '
-          'is if you selected a non-csv file or a file with more than two columns. '
+          'is if you selected a non-csv file or a file with non-numeric values or missing columns '
+          '(a collection date column or metadata columns are allowed only if the file has a header row). '
           'Remember your instructions!')
-    else:
+    disk_column_names = [name for name, column in zip(column_names, column_layout) if column == 'disk_columns']
+    self.column_layout = column_layout
+    self.disk_column_names = disk_column_names
+    self.active_disk_column = 0
+    self.disk_column_cutoffs = [[self.xcutoffR, self.xcutoffS] for name in disk_column_names]
+    self.disk_column_errors = []
+    self.metadata_names = [name for name, column in zip(column_names, column_layout) if column == 'metadata']
+    self.metadata_categories = [[] for name in self.metadata_names]
+    self.clear_subset_filter()
+    self.current_dataset = {'mics':np.zeros((0)), 'disks':None,
+                            'disk_columns':np.zeros((0, len(disk_column_names))), 'dates':None}
+    if 'dates' in column_layout:
+      self.current_dataset['dates'] = np.zeros((0), dtype='datetime64[D]')
+    if 'metadata' in column_layout:
+      self.current_dataset['metadata'] = np.zeros((0, len(self.metadata_names)), dtype=np.int32)
+    #If the csv file has a weight column (see parse_header), current_dataset['weights'] holds the weight
+    #of each isolate and the count tables hold the total weight in each cell rather than the number of
+    #isolates, so the fit, error tables and plots all count each isolate as much as its weight.
+    if 'weights' in column_layout:
+      self.current_dataset['weights'] = np.zeros((0))
+    self.count_table = count_tables.count_table(len(disk_column_names), 'weights' in column_layout)
+    self.dataset_buffers = {}
+    self.append_rows(new_data)
+    #Start over with a fresh model_engine so results from fitting the previous dataset don't hang around.
+    self.set_model_type(self.model_type)
+    self.source_filename = filename
+    self.source_offset = len(file_contents)
+    return '0'
+
+  #If the first line of the file is a header row (i.e. none of its values are numbers), work
+  #out the column layout and column names from it and strip it off; otherwise every column
+  #but the first holds disk zones. Raises a ValueError if the header is not one we understand.
+  def read_column_layout(self, lines):
+    if len(lines) == 0:
+      return ['mics', 'disk_columns'], ['MIC', 'Disk'], lines
+    for value in lines[0].split(','):
+      try:
+        float(value)
+        num_disk_columns = len(lines[0].split(',')) - 1
+        if num_disk_columns == 1:
+          return ['mics', 'disk_columns'], ['MIC', 'Disk'], lines
+        return (['mics'] + ['disk_columns']*num_disk_columns,
+                ['MIC'] + ['Disk %s'%(i+1) for i in range(0, num_disk_columns)], lines)
+      except:
+        pass
+    column_layout, column_names = self.parse_header(lines[0])
+    if column_layout is None:
+      raise ValueError('Unrecognized header row')
+    #Any column we took for a disk column but whose values aren't numbers holds metadata.
+    if len(lines) > 1:
+      first_row = lines[1].strip().split(',')
+      for i in range(0, min(len(first_row), len(column_layout))):
+        if column_layout[i] == 'disk_columns':
+          try:
+            float(first_row[i])
+          except:
+            column_layout[i] = 'metadata'
+    if 'disk_columns' not in column_layout:
+      raise ValueError('No disk column')
+    return column_layout, column_names, lines[1:]
+
+  #Determines what each column contains from its name in the header row. A column named 'date',
+  #'collection date' or 'collection_date' holds the date each isolate was collected (YYYY-MM-DD, or
+  #just YYYY-MM or YYYY), which is used for the time window analysis. A column named 'weight', 'weights'
+  #or 'sample weight' holds the weight of each isolate (any number >= 0). A column whose name starts
+  #with 'meta:' holds metadata (e.g. 'meta:year'; the prefix is only needed if the values are numbers,
+  #see read_column_layout). Of the other columns, the first holds the mics and the rest the disk zones,
+  #as for a file with no header, and the names of the disk columns (e.g. '10 ug', '30 ug') are used to
+  #label them in the plot and error table. Returns the layout and the name of each column.
+  def parse_header(self, header_line):
+    column_layout, column_names = [], []
+    for column_name in header_line.strip().split(','):
+      column_name = column_name.strip()
+      if column_name.lower() in ['date', 'collection date', 'collection_date']:
+        column_layout.append('dates')
+      elif column_name.lower() in WEIGHT_COLUMN_NAMES:
+        column_layout.append('weights')
+      elif column_name.lower().startswith('meta:'):
+        column_layout.append('metadata')
+        column_name = column_name[5:].strip()
+      elif 'mics' not in column_layout:
+        column_layout.append('mics')
+      else:
+        column_layout.append('disk_columns')
+      column_names.append(column_name)
+    if (column_layout.count('disk_columns') == 0 or column_layout.count('dates') > 1 or
+        column_layout.count('weights') > 1):
+      return None, None
+    return column_layout, column_names
+
+  #Converts lines of csv text into lists of values for each of the columns in column_layout (for the
+  #disk columns, a list with one row of disk zones per line). Any line that does not contain one valid
+  #value per column is an error.
+  def parse_dataset_lines(self, lines, column_layout=['mics', 'disk_columns']):
+    error = False
+    new_data = {column:[] for column in column_layout}
+    for line in lines:
+      current_values = line.strip().split(',')
+      if len(current_values) != len(column_layout):
+        error = True
+        continue
+      try:
+        disk_row, metadata_row = [], []
+        for column, value in zip(column_layout, current_values):
+          if column == 'dates':
+            new_data[column].append(self.parse_date(value))
+          elif column == 'disk_columns':
+            disk_row.append(float(value))
+          elif column == 'metadata':
+            metadata_row.append(value.strip())
+          elif column == 'weights':
+            weight = float(value)
+            if not np.isfinite(weight) or weight < 0:
+              raise ValueError('Invalid weight')
+            new_data[column].append(weight)
+          else:
+            new_data[column].append(float(value))
+        new_data['disk_columns'].append(disk_row)
+        if 'metadata' in new_data:
+          new_data['metadata'].append(metadata_row)
+      except:
+        error = True
+    return new_data, error
+
+  def parse_date(self, value):
+    date = np.datetime64(value.strip(), 'D')
+    if np.isnat(date):
+      raise ValueError('Missing date')
+    return date
+
+  #Folds a batch of new isolates (a dictionary with one list of values for each column of the
+  #current dataset) into the current dataset. Only the new rows are counted, and they are written
+  #into the spare room at the end of each column (see extend_array), so the time this takes
+  #depends on the size of the batch, not on how much data has already been loaded.
+  def append_rows(self, new_data):
+    new_data = dict(new_data)
+    new_data['disk_columns'] = np.asarray(new_data['disk_columns'],
+                                          dtype=np.float64).reshape((-1, len(self.disk_column_names)))
+    if 'metadata' in new_data:
+      new_data['metadata'] = self.encode_metadata(new_data['metadata'])
+    num_old_rows = self.current_dataset['mics'].shape[0]
+    for column in new_data:
+      self.dataset_buffers[column], self.current_dataset[column] = extend_array(
+        self.dataset_buffers.get(column), self.current_dataset[column],
+        np.asarray(new_data[column], dtype=self.current_dataset[column].dtype))
+    self.current_dataset['disks'] = self.current_dataset['disk_columns'][:,self.active_disk_column]
+    self.count_table.add_rows(new_data['mics'], new_data['disk_columns'], new_data.get('weights'))
+    self.data_version += 1
+    #If the user is looking at a subset, the new isolates that pass the filter go in it too.
+    if self.subset_mask is not None:
+      new_rows = np.arange(num_old_rows, self.current_dataset['mics'].shape[0])
+      new_mask = subsets.evaluate_filter(self, self.subset_filter, new_rows)
+      self.dataset_buffers['subset_mask'], self.subset_mask = extend_array(self.dataset_buffers.get('subset_mask'),
+                                                                           self.subset_mask, new_mask)
+      self.subset_table.extend_axes(new_data['mics'], new_data['disk_columns'])
+      self.subset_table.add_cells(self.subset_table.cell_indices(np.asarray(new_data['mics'])[new_mask],
+                                                                 new_data['disk_columns'][new_mask]),
+                                  self.isolate_weights(new_rows[new_mask]))
+
+  #Converts rows of metadata values (strings) into the integer codes stored in
+  #current_dataset['metadata'], adding any values we haven't seen before to metadata_categories.
+  def encode_metadata(self, metadata_rows):
+    metadata_rows = np.asarray(metadata_rows, dtype=str).reshape((-1, len(self.metadata_names)))
+    codes = np.zeros(metadata_rows.shape, dtype=np.int32)
+    for j, categories in enumerate(self.metadata_categories):
+      values, value_index = np.unique(metadata_rows[:,j], return_inverse=True)
+      category_codes = {category:code for code, category in enumerate(categories)}
+      for value in values:
+        if value not in category_codes:
+          category_codes[value] = len(categories)
+          categories.append(str(value))
+      codes[:,j] = np.asarray([category_codes[value] for value in values], dtype=np.int32)[value_index.flatten()]
+    return codes
+
+  #Restricts the fit, error tables and plot to the isolates selected by filter_expression (see
+  #subsets.py for the syntax), or to all of them if it is blank. Only the count table of the subset
+  #is built; the dataset itself is not copied. Returns '0' or an error message, in which case the
+  #previous filter is kept.
+  def set_subset_filter(self, filter_expression):
+    if filter_expression.strip() == '':
+      self.clear_subset_filter()
+      return '0'
+    if self.current_dataset['mics'] is None:
+      return "You want to select a subset of your data but you haven't loaded any? Try loading some first. Now there's an idea!"
+    try:
+      subset_mask = subsets.evaluate_filter(self, filter_expression)
+    except ValueError as error:
+      return str(error)
+    if not subset_mask.any():
+      return "None of the isolates match the filter '%s'. Try again."%filter_expression
+    self.subset_filter = filter_expression.strip()
+    self.subset_mask = subset_mask
+    self.subset_table = self.count_table.empty_copy()
+    self.subset_table.add_cells(self.count_table.cell_indices(self.current_dataset['mics'][subset_mask],
+                                                              self.current_dataset['disk_columns'][subset_mask]),
+                                self.isolate_weights(subset_mask))
+    return '0'
+
+  def clear_subset_filter(self):
+    self.subset_filter = ''
+    self.subset_mask = None
+    self.subset_table = None
+
+  #The weights of the isolates selected by rows (any numpy index), or None if the dataset is unweighted.
+  def isolate_weights(self, rows=slice(None)):
+    if self.current_dataset.get('weights') is None:
+      return None
+    return self.current_dataset['weights'][rows]
+
+  #The count table that fits and error tables should use: that of the selected subset if there
+  #is one, otherwise that of the whole dataset.
+  def active_count_table(self):
+    if self.subset_table is not None:
+      return self.subset_table
+    return self.count_table
+
+  #Switches the disk column used for plotting and manual cutoffs. The cutoffs for the column we
+  #are switching away from are saved, so switching back restores them.
+  def select_disk_column(self, column):
+    self.disk_column_cutoffs[self.active_disk_column] = [self.xcutoffR, self.xcutoffS]
+    self.active_disk_column = column
+    self.xcutoffR, self.xcutoffS = self.disk_column_cutoffs[column]
+    if self.current_dataset['disk_columns'] is not None:
+      self.current_dataset['disks'] = self.current_dataset['disk_columns'][:,column]
+
+  #Appends the isolates in another csv file to the dataset that is already loaded. If there are several
+  #disk columns, they are matched up by name, so they can be in a different order from the original file
+  #(but must have the same names). A single disk column can be called anything.
+  def append_dataset(self, filename):
+    if self.current_dataset['mics'] is None:
+      return self.load_dataset(filename)
+    try:
+      with open(filename) as input_filehandle:
+        column_layout, column_names, lines = self.read_column_layout(input_filehandle.read().splitlines())
+      new_data, error = self.parse_dataset_lines(lines, column_layout)
+      disk_column_names = [name for name, column in zip(column_names, column_layout) if column == 'disk_columns']
+    except:
+      error = True
+    if (error == True or sorted(column_layout) != sorted(self.column_layout) or
+        [name for name, column in zip(column_names, column_layout) if column == 'metadata'] != self.metadata_names or
+        (len(self.disk_column_names) > 1 and sorted(disk_column_names) != sorted(self.disk_column_names))):
+      return ('There was an error opening the file you wanted to append! It should have exactly the '
+              'same columns as the original dataset. Nothing was added.')
+    if len(self.disk_column_names) > 1:
+      column_order = [disk_column_names.index(name) for name in self.disk_column_names]
+      new_data['disk_columns'] = [[disk_row[i] for i in column_order] for disk_row in new_data['disk_columns']]
+    self.append_rows(new_data)
+    return '0'
+
+  #If the file the current dataset came from has grown since we last read it (e.g. because new
+  #isolates are added to it each day), read only the complete lines added since then and
+  #append them. A line that has not been terminated yet is left for the next call, since
+  #whoever is writing the file may not have finished with it.
+  def append_new_rows_from_file(self):
+    if self.source_filename is None:
+      return "There is no file to watch. Load some data first!"
+    try:
+      if os.path.getsize(self.source_filename) < self.source_offset:
+        #The file got shorter, so it was replaced rather than appended to. Start over.
+        return self.load_dataset(self.source_filename)
+      with open(self.source_filename, 'rb') as input_filehandle:
+        input_filehandle.seek(self.source_offset)
+        new_contents = input_filehandle.read()
+    except:
+      return "The file '%s' that you are watching could not be read."%self.source_filename
+    complete_length = new_contents.rfind(b'\n') + 1
+    if complete_length == 0:
       return '0'
+    self.source_offset += complete_length
+    new_lines = [line for line in new_contents[:complete_length].decode().splitlines() if line.strip() != '']
+    new_data, error = self.parse_dataset_lines(new_lines, self.column_layout)
+    if error == True:
+      return ("Some of the new rows in the file you are watching could not be read, so none of them were "
+              "added. Make sure they have the same columns as the rest of the file.")
+    self.append_rows(new_data)
+    return '0'
 
 
 
@@ -93,13 +427,18 @@ class model_parameter_set():
       self.xcutoffS = float(self.xcutoffS)
     except:
       return 'Non-numeric cutoff entered!'
-    self.error_counts = {'num_strains':len(self.current_dataset['mics']),
-                         'very major errors':0, 'major errors':0, 'minor errors':0}
-    self.i_plus2_error = {'num_strains':0,'very major errors':0, 'major errors':0, 'minor errors':0}
-    self.i_plus1_minus1_error = {'num_strains':0,'very major errors':0, 'major errors':0, 'minor errors':0}
-    self.i_minus2_error = {'num_strains':0,'very major errors':0, 'major errors':0, 'minor errors':0}
-                           
-    
+    #The cutoffs for the other disk columns were set when they were last selected (or fit), so they
+    #are valid numbers already.
+    self.disk_column_cutoffs[self.active_disk_column] = [self.xcutoffR, self.xcutoffS]
+    #Nothing to do if the error tables are already up to date (e.g. when redrawing a dataset
+    #we have switched back to).
+    error_table_key = (self.ycutoffS, self.ycutoffR, is_mic_vs_mic, self.data_version, self.subset_filter,
+                       tuple([tuple(cutoffs) for cutoffs in self.disk_column_cutoffs]))
+    if error_table_key != self.error_table_key or len(self.disk_column_errors) != len(self.disk_column_cutoffs):
+      self.disk_column_errors = [self.active_count_table().tabulate_errors(self.ycutoffS, self.ycutoffR, xcutoffS, xcutoffR,
+                                                                  is_mic_vs_mic, column)
+                                 for column, (xcutoffR, xcutoffS) in enumerate(self.disk_column_cutoffs)]
+      self.error_table_key = error_table_key
     if is_mic_vs_mic == False:
       self.update_error_for_disk_data()
     else:
@@ -108,141 +447,58 @@ class model_parameter_set():
 
 
 
+  #Each isolate is assigned an actual category from its mic and a predicted category from its
+  #disk zone, and the error tables count the isolates where the two disagree. Since every isolate
+  #in the same (disk, mic) cell of the count table gets the same categories, the counting is done
+  #one cell at a time by count_table.tabulate_errors.
+  #This next part is a little subtle. Microbiologists when reviewing disk vs mic data like
+  #to see how many of the errors (where predicted != actual) fall into ">=I+2", "I+1 to I-1"
+  #and "<=I-2". I+x in this case is defined as +x bins. So for example if the cutoff is 16
+  #then I is MIC < 16, I+1 is MIC <= 16 and I+2 is MIC <=32. I had to double-check with our
+  #microbio team the first time I implemented this because the way they were using these
+  #"I+2", "I+1 to I-1" etc. categories was initially unclear to me. At any rate, tabulate_errors
+  #implements their logic to determine errors in the corresponding categories, and the overall
+  #whole-dataset error counts, where "very major", "major" and "minor" are defined as for
+  #count_tables.ERROR_CODE_MATRIX.
   def update_error_for_disk_data(self):
-    diskvalue = self.current_dataset['disks']
-    micvalue = self.current_dataset['mics']
-    for i in range(len(self.current_dataset['mics'])):
-      #Assign predictions and actual values to categories
-      if micvalue[i] <= self.ycutoffS:
-        actual_category = 0
-      elif micvalue[i] < self.ycutoffR:
-        actual_category = 1
-      else:
-        actual_category = 2
-
-      if diskvalue[i] >= self.xcutoffS:
-        predicted_category = 0
-      elif diskvalue[i] > self.xcutoffR:
-        predicted_category = 1
-      else:
-        predicted_category = 2
-
-    #This next part is a little subtle. Microbiologists when reviewing disk vs mic data like
-    #to see how many of the errors (where predicted != actual) fall into ">=I+2", "I+1 to I-1"
-    #and "<=I-2". I+x in this case is defined as +x bins. So for example if the cutoff is 16
-    #then I is MIC < 16, I+1 is MIC <= 16 and I+2 is MIC <=32. I had to double-check with our
-    #microbio team the first time I implemented this because the way they were using these
-    #"I+2", "I+1 to I-1" etc. categories was initially unclear to me. At any rate, the next set of
-    #if-else statements implements their logic to determine errors in the corresponding categories.
-      if micvalue[i] > (self.ycutoffR):
-        self.i_plus2_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_plus2_error[error_code] += 1
-      elif micvalue[i] <= self.ycutoffR and micvalue[i] >= self.ycutoffS:
-        self.i_plus1_minus1_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_plus1_minus1_error[error_code] += 1
-      else:
-        self.i_minus2_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_minus2_error[error_code] += 1
-    #We now update the overall whole-dataset error counts. An error is any situation where
-    #predicted != actual. Microbiologists define "very major", "major" and "minor" errors
-    #depending on how predicted compares to actual (implemented in check_is_error below).
-      error_code = self.check_is_error(predicted_category, actual_category)
-      if error_code != 'no error':
-        self.error_counts[error_code] += 1
+    error_tables = self.disk_column_errors[self.active_disk_column]
+    self.error_counts = error_tables['error_counts']
+    self.i_plus2_error = error_tables['i_plus2_error']
+    self.i_plus1_minus1_error = error_tables['i_plus1_minus1_error']
+    self.i_minus2_error = error_tables['i_minus2_error']
 
 
 
 
+  #If the user imported MIC vs MIC data, the procedure is the same but the direction of the inequality
+  #for x values (the alternate-method MICs, stored under 'disks' for the sake of consistency) is reversed.
+  #We also check whether the e-test MIC was at least within twofold of the broth MIC. If so,
+  #microbiologists consider it to be within "essential agreement" even if predicted
+  #category is wrong. So they track both # errors and "essential agreement". (Yes, I know,
+  #twofold is a huge error bar in most fields. It's what microbiologists use -- MIC assays
+  #are not very precise.)
   def update_error_for_mic_vs_mic_data(self):
-    self.essential_agreement = 0
-    self.categorical_agreement = 0
-    num_wrong_predictions = 0
-    num_predictions_within_twofold = 0
-    #If the user imported MIC vs MIC data, the procedure is the same but the direction of the inequality
-    #for x values (what we're calling 'diskvalue' here for the sake of consistency) is reversed.
-    xvalue = self.current_dataset['disks']
-    micvalue = self.current_dataset['mics']
-    for i in range(len(self.current_dataset['mics'])):
-      if micvalue[i] <= self.ycutoffS:
-        actual_category = 0
-      elif micvalue[i] < self.ycutoffR:
-        actual_category = 1
-      else:
-        actual_category = 2
-
-      if xvalue[i] >= self.xcutoffR:
-        predicted_category = 2
-      elif xvalue[i] > self.xcutoffS:
-        predicted_category = 1
-      else:
-        predicted_category = 0
-
-
-    #Same applies as for the analogous section under update_error_for_disk_data above
-    #(see the long comment under that function to explain what we're doing in this next
-    #group of if-else statements).
-      if micvalue[i] > (self.ycutoffR):
-        self.i_plus2_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_plus2_error[error_code] += 1
-      elif micvalue[i] <= self.ycutoffR and micvalue[i] >= self.ycutoffS:
-        self.i_plus1_minus1_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_plus1_minus1_error[error_code] += 1
-      else:
-        self.i_minus2_error['num_strains'] += 1
-        error_code = self.check_is_error(predicted_category, actual_category)
-        if error_code != 'no error':
-          self.i_minus2_error[error_code] += 1
-
-
-    #We now update the overall whole-dataset error counts. An error is any situation where
-    #predicted != actual. Microbiologists define "very major", "major" and "minor" errors
-    #depending on how predicted compares to actual (implemented in check_is_error below).
-      error_code = self.check_is_error(predicted_category, actual_category)
-      if error_code != 'no error':
-        num_wrong_predictions += 1
-        self.error_counts[error_code] += 1
-      #We also check whether the e-test MIC was at least within twofold of the broth MIC. If so,
-      #microbiologists consider it to be within "essential agreement" even if predicted
-      #category is wrong. So they track both # errors and "essential agreement". (Yes, I know,
-      #twofold is a huge error bar in most fields. It's what microbiologists use -- MIC assays
-      #are not very precise.)
-      if xvalue[i] <= micvalue[i]*2.0:
-        if xvalue[i] >= micvalue[i]*0.5:
-          num_predictions_within_twofold += 1
-                                          
+    error_tables = self.disk_column_errors[self.active_disk_column]
+    self.error_counts = error_tables['error_counts']
+    self.i_plus2_error = error_tables['i_plus2_error']
+    self.i_plus1_minus1_error = error_tables['i_plus1_minus1_error']
+    self.i_minus2_error = error_tables['i_minus2_error']
     #For MIC vs MIC data only, update the essential and categorical agreement attributes.
-    self.essential_agreement = 100.0 * num_predictions_within_twofold / self.error_counts['num_strains']
-    self.categorical_agreement = 100.0 - 100.0*num_wrong_predictions / self.error_counts['num_strains']
-        
-
-
-
-  #Very major error means predicted susceptible but actually resistant.
-  #Major error means predicted resistant but actually susceptible.
-  #Minor error means one of {predicted, actual} is intermediate
-  #and the other is something else. This distinction comes down to the impact
-  #a missed prediction would have on patient treatment. If you predict susceptible
-  #but bug is resistant, for example, this is the worst thing that can happen, because
-  #patient is being treated with a drug that won't help, so the infection will continue
-  #to grow. Predicting resistant when actually susceptible is bad but not quite as bad --
-  #just means the doctor will pass on what could actually have been a useful drug for that patient.
-  def check_is_error(self, predicted_category, actual_category):
-    if predicted_category != actual_category:
-        if actual_category == 1 or predicted_category == 1:
-          return 'minor errors'
-        elif actual_category == 2 and predicted_category == 0:
-          return 'very major errors'
-        elif actual_category == 0 and predicted_category == 2:
-          return 'major errors'
-    else:
-      return 'no error'
+    self.essential_agreement = error_tables['essential_agreement']
+    self.categorical_agreement = error_tables['categorical_agreement']
+
+
+#Appends values to array and returns the buffer and the view of it that holds the result. If array is
+#the start of buffer and buffer has room for the new values, they are just written into the spare
+#room; otherwise (e.g. for a dataset that was just loaded from a session file) a new buffer is made
+#with room for as many rows again, so a long run of small appends only copies the existing rows
+#a few times rather than once per append. Views of the old rows (e.g. ones handed out before the
+#append) are not changed.
+def extend_array(buffer, array, values):
+  num_rows = array.shape[0] + values.shape[0]
+  if buffer is None or array.base is not buffer or buffer.shape[0] < num_rows:
+    new_buffer = np.empty((max(num_rows, 2 * array.shape[0]),) + array.shape[1:], dtype=array.dtype)
+    new_buffer[:array.shape[0]] = array
+    buffer = new_buffer
+  buffer[array.shape[0]:num_rows] = values
+  return buffer, buffer[:num_rows]
@@ -0,0 +1,314 @@
+import os, argparse, csv, math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import model_core, count_tables, command_line
+
+#Before commissioning a breakpoint study, the team needs to know how many isolates it takes for the
+#fitted disk cutoffs to be stable and for the error rates to be estimated to within a given tolerance.
+#This module answers that by simulation: a generative model gives the probability of an isolate
+#landing in each (disk zone, mic) cell, and for each sample size thousands of studies are drawn
+#from it (each one a single multinomial draw of a whole count table), fit and scored. Because the fit
+#and error tables only depend on the count table (see count_tables.py), a whole batch of simulated
+#studies is fit at once with model_core.impurity_model.fit_disk_counts_batch, and the batches are
+#spread across a pool of worker processes.
+#The generative model is either the distribution of a reference dataset (e.g. last year's isolates) or
+#a user-specified one: the proportion of isolates at each mic and a normal distribution of disk zones
+#for each mic (see parametric_model). The "true" cutoffs and error rates are those of the generative
+#model itself, and for each sample size we report how often a study finds the same cutoffs and how
+#often its very major and major error rates are within the tolerance of the true ones. Can be run from
+#the command line, e.g.
+#  python power_simulation.py --reference last_year.csv --sizes 100,200,500,1000 -o power
+#(run python power_simulation.py --help for the full list of options).
+
+DEFAULT_SETTINGS = dict(command_line.DEFAULT_SETTINGS, sample_sizes=[100, 200, 300, 500, 1000], num_studies=1000,
+                        tolerance=1.0, seed=None)
+
+#Number of studies fit together in one batch. Larger batches are faster but need more memory
+#(each study is a count table of disk values x mic values).
+STUDIES_PER_BATCH = 250
+
+CURVE_COLUMNS = ['sample size', 'num studies', 'failed fits (%)', 'same cutoffs (%)', 'cutoff R within 1 mm (%)',
+                 'very major within tolerance (%)', 'major within tolerance (%)', 'mean very major errors (%)',
+                 'very major errors 95% range', 'mean major errors (%)', 'major errors 95% range']
+
+
+#The probability of an isolate falling in each (disk value, mic value) cell.
+class simulation_model():
+
+  def __init__(self, disk_values, mic_values, probabilities):
+    self.disk_values = np.asarray(disk_values, dtype=np.float64)
+    self.mic_values = np.asarray(mic_values, dtype=np.float64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    self.probabilities = probabilities / probabilities.sum()
+
+
+#Uses the isolates of a loaded dataset (the selected subset and disk column, if there are several)
+#as the generative model. Returns an error message ('0' if there was no error) and the model.
+def reference_model(current_model):
+  if current_model.current_dataset['mics'] is None:
+    return "You want to run a simulation but you haven't loaded any data? Try loading some first. Now there's an idea!", None
+  if current_model.mic_vs_mic:
+    return "Sample size simulations are only available for disk data, not MIC vs MIC data.", None
+  table = current_model.active_count_table()
+  counts = table.counts[current_model.active_disk_column]
+  if counts.sum() <= 0:
+    return "The reference dataset doesn't contain any isolates.", None
+  return '0', simulation_model(table.disk_values, table.mic_values, counts)
+
+
+#Builds a generative model from the proportion of isolates at each mic and, for each mic, a normal
+#distribution of disk zones with the given mean and standard deviation (in mm), rounded to the nearest
+#disk value. Zones beyond the first or last disk value are counted at that value, as they would be
+#read on a plate.
+def parametric_model(mic_values, mic_proportions, zone_means, zone_sds, disk_values=np.arange(6, 51)):
+  disk_values = np.asarray(disk_values, dtype=np.float64)
+  edges = np.concatenate([[-np.inf], (disk_values[1:] + disk_values[:-1]) / 2, [np.inf]])
+  erf = np.vectorize(math.erf)
+  zone_means, zone_sds = np.asarray(zone_means, dtype=np.float64), np.asarray(zone_sds, dtype=np.float64)
+  cdf = 0.5 * (1 + erf((edges[:,None] - zone_means[None,:]) / (zone_sds[None,:] * np.sqrt(2))))
+  disk_given_mic = np.diff(cdf, axis=0)
+  return simulation_model(disk_values, mic_values, disk_given_mic * np.asarray(mic_proportions, dtype=np.float64)[None,:])
+
+
+#Reads a user-specified distribution for parametric_model from a csv file with a header row and one
+#row per mic: the mic, the proportion of isolates with that mic (these don't have to add up to 1)
+#and the mean and standard deviation of their disk zones, e.g.
+#  MIC,proportion,zone mean,zone sd
+#  0.5,0.3,28,2.5
+#Returns an error message ('0' if there was no error) and the model.
+def read_distribution_file(filename):
+  try:
+    with open(filename, 'r') as input_file:
+      rows = [line.strip().split(',') for line in input_file.read().splitlines()[1:] if line.strip() != '']
+    values = np.asarray(rows, dtype=np.float64).reshape((-1, 4))
+  except:
+    return ("The distribution file '%s' could not be read. It should have a header row and then one row per MIC "
+            "with four numbers: the MIC, the proportion of isolates, and the mean and standard deviation of "
+            "their disk zones."%filename), None
+  if values.shape[0] == 0 or (values[:,1] < 0).any() or values[:,1].sum() <= 0 or (values[:,3] <= 0).any():
+    return ("The distribution file '%s' must contain at least one MIC, proportions that are 0 or more and "
+            "standard deviations greater than 0."%filename), None
+  order = np.argsort(values[:,0])
+  return '0', parametric_model(values[order,0], values[order,1], values[order,2], values[order,3])
+
+
+#The number of isolates in each category (columns as in count_table.class_counts: 2 = susceptible,
+#1 = intermediate, 0 = resistant) at each disk value, for any number of count tables at once.
+def batch_class_counts(sim_model, counts, miccutoffS, miccutoffR):
+  mic_class = np.ones(sim_model.mic_values.shape[0], dtype=np.int64)
+  mic_class[sim_model.mic_values <= miccutoffS] = 2
+  mic_class[sim_model.mic_values >= miccutoffR] = 0
+  return counts @ (mic_class[:,None] == np.arange(3)[None,:]).astype(counts.dtype)
+
+
+#The very major, major and minor error rates (as a percentage of all isolates, as in the error table)
+#of each count table in counts (shape (number of tables, disk values, mic values)) at its own
+#cutoffs, calculated the same way as count_table.tabulate_errors but for every table at once.
+def batch_error_rates(sim_model, counts, cutoffs_R, cutoffs_S, miccutoffS, miccutoffR):
+  actual_category = count_tables.actual_categories(sim_model.mic_values, miccutoffS, miccutoffR)
+  disks = np.broadcast_to(sim_model.disk_values, (counts.shape[0], sim_model.disk_values.shape[0]))
+  predicted_category = count_tables.predicted_categories(disks, cutoffs_S[:,None], cutoffs_R[:,None])
+  error_code = count_tables.ERROR_CODE_MATRIX[predicted_category[:,:,None], actual_category[None,None,:]]
+  table_and_error = (np.arange(counts.shape[0])[:,None,None] * 4 + error_code).ravel()
+  totals = np.bincount(table_and_error, weights=counts.ravel(), minlength=counts.shape[0] * 4).reshape((-1, 4))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return 100.0 * totals[:,1:] / totals.sum(axis=1)[:,None]
+
+
+#Fits the generative model itself (using its probabilities as the counts) to get the true cutoffs and
+#the true error rates at those cutoffs. Returns an error message ('0' if there was no error) and a
+#dictionary of the results.
+def true_results(sim_model, model_type, miccutoffS, miccutoffR):
+  class_counts = batch_class_counts(sim_model, sim_model.probabilities[None,:,:], miccutoffS, miccutoffR)
+  category_totals = class_counts[0].sum(axis=0)
+  if category_totals[2] <= 0 or category_totals[0] <= 0:
+    return ("There are no susceptible or no resistant strains in the generative model at these MIC breakpoints, "
+            "so there are no cutoffs to find."), None
+  engine = model_core.new_engine(model_type)
+  fit = engine.fit_disk_counts_batch(sim_model.disk_values, class_counts)
+  error_rates = batch_error_rates(sim_model, sim_model.probabilities[None,:,:], fit['cutoffs_R'], fit['cutoffs_S'],
+                                  miccutoffS, miccutoffR)[0]
+  return '0', {'cutoff R':float(fit['cutoffs_R'][0]), 'cutoff S':float(fit['cutoffs_S'][0]),
+               'very major errors (%)':float(error_rates[0]), 'major errors (%)':float(error_rates[1]),
+               'minor errors (%)':float(error_rates[2])}
+
+
+#Simulates, fits and scores one batch of studies of the same sample size. Runs in a worker process.
+#Studies in which there are no susceptible or no resistant strains can't be fit (fit_data would refuse
+#them too); their cutoffs and error rates are NaN.
+def simulate_studies(task):
+  sim_model, model_type, miccutoffS, miccutoffR, sample_size, num_studies, seed = task
+  rng = np.random.default_rng(seed)
+  counts = rng.multinomial(sample_size, sim_model.probabilities.ravel(), size=num_studies)
+  counts = counts.reshape((num_studies,) + sim_model.probabilities.shape)
+  class_counts = batch_class_counts(sim_model, counts, miccutoffS, miccutoffR)
+  category_totals = class_counts.sum(axis=1)
+  failed = (category_totals[:,2] == 0) | (category_totals[:,0] == 0)
+  engine = model_core.new_engine(model_type)
+  fit = engine.fit_disk_counts_batch(sim_model.disk_values, class_counts)
+  error_rates = batch_error_rates(sim_model, counts, fit['cutoffs_R'], fit['cutoffs_S'], miccutoffS, miccutoffR)
+  cutoffs_R = np.where(failed, np.nan, fit['cutoffs_R'])
+  cutoffs_S = np.where(failed, np.nan, fit['cutoffs_S'])
+  return sample_size, cutoffs_R, cutoffs_S, np.where(failed[:,None], np.nan, error_rates)
+
+
+#The percentage of the studies for which condition is True.
+def percent_of_studies(condition, num_studies):
+  return round(100.0 * int(np.sum(condition)) / num_studies, 2)
+
+
+#Summarizes the simulated studies of one sample size as a row of the power and stability curves.
+def summarize_studies(sample_size, truth, cutoffs_R, cutoffs_S, error_rates, tolerance):
+  num_studies = cutoffs_R.shape[0]
+  fitted = ~np.isnan(cutoffs_R)
+  curve = {'sample size':sample_size, 'num studies':num_studies,
+           'failed fits (%)':percent_of_studies(~fitted, num_studies)}
+  curve['same cutoffs (%)'] = percent_of_studies((cutoffs_R == truth['cutoff R']) & (cutoffs_S == truth['cutoff S']),
+                                                 num_studies)
+  curve['cutoff R within 1 mm (%)'] = percent_of_studies(np.abs(cutoffs_R[fitted] - truth['cutoff R']) <= 1, num_studies)
+  for j, error_type in [(0, 'very major'), (1, 'major')]:
+    rates = error_rates[fitted,j]
+    curve[error_type + ' within tolerance (%)'] = percent_of_studies(np.abs(rates - truth[error_type + ' errors (%)']) <=
+                                                                     tolerance, num_studies)
+    if rates.shape[0] == 0:
+      curve['mean %s errors (%%)'%error_type], curve['%s errors 95%% range'%error_type] = None, ''
+      continue
+    curve['mean %s errors (%%)'%error_type] = round(float(rates.mean()), 2)
+    curve['%s errors 95%% range'%error_type] = '%s-%s'%tuple([round(float(rate), 2) for rate in np.percentile(rates, [2.5, 97.5])])
+  return curve
+
+
+#Simulates settings['num_studies'] studies at each of settings['sample_sizes'] across a pool of worker
+#processes. Returns an error message ('0' if there was no error), the true results of the generative
+#model (see true_results) and one row of the curves per sample size.
+def run_simulation(sim_model, settings=DEFAULT_SETTINGS, num_workers=None):
+  try:
+    miccutoffS, miccutoffR = float(settings['ycutoffS']), float(settings['ycutoffR'])
+    sample_sizes = [int(sample_size) for sample_size in settings['sample_sizes']]
+    num_studies, tolerance = int(settings['num_studies']), float(settings['tolerance'])
+  except:
+    return "The MIC breakpoints, sample sizes, number of studies or tolerance you have entered are not valid numbers. Try again.", None, []
+  if len(sample_sizes) == 0 or min(sample_sizes) < 1 or num_studies < 1:
+    return "The sample sizes and the number of studies must be at least 1. Try again.", None, []
+  error_code, truth = true_results(sim_model, settings['model_type'], miccutoffS, miccutoffR)
+  if error_code != '0':
+    return error_code, None, []
+  batch_sizes = [min(STUDIES_PER_BATCH, num_studies - start) for start in range(0, num_studies, STUDIES_PER_BATCH)]
+  seeds = np.random.SeedSequence(settings.get('seed')).spawn(len(sample_sizes) * len(batch_sizes))
+  tasks = [(sim_model, settings['model_type'], miccutoffS, miccutoffR, sample_size, batch_size,
+            seeds[i * len(batch_sizes) + j])
+           for i, sample_size in enumerate(sample_sizes) for j, batch_size in enumerate(batch_sizes)]
+  results = {sample_size:[] for sample_size in sample_sizes}
+  with ProcessPoolExecutor(max_workers=num_workers) as executor:
+    for sample_size, cutoffs_R, cutoffs_S, error_rates in executor.map(simulate_studies, tasks):
+      results[sample_size].append((cutoffs_R, cutoffs_S, error_rates))
+  curves = []
+  for sample_size in sample_sizes:
+    cutoffs_R, cutoffs_S, error_rates = [np.concatenate(arrays) for arrays in zip(*results[sample_size])]
+    curves.append(summarize_studies(sample_size, truth, cutoffs_R, cutoffs_S, error_rates, tolerance))
+  return '0', truth, curves
+
+
+#Writes the curves to a csv file, one row per sample size, after a line giving the true cutoffs
+#and error rates.
+def export_curves(truth, curves, filename):
+  try:
+    with open(filename, 'w', newline='') as output_file:
+      writer = csv.writer(output_file)
+      writer.writerow(['True cutoffs R (<=) / S (>=)', truth['cutoff R'], truth['cutoff S'], 'True very major errors (%)',
+                       round(truth['very major errors (%)'], 2), 'True major errors (%)', round(truth['major errors (%)'], 2)])
+      writer.writerow([])
+      writer.writerow(CURVE_COLUMNS)
+      for curve in curves:
+        writer.writerow(['' if curve[column] is None else curve[column] for column in CURVE_COLUMNS])
+  except:
+    return ("The simulation results could not be exported. The program is trying to write to a file called '%s'. Make sure "
+            "that you don't have a file by this name already open."%filename)
+  return '0'
+
+
+#Plots the stability curves (how often a study finds the true cutoffs) on the left and the power
+#curves (how often its error rates are within tolerance) on the right, against sample size.
+def draw_curves(figure, truth, curves, tolerance):
+  sample_sizes = [curve['sample size'] for curve in curves]
+  stability_axes, power_axes = figure.subplots(1, 2)
+  stability_axes.plot(sample_sizes, [curve['same cutoffs (%)'] for curve in curves], marker='o', label='Same cutoffs')
+  stability_axes.plot(sample_sizes, [curve['cutoff R within 1 mm (%)'] for curve in curves], marker='o',
+                      label='Cutoff R within 1 mm')
+  stability_axes.set_title('Cutoff stability (true cutoffs <=%s / >=%s)'%(truth['cutoff R'], truth['cutoff S']), fontsize=10)
+  power_axes.plot(sample_sizes, [curve['very major within tolerance (%)'] for curve in curves], marker='o',
+                  label='Very major (true %s%%)'%round(truth['very major errors (%)'], 2))
+  power_axes.plot(sample_sizes, [curve['major within tolerance (%)'] for curve in curves], marker='o',
+                  label='Major (true %s%%)'%round(truth['major errors (%)'], 2))
+  power_axes.set_title('Error rate within %s%% of true rate'%tolerance, fontsize=10)
+  for axes in [stability_axes, power_axes]:
+    axes.set_xlabel('Number of isolates')
+    axes.set_ylabel('Simulated studies (%)')
+    axes.set_ylim(0, 105)
+    axes.grid(alpha=0.3)
+    axes.legend(fontsize=8)
+  figure.tight_layout()
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Simulate how many isolates a disk breakpoint study needs for stable cutoffs '
+                                               'and precise error rates.')
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument('--reference', help='csv file of isolates to simulate from (same format as for Import Data)')
+  source.add_argument('--distribution', help='csv file giving the proportion of isolates at each MIC and the mean and '
+                      'standard deviation of their disk zones')
+  parser.add_argument('-o', '--output', default='power', help='folder to write the curves to')
+  parser.add_argument('--sizes', default=','.join([str(size) for size in DEFAULT_SETTINGS['sample_sizes']]),
+                      help='comma-separated list of sample sizes (numbers of isolates) to simulate')
+  parser.add_argument('--studies', type=int, default=DEFAULT_SETTINGS['num_studies'],
+                      help='number of studies to simulate for each sample size')
+  parser.add_argument('--tolerance', type=float, default=DEFAULT_SETTINGS['tolerance'],
+                      help='how close (in percentage points) an estimated error rate must be to the true one')
+  command_line.add_common_arguments(parser, filter_help='only simulate from the reference isolates selected by this filter',
+                                    dataset_options=False)
+  parser.add_argument('--seed', type=int, default=None, help='random seed, to make the simulation repeatable')
+  args = parser.parse_args()
+  settings = command_line.settings_from_arguments(args)
+  if args.reference is not None:
+    error_code, current_model = command_line.load_model(args.reference, settings)
+    if error_code == '0':
+      error_code = current_model.set_subset_filter(settings['subset_filter'])
+    if error_code == '0':
+      error_code, sim_model = reference_model(current_model)
+  else:
+    error_code, sim_model = read_distribution_file(args.distribution)
+  if error_code != '0':
+    print(error_code)
+    return
+  try:
+    sample_sizes = [int(size) for size in args.sizes.split(',')]
+  except:
+    print("The sample sizes should be a comma-separated list of whole numbers, e.g. 100,200,500.")
+    return
+  settings = dict(DEFAULT_SETTINGS, **settings, sample_sizes=sample_sizes, num_studies=args.studies,
+                  tolerance=args.tolerance, seed=args.seed)
+  error_code, truth, curves = run_simulation(sim_model, settings, args.workers)
+  if error_code != '0':
+    print(error_code)
+    return
+  try:
+    os.makedirs(args.output, exist_ok=True)
+  except:
+    print("The output folder '%s' could not be created."%args.output)
+    return
+  error_code = export_curves(truth, curves, os.path.join(args.output, 'power_curves.csv'))
+  if error_code != '0':
+    print(error_code)
+    return
+  figure = Figure(figsize=(10, 4.5))
+  FigureCanvasAgg(figure)
+  draw_curves(figure, truth, curves, args.tolerance)
+  figure.savefig(os.path.join(args.output, 'power_curves.png'), dpi=150)
+  print('True cutoffs <=%s (R) / >=%s (S). Wrote the curves for %s sample sizes to %s'%(truth['cutoff R'], truth['cutoff S'],
+                                                                                       len(curves), args.output))
+
+
+if __name__ == '__main__':
+  main()
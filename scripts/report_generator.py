@@ -0,0 +1,174 @@
+import os, argparse, html, re
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import data_processing, disk_plotting, subsets, generate_tabletext, shared_arrays, command_line
+
+#Generates the same heatmap + error table figure shown in the main window for a whole batch of
+#datasets without opening the GUI. Each dataset is loaded, fit and rendered on the Agg backend
+#(no display needed) in a separate worker process, and the images are written to the output
+#folder together with an index.html that lists the fitted cutoffs and error rates for each
+#dataset and links to its figure. Can be run from the command line, e.g.
+#  python report_generator.py site_a.csv site_b.csv -o reports --formats png,pdf
+#(run python report_generator.py --help for the full list of options). With --filter, only the isolates
+#selected by the filter are fit (see subsets.py), and with --group-by, a separate report is made for each
+#value of a metadata column, e.g. one per body site. The groups of a dataset are rendered in parallel:
+#the dataset is loaded once and shared with the workers (see shared_arrays.py) rather than copied to each.
+
+REPORT_FORMATS = ['png', 'svg', 'pdf']
+
+
+#Loads a single dataset and renders the report for it (or for the subset selected by the filter).
+#Runs in a worker process, so it returns a list of summaries of the results (including any error
+#message) rather than raising: one dataset that can't be rendered mustn't stop the rest of the batch.
+def render_report(task):
+  filename, output_dir, formats, settings = task
+  report_name = os.path.splitext(os.path.basename(filename))[0]
+  error_code, current_model = command_line.load_model(filename, settings)
+  if error_code != '0':
+    return [{'name':report_name, 'source':filename, 'files':[], 'message':error_code}]
+  return [render_subset(current_model, report_name, filename, settings.get('subset_filter', ''),
+                        output_dir, formats)]
+
+
+#Loads a single dataset and renders a report for each value of the group_by column, sharing the
+#dataset with a pool of worker processes that render the groups in parallel.
+def render_groups(filename, output_dir, formats, settings, num_workers=None):
+  report_name = os.path.splitext(os.path.basename(filename))[0]
+  error_code, current_model = command_line.load_model(filename, settings)
+  if error_code != '0':
+    return [{'name':report_name, 'source':filename, 'files':[], 'message':error_code}]
+  try:
+    groups = subsets.group_filters(current_model, settings['group_by'], settings.get('subset_filter', ''))
+  except ValueError as error:
+    return [{'name':report_name, 'source':filename, 'files':[], 'message':str(error)}]
+  tasks = [('%s_%s'%(report_name, re.sub(r'[^\w.-]+', '_', value)), filename, subset_filter, output_dir, formats)
+           for value, subset_filter in groups]
+  with shared_arrays.shared_dataset(current_model) as shared:
+    return shared_arrays.map_shared(shared, render_group, tasks, num_workers)
+
+
+#Renders the report for one group, using the dataset shared with this worker process.
+def render_group(task):
+  report_name, filename, subset_filter, output_dir, formats = task
+  return render_subset(shared_arrays.worker_model(), report_name, filename, subset_filter, output_dir, formats)
+
+
+#Fits the isolates of a loaded dataset selected by subset_filter (all of them if it is blank) and
+#renders the figure to each of the requested formats. Returns the summary of the results; if anything
+#goes wrong (e.g. a figure can't be saved), its message says what and no figures are listed.
+def render_subset(current_model, report_name, filename, subset_filter, output_dir, formats):
+  summary = {'name':report_name, 'source':filename, 'files':[], 'subset_filter':subset_filter}
+  try:
+    fit_and_draw(current_model, summary, output_dir, formats)
+  except Exception as error:
+    summary['files'] = []
+    summary['message'] = "The report could not be rendered (%s)."%error
+  return summary
+
+
+#Does the work of render_subset, filling in summary as it goes.
+def fit_and_draw(current_model, summary, output_dir, formats):
+  report_name, subset_filter = summary['name'], summary['subset_filter']
+  summary['message'] = current_model.set_subset_filter(subset_filter)
+  if summary['message'] == '0':
+    summary['message'] = data_processing.fit_data(current_model)
+  if summary['message'] != '0' and not summary['message'].startswith('!'):
+    return
+  figure = Figure(figsize=(9.5, 4.5))
+  FigureCanvasAgg(figure)
+  error_code = disk_plotting.draw_figure(figure, current_model, title=report_name)
+  if error_code != '0':
+    summary['message'] = error_code
+    return
+  for output_format in formats:
+    output_filename = os.path.join(output_dir, '%s.%s'%(report_name, output_format))
+    figure.savefig(output_filename, format=output_format, dpi=150)
+    summary['files'].append(os.path.basename(output_filename))
+  summary['xcutoffR'] = current_model.xcutoffR
+  summary['xcutoffS'] = current_model.xcutoffS
+  summary['error_counts'] = current_model.error_counts
+
+
+#Renders a report for each of the csv files in filenames across a pool of worker processes and
+#writes the index document. Returns an error message ('0' if there was no error) and the list
+#of per-dataset summaries. The settings are those of command_line.py, plus the group_by column if any.
+def generate_reports(filenames, output_dir, formats=['png'], settings=command_line.DEFAULT_SETTINGS, num_workers=None):
+  if len([f for f in formats if f not in REPORT_FORMATS]) > 0:
+    return "Reports can only be saved as %s."%', '.join(REPORT_FORMATS), []
+  names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+  if len(set(names)) != len(names):
+    return "Two of the datasets have the same file name, so their reports would overwrite each other.", []
+  try:
+    os.makedirs(output_dir, exist_ok=True)
+  except:
+    return "The output folder '%s' could not be created."%output_dir, []
+  if settings.get('group_by', '') != '':
+    summaries = [summary for filename in filenames
+                 for summary in render_groups(filename, output_dir, formats, settings, num_workers)]
+    return write_index(summaries, output_dir), summaries
+  tasks = [(filename, output_dir, formats, settings) for filename in filenames]
+  with ProcessPoolExecutor(max_workers=num_workers) as executor:
+    summaries = [summary for dataset_summaries in
+                 executor.map(render_report, tasks,
+                              chunksize=max(1, len(tasks) // (4 * (num_workers or os.cpu_count() or 1))))
+                 for summary in dataset_summaries]
+  return write_index(summaries, output_dir), summaries
+
+
+#Writes index.html, with one row per dataset giving the fitted cutoffs and error rates and
+#links to the rendered figures (or the error message, if the dataset couldn't be rendered).
+def write_index(summaries, output_dir):
+  rows = []
+  for summary in summaries:
+    cells = [html.escape(summary['name'])]
+    if summary.get('subset_filter', '') != '':
+      cells[0] += '<br><small>%s</small>'%html.escape(summary['subset_filter'])
+    if len(summary['files']) == 0:
+      cells.append('<td colspan="6">%s</td>'%html.escape(summary['message']))
+    else:
+      error_counts = summary['error_counts']
+      cells += [str(summary['xcutoffR']), str(summary['xcutoffS']), generate_tabletext.format_count(error_counts['num_strains'])]
+      for error_type in ['very major errors', 'major errors', 'minor errors']:
+        cells.append('%s (%s%%)'%(generate_tabletext.format_count(error_counts[error_type]),
+                                  round(100 * error_counts[error_type] / max(error_counts['num_strains'], 1), 2)))
+      cells.append(' '.join(['<a href="%s">%s</a>'%(html.escape(f), html.escape(f.split('.')[-1]))
+                             for f in summary['files']]))
+    rows.append('<tr>' + ''.join([c if c.startswith('<td') else '<td>%s</td>'%c for c in cells]) + '</tr>')
+    if summary['files'] and summary['files'][0].endswith(('.png', '.svg')):
+      rows.append('<tr><td colspan="8"><img src="%s" width="900"></td></tr>'%html.escape(summary['files'][0]))
+  header = ''.join(['<th>%s</th>'%h for h in ['Dataset', 'Disk cutoff R (<=)', 'Disk cutoff S (>=)', 'No. isolates',
+                                              'Very major (%)', 'Major (%)', 'Minor (%)', 'Figures']])
+  try:
+    with open(os.path.join(output_dir, 'index.html'), 'w') as output_file:
+      output_file.write('<html><head><meta charset="utf-8"><title>Disk Fitter reports</title></head><body>\n')
+      output_file.write('<h1>Disk Fitter reports</h1>\n<table border="1">\n<tr>%s</tr>\n'%header)
+      output_file.write('\n'.join(rows))
+      output_file.write('\n</table></body></html>\n')
+  except:
+    return "The index file could not be written to '%s'."%output_dir
+  return '0'
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Render Disk Fitter heatmap + error table reports for a batch of csv files.')
+  parser.add_argument('filenames', nargs='+', help='csv files to fit (same format as for Import Data)')
+  parser.add_argument('-o', '--output', default='reports', help='folder to write the reports to')
+  parser.add_argument('--formats', default='png', help='comma-separated list of image formats (png, svg, pdf)')
+  command_line.add_common_arguments(parser)
+  parser.add_argument('--group-by', default='', help='make a separate report for each value of this metadata column')
+  args = parser.parse_args()
+  settings = dict(command_line.settings_from_arguments(args), group_by=args.group_by)
+  error_code, summaries = generate_reports(args.filenames, args.output, args.formats.split(','),
+                                           settings, args.workers)
+  for summary in summaries:
+    if len(summary['files']) == 0:
+      print('%s: %s'%(summary['name'], summary['message']))
+  if error_code != '0':
+    print(error_code)
+    return
+  print('Wrote %s reports to %s'%(len([s for s in summaries if len(s['files']) > 0]), args.output))
+
+
+if __name__ == '__main__':
+  main()
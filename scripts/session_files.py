@@ -0,0 +1,177 @@
+import numpy as np, json, struct, os
+import model_object
+
+#Session files let the user save everything about the current analysis (the data, breakpoints,
+#cutoffs, error tables and display options) and reopen it later without re-importing the csv
+#or refitting. The file layout is:
+#  8 byte magic string, 4 byte format version, 4 byte header length (little-endian),
+#  a JSON header with the model attributes and the dtype, shape and position of each array,
+#  the raw bytes of each array, each starting on a 64 byte boundary.
+#Because the arrays are stored uncompressed at known positions, when a session is opened
+#they are memory-mapped rather than read in, so even a large dataset opens immediately.
+#If we ever change the layout, increase SESSION_VERSION, so that a file saved in the new layout
+#isn't opened by a version of the program that only knows the old one.
+SESSION_MAGIC = b'DFSESSN\x00'
+SESSION_VERSION = 1
+ARRAY_ALIGNMENT = 64
+
+#The model_parameter_set attributes stored in the JSON header.
+SESSION_ATTRIBUTES = ['model_type', 'ycutoffS', 'ycutoffR', 'xcutoffS', 'xcutoffR', 'strain_name',
+                      'use_user_defined_disk_cutoffs', 'mic_vs_mic', 'error_counts', 'i_plus2_error',
+                      'i_plus1_minus1_error', 'i_minus2_error', 'essential_agreement',
+                      'categorical_agreement', 'colormap_type', 'show_score_surface', 'column_layout',
+                      'source_filename', 'source_offset', 'disk_column_names', 'active_disk_column',
+                      'disk_column_cutoffs', 'disk_column_errors', 'metadata_names', 'metadata_categories',
+                      'subset_filter']
+
+
+#Gathers the arrays that need to be saved, keyed by the name they are stored under.
+def session_arrays(current_model):
+  arrays = {'count_table.disk_values':current_model.count_table.disk_values,
+            'count_table.mic_values':current_model.count_table.mic_values,
+            'count_table.counts':current_model.count_table.counts}
+  if current_model.model_engine.score_surface is not None:
+    arrays['model_engine.proposed_cutoffs_R'] = current_model.model_engine.proposed_cutoffs_R
+    arrays['model_engine.score_surface'] = current_model.model_engine.score_surface
+  #current_dataset['disks'] is just a view of one of the disk columns, so it isn't saved separately.
+  for column in current_model.current_dataset:
+    if current_model.current_dataset[column] is not None and column != 'disks':
+      arrays['current_dataset.' + column] = current_model.current_dataset[column]
+  return arrays
+
+
+#Everything else about the model: the attributes in SESSION_ATTRIBUTES and the fit.
+def session_header(current_model):
+  return {'attributes':{attribute:getattr(current_model, attribute) for attribute in SESSION_ATTRIBUTES},
+          'engine':{'cutoff_R':float(current_model.model_engine.cutoff_R),
+                    'cutoff_S':float(current_model.model_engine.cutoff_S),
+                    'tied_optima':current_model.model_engine.tied_optima}}
+
+
+def save_session(current_model, filename):
+  if current_model.current_dataset['mics'] is None:
+    return "You want to save a session but you haven't loaded any data? Try loading some first. Now there's an idea!"
+  unmap_session_file(current_model, filename)
+  header = session_header(current_model)
+  header['arrays'] = {}
+  arrays = {name:np.ascontiguousarray(array) for name, array in session_arrays(current_model).items()}
+  #The array offsets depend on the header length and vice versa, so first work out where each
+  #array goes relative to the start of the data section, then where the data section starts.
+  data_offset = 0
+  for name, array in arrays.items():
+    header['arrays'][name] = {'dtype':array.dtype.str, 'shape':list(array.shape), 'offset':data_offset}
+    data_offset += -(-array.nbytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+  header_bytes = json.dumps(header, default=to_json).encode()
+  data_start = -(-(16 + len(header_bytes)) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+  #The session is written to a temporary file in the same folder, which then replaces the old one,
+  #so a save that fails part way through doesn't destroy the last good copy.
+  temp_filename = filename + '.tmp'
+  try:
+    with open(temp_filename, 'wb') as output_file:
+      output_file.write(SESSION_MAGIC)
+      output_file.write(struct.pack('<II', SESSION_VERSION, len(header_bytes)))
+      output_file.write(header_bytes)
+      for name, array in arrays.items():
+        output_file.seek(data_start + header['arrays'][name]['offset'])
+        output_file.write(array.tobytes())
+    os.replace(temp_filename, filename)
+  except:
+    try:
+      os.remove(temp_filename)
+    except:
+      pass
+    return ("The session could not be saved. The program is trying to write to a file called '%s'. Make sure that you don't "
+      "have a file by this name already open."%filename)
+  return '0'
+
+
+#The arrays of a session that was opened from a file are memory-mapped from it (see load_session).
+#Before that file is overwritten, they are read into memory, so they don't lose their data and (since
+#Windows won't let a file that is memory-mapped be replaced) the file is no longer in use.
+def unmap_session_file(current_model, filename):
+  arrays = session_arrays(current_model)
+  if any([is_mapped_from(array, filename) for array in arrays.values()]):
+    set_model_arrays(current_model, {name:np.array(array) for name, array in arrays.items()})
+
+
+#Whether array is a memory map of filename, or a view of one.
+def is_mapped_from(array, filename):
+  while isinstance(array, np.ndarray):
+    if isinstance(array, np.memmap) and array.filename is not None and os.path.exists(filename):
+      if os.path.samefile(array.filename, filename):
+        return True
+    array = array.base
+  return False
+
+
+#The error dictionaries and cutoffs may contain numpy numbers, which json doesn't know about.
+def to_json(value):
+  if isinstance(value, np.generic):
+    return value.item()
+  raise TypeError('%s cannot be saved in a session file'%type(value))
+
+
+#Opens a session file, returning an error message ('0' if there was no error) and a new
+#model_parameter_set with the saved state. The arrays are memory-mapped copy-on-write, so
+#they are only read from disk as they are needed, and appending data to the restored
+#session never modifies the session file.
+def load_session(filename):
+  try:
+    with open(filename, 'rb') as input_file:
+      magic = input_file.read(8)
+      version, header_length = struct.unpack('<II', input_file.read(8))
+      header = json.loads(input_file.read(header_length).decode())
+  except:
+    return "The selected file could not be read. Are you sure it's a Disk Fitter session file?", None
+  if magic != SESSION_MAGIC:
+    return "The selected file is not a Disk Fitter session file. Clearly you have made a mistake.", None
+  if version > SESSION_VERSION:
+    return ("This session was saved by a newer version of Disk Fitter (session file format %s) and can't "
+            "be opened by this one."%version), None
+  data_start = -(-(16 + header_length) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+  arrays = {}
+  try:
+    for name, layout in header['arrays'].items():
+      if np.prod(layout['shape']) == 0:
+        arrays[name] = np.zeros(layout['shape'], dtype=np.dtype(layout['dtype']))
+      else:
+        arrays[name] = np.memmap(filename, dtype=np.dtype(layout['dtype']), mode='c',
+                                 offset=data_start + layout['offset'], shape=tuple(layout['shape']))
+  except:
+    return "The session file '%s' appears to be damaged and could not be opened."%filename, None
+  return '0', restore_model(header, arrays)
+
+
+#Rebuilds a model_parameter_set from a header made by session_header and the arrays returned by
+#session_arrays (which are used as they are, not copied).
+def restore_model(header, arrays):
+  current_model = model_object.model_parameter_set()
+  for attribute, value in header['attributes'].items():
+    setattr(current_model, attribute, value)
+  current_model.set_model_type(current_model.model_type)
+  current_model.model_engine.cutoff_R = header['engine']['cutoff_R']
+  current_model.model_engine.cutoff_S = header['engine']['cutoff_S']
+  current_model.model_engine.tied_optima = [tuple(optimum) for optimum in header['engine']['tied_optima']]
+  set_model_arrays(current_model, arrays)
+  return current_model
+
+
+#Sets the model's arrays to those returned by session_arrays (or copies of them) and rebuilds
+#everything that refers to them: the selected disk column and the subset's count table.
+def set_model_arrays(current_model, arrays):
+  arrays = dict(arrays)
+  if 'model_engine.score_surface' in arrays:
+    current_model.model_engine.proposed_cutoffs_R = arrays.pop('model_engine.proposed_cutoffs_R')
+    current_model.model_engine.score_surface = arrays.pop('model_engine.score_surface')
+  current_model.count_table.disk_values = arrays.pop('count_table.disk_values')
+  current_model.count_table.mic_values = arrays.pop('count_table.mic_values')
+  current_model.count_table.counts = arrays.pop('count_table.counts')
+  for name, array in arrays.items():
+    current_model.current_dataset[name.split('.', 1)[1]] = array
+  current_model.dataset_buffers = {}
+  current_model.select_disk_column(current_model.active_disk_column)
+  #The subset isn't stored, just the filter that selects it.
+  subset_filter = current_model.subset_filter
+  current_model.clear_subset_filter()
+  if subset_filter != '':
+    current_model.set_subset_filter(subset_filter)
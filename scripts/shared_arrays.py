@@ -0,0 +1,113 @@
+import os, weakref
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import session_files
+
+#Features that hand a model_parameter_set to a pool of worker processes (e.g. fitting every group of
+#a dataset in parallel) would otherwise pickle the whole dataset and copy it into every worker, which
+#for a large file multiplies both the memory used and the time it takes the workers to start. Instead,
+#a shared_dataset publishes the dataset arrays and count matrices once, in blocks of shared memory, and
+#each worker attaches to them when it starts and rebuilds the model around views of the shared blocks,
+#without copying them. Only a small handle (the names, dtypes and shapes of the blocks, plus the same
+#model attributes a session file stores, see session_files.py) is sent to the workers.
+#The workers' arrays are read-only, since they are shared by every worker: anything that would change
+#them (e.g. appending rows) must be done in the parent process, which then publishes the dataset again.
+#Fitting, subsets, error tables and plotting only read them, so they work as usual in the workers.
+#The shared blocks are freed when the shared_dataset is closed (use it in a with statement so this
+#happens even if the job fails or is cancelled), or failing that when it is garbage collected or the
+#program exits. If the process is killed outright, the multiprocessing resource tracker frees them.
+#A typical use is
+#  with shared_arrays.shared_dataset(current_model) as shared:
+#    results = shared_arrays.map_shared(shared, fit_group, tasks)
+#where fit_group calls shared_arrays.worker_model() to get the model.
+
+#The model rebuilt in each worker process by attach_worker, and the shared blocks its arrays are
+#views of (kept so they stay attached as long as the worker runs).
+worker_state = {'model':None, 'blocks':[]}
+
+
+class shared_dataset():
+
+  def __init__(self, current_model):
+    self.blocks = []
+    #Frees the blocks if close is never called (e.g. the shared_dataset is dropped after an error).
+    self.finalizer = weakref.finalize(self, release_blocks, self.blocks)
+    self.handle = {'header':session_files.session_header(current_model), 'arrays':{}}
+    try:
+      for name, array in session_files.session_arrays(current_model).items():
+        array = np.asarray(array)
+        #Shared memory blocks can't be empty, so an empty array still gets one byte.
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        self.handle['arrays'][name] = {'block':block.name, 'dtype':array.dtype.str, 'shape':list(array.shape)}
+    except:
+      self.close()
+      raise
+
+  def close(self):
+    self.finalizer()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
+
+
+def release_blocks(blocks):
+  for block in blocks:
+    try:
+      block.close()
+      block.unlink()
+    except:
+      pass
+  del blocks[:]
+
+
+#Attaches to the blocks of a shared_dataset (given its handle) and rebuilds the model around them.
+#Returns the model and the attached blocks, which must be kept open for as long as the model is used.
+def attach(handle):
+  blocks, arrays = [], {}
+  try:
+    for name, layout in handle['arrays'].items():
+      block = shared_memory.SharedMemory(name=layout['block'])
+      blocks.append(block)
+      array = np.ndarray(tuple(layout['shape']), dtype=np.dtype(layout['dtype']), buffer=block.buf)
+      array.flags.writeable = False
+      arrays[name] = array
+    return session_files.restore_model(handle['header'], arrays), blocks
+  except:
+    for block in blocks:
+      block.close()
+    raise
+
+
+#Runs once in each worker process of the pool made by shared_executor.
+def attach_worker(handle):
+  worker_state['model'], worker_state['blocks'] = attach(handle)
+
+
+#The model attached by this worker process.
+def worker_model():
+  return worker_state['model']
+
+
+#A pool of worker processes, each of which attaches to the shared dataset when it starts.
+def shared_executor(shared, num_workers=None):
+  return ProcessPoolExecutor(max_workers=num_workers, initializer=attach_worker, initargs=(shared.handle,))
+
+
+#Calls function on each of the tasks across a pool of worker processes attached to the shared dataset
+#and returns the results in order. If anything goes wrong (or the user interrupts the job), the tasks
+#that haven't started yet are cancelled and the workers shut down before the error is passed on, so
+#the caller can free the shared dataset straight away.
+def map_shared(shared, function, tasks, num_workers=None):
+  executor = shared_executor(shared, num_workers)
+  try:
+    return list(executor.map(function, tasks,
+                             chunksize=max(1, len(tasks) // (4 * (num_workers or os.cpu_count() or 1)))))
+  finally:
+    executor.shutdown(wait=True, cancel_futures=True)
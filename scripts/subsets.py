@@ -0,0 +1,130 @@
+import numpy as np, re
+
+#Microbiologists often want to refit on a subset of their isolates -- one body site, one region,
+#the isolates collected after a given year -- rather than on the whole dataset. The subset is
+#chosen with a filter built from conditions on the metadata columns and the collection date, e.g.
+#  site=blood AND date>=2018-01-01
+#  region=north OR region=east
+#  lab!=central
+#Conditions are joined with AND and OR (AND binds tighter, so "a AND b OR c" means "(a AND b) OR c"),
+#metadata conditions use = or !=, and date conditions any of =, !=, <, <=, > and >=.
+#To make filtering fast however many times the user changes the filter, we keep a bitmap index of
+#the metadata: for every value of every metadata column, a packed array with one bit per isolate
+#that is set if the isolate has that value. Each metadata condition is then just one of these
+#bitmaps (or its complement), and combining conditions is a bitwise AND or OR over n/8 bytes.
+#The index is built the first time a filter is used and rebuilt only if isolates are added.
+
+DATE_COLUMN_NAMES = ['date', 'collection date', 'collection_date']
+CONDITION_PATTERN = re.compile(r'^\s*(.+?)\s*(>=|<=|!=|=|>|<)\s*(.+?)\s*$')
+
+
+class metadata_index():
+
+  def __init__(self, metadata_codes, metadata_categories):
+    self.num_rows = metadata_codes.shape[0]
+    self.bitmaps = [[np.packbits(metadata_codes[:,j] == code) for code in range(0, len(categories))]
+                    for j, categories in enumerate(metadata_categories)]
+
+
+#Splits a filter into the groups of conditions joined by OR, each of which is a list of the
+#conditions joined by AND. Raises a ValueError with a message for the user if the filter can't be read.
+def parse_filter(filter_expression):
+  groups = []
+  for group_text in re.split(r'\s+OR\s+', filter_expression.strip(), flags=re.IGNORECASE):
+    group = []
+    for condition_text in re.split(r'\s+AND\s+', group_text, flags=re.IGNORECASE):
+      condition = CONDITION_PATTERN.match(condition_text)
+      if condition is None:
+        raise ValueError("'%s' is not a valid condition. Conditions should look like site=blood or "
+                         "date>=2018-01-01."%condition_text.strip())
+      group.append(condition.groups())
+    groups.append(group)
+  return groups
+
+
+#Returns a boolean array with one entry per isolate saying whether it passes the filter. If rows
+#is given, only the isolates at those positions are checked (this is used for newly appended rows,
+#for which there is no point in rebuilding the bitmap index); otherwise all of them are, using the
+#bitmap index. Raises a ValueError with a message for the user if the filter is not valid.
+def evaluate_filter(current_model, filter_expression, rows=None):
+  groups = parse_filter(filter_expression)
+  if rows is None:
+    num_rows = current_model.current_dataset['mics'].shape[0]
+    index = get_metadata_index(current_model)
+  else:
+    num_rows = rows.shape[0]
+    index = None
+  result = None
+  for group in groups:
+    group_result = None
+    for column_name, operator, value in group:
+      condition_result = condition_bitmap(current_model, index, rows, num_rows, column_name, operator, value)
+      group_result = condition_result if group_result is None else group_result & condition_result
+    result = group_result if result is None else result | group_result
+  return np.unpackbits(result, count=num_rows).astype(bool)
+
+
+#The packed bitmap of the isolates that satisfy a single condition.
+def condition_bitmap(current_model, index, rows, num_rows, column_name, operator, value):
+  if column_name.lower() in DATE_COLUMN_NAMES:
+    if current_model.current_dataset['dates'] is None:
+      raise ValueError("Your dataset doesn't have a collection date column, so it can't be filtered by date.")
+    try:
+      date = current_model.parse_date(value)
+    except:
+      raise ValueError("'%s' is not a valid date. Dates should be written YYYY-MM-DD, YYYY-MM or YYYY."%value)
+    dates = current_model.current_dataset['dates']
+    if rows is not None:
+      dates = dates[rows]
+    comparisons = {'=':np.equal, '!=':np.not_equal, '<':np.less, '<=':np.less_equal, '>':np.greater,
+                   '>=':np.greater_equal}
+    return np.packbits(comparisons[operator](dates, date))
+  #The 'meta:' prefix from the header row is optional.
+  if column_name.lower().startswith('meta:'):
+    column_name = column_name[5:].strip()
+  column_names = [name.lower() for name in current_model.metadata_names]
+  if column_name.lower() not in column_names:
+    raise ValueError("Your dataset doesn't have a column called '%s'. The columns you can filter on are: %s."%(
+                     column_name, ', '.join(current_model.metadata_names +
+                                            (['date'] if current_model.current_dataset['dates'] is not None else []))))
+  if operator not in ['=', '!=']:
+    raise ValueError("Only = and != can be used with the '%s' column."%column_name)
+  j = column_names.index(column_name.lower())
+  categories = current_model.metadata_categories[j]
+  if value not in categories:
+    bitmap = np.zeros(-(-num_rows // 8), dtype=np.uint8)
+  elif rows is None:
+    bitmap = index.bitmaps[j][categories.index(value)]
+  else:
+    bitmap = np.packbits(current_model.current_dataset['metadata'][rows,j] == categories.index(value))
+  if operator == '!=':
+    return ~bitmap
+  return bitmap
+
+
+#Returns the bitmap index of current_model's metadata, building it if the data has changed since it
+#was last built.
+def get_metadata_index(current_model):
+  if current_model.metadata_index_key != current_model.data_version:
+    metadata_codes = current_model.current_dataset.get('metadata')
+    if metadata_codes is None:
+      metadata_codes = np.zeros((current_model.current_dataset['mics'].shape[0], 0), dtype=np.int32)
+    current_model.metadata_index = metadata_index(metadata_codes, current_model.metadata_categories)
+    current_model.metadata_index_key = current_model.data_version
+  return current_model.metadata_index
+
+
+#Splits a filter into the filters for each of the values of a metadata column (the column name is
+#not case sensitive), so that each value can be fit or reported on separately. Returns the list of
+#(value, filter) pairs. Raises a ValueError if there is no such column.
+def group_filters(current_model, column_name, filter_expression=''):
+  column_names = [name.lower() for name in current_model.metadata_names]
+  if column_name.lower() not in column_names:
+    raise ValueError("Your dataset doesn't have a metadata column called '%s'."%column_name)
+  name = current_model.metadata_names[column_names.index(column_name.lower())]
+  categories = current_model.metadata_categories[column_names.index(column_name.lower())]
+  if filter_expression.strip() == '':
+    return [(value, '%s=%s'%(name, value)) for value in categories]
+  #Since AND binds tighter than OR, the group condition has to be added to each OR group.
+  groups = re.split(r'\s+OR\s+', filter_expression.strip(), flags=re.IGNORECASE)
+  return [(value, ' OR '.join(['%s AND %s=%s'%(group, name, value) for group in groups])) for value in categories]
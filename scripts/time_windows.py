@@ -0,0 +1,126 @@
+import numpy as np, csv
+import model_core
+
+#Microbiologists want to know whether the optimal disk cutoffs drift over the years of
+#surveillance data. If the dataset has a collection date column, the functions here refit
+#the data for a series of time windows and report the cutoffs and error rates for each.
+#Rather than re-counting the isolates in each window from scratch, we sort the isolates
+#by date once and slide a count table along them (see count_tables.py), adding the isolates
+#that enter the window and removing the ones that leave it at each step. So the total
+#cost is one pass over the data plus one (cheap) refit of the count table per window.
+
+
+#Fits each window of window_days days, starting from the earliest collection date and moving
+#forward by step_days at a time, until the window reaches the most recent date. If expanding
+#is True, every window starts from the earliest date instead (so each window contains all of
+#the data collected up to its end date). Returns an error message ('0' if there was no
+#error) and the time series, which is a list with one dictionary per window.
+def rolling_window_fit(current_model, window_days, step_days, expanding=False):
+  if current_model.current_dataset['mics'] is None:
+    return ("You want to analyze time windows but you haven't loaded any data? "
+            "Try loading some first. Now there's an idea!"), []
+  if current_model.current_dataset['dates'] is None:
+    return ("Your dataset doesn't have a collection date column, so it can't be split into time windows. "
+            "Add a header row with a column named 'date' to your csv file and try again."), []
+  try:
+    window_days, step_days = int(window_days), int(step_days)
+    miccutoffS = float(current_model.ycutoffS)
+    miccutoffR = float(current_model.ycutoffR)
+  except:
+    return "The window size, step size or MIC breakpoints you have entered are not valid numbers. Try again.", []
+  if window_days < 1 or step_days < 1:
+    return "The window size and step size must be at least one day. Try again.", []
+
+  #If the user has selected a subset of the isolates, only those are included.
+  dates = current_model.current_dataset['dates'].astype(np.int64)
+  date_order = np.argsort(dates, kind='stable')
+  if current_model.subset_mask is not None:
+    date_order = date_order[current_model.subset_mask[date_order]]
+  dates = dates[date_order]
+  if dates.shape[0] == 0:
+    return "Your dataset doesn't contain any isolates, so there are no time windows to fit. Load some data first!", []
+  window_table = current_model.count_table.empty_copy()
+  #Only the selected disk column is refit for each window, but the cells are found for all of
+  #them so the window table has the same layout as the model's.
+  cells = window_table.cell_indices(current_model.current_dataset['mics'][date_order],
+                                    current_model.current_dataset['disk_columns'][date_order])
+  weights = current_model.isolate_weights(date_order)
+  engine = model_core.new_engine(current_model.model_type)
+
+  time_series = []
+  lower_index, upper_index = 0, 0
+  window_number = 0
+  while True:
+    window_end = dates[0] + window_number * step_days + window_days
+    if expanding:
+      window_start = dates[0]
+    else:
+      window_start = window_end - window_days
+    new_lower_index = np.searchsorted(dates, window_start, side='left')
+    new_upper_index = np.searchsorted(dates, window_end, side='left')
+    #Add the isolates that have entered the window before removing the ones that have left it,
+    #so that this also works if the step is longer than the window.
+    window_table.add_cells(cells[upper_index:new_upper_index], window_slice(weights, upper_index, new_upper_index))
+    window_table.remove_cells(cells[lower_index:new_lower_index], window_slice(weights, lower_index, new_lower_index))
+    lower_index, upper_index = new_lower_index, new_upper_index
+    time_series.append(fit_window(current_model, window_table, engine, miccutoffS, miccutoffR,
+                                  window_start, window_end))
+    if window_end > dates[-1]:
+      break
+    window_number += 1
+  return '0', time_series
+
+
+def window_slice(weights, start, end):
+  if weights is None:
+    return None
+  return weights[start:end]
+
+
+#Fits the isolates in a single window and calculates the error rates at the fitted cutoffs.
+#If the window can't be fit (e.g. there are no resistant strains in it) the cutoffs and error
+#rates are left blank. As for fit_data, MIC vs MIC data isn't fit; the cutoffs are just
+#the MIC breakpoints.
+def fit_window(current_model, window_table, engine, miccutoffS, miccutoffR, window_start, window_end):
+  window = {'window start':np.datetime64(int(window_start), 'D'),
+            'window end':np.datetime64(int(window_end) - 1, 'D'),
+            'num_strains':window_table.num_strains().item(), 'disk cutoff R':None,
+            'disk cutoff S':None, 'tied optimal cutoffs':'',
+            'very major errors (%)':None, 'major errors (%)':None, 'minor errors (%)':None}
+  if current_model.mic_vs_mic:
+    xcutoffR, xcutoffS = miccutoffR, miccutoffS
+  else:
+    disk_values, class_counts = window_table.class_counts(miccutoffS, miccutoffR)
+    class_counts = class_counts[current_model.active_disk_column]
+    category_totals = class_counts.sum(axis=0)
+    if category_totals[2] == 0 or category_totals[0] == 0:
+      return window
+    engine.fit_disk_counts(disk_values, class_counts)
+    xcutoffR, xcutoffS = float(engine.cutoff_R), float(engine.cutoff_S)
+    if len(engine.tied_optima) > 1:
+      window['tied optimal cutoffs'] = ' '.join(['%s/%s'%(cutoff_R, cutoff_S) for cutoff_R, cutoff_S in engine.tied_optima])
+  if window['num_strains'] == 0:
+    return window
+  window['disk cutoff R'], window['disk cutoff S'] = xcutoffR, xcutoffS
+  error_counts = window_table.tabulate_errors(miccutoffS, miccutoffR, xcutoffS, xcutoffR,
+                                              current_model.mic_vs_mic,
+                                              current_model.active_disk_column)['error_counts']
+  for error_type in ['very major errors', 'major errors', 'minor errors']:
+    window[error_type + ' (%)'] = round(100 * error_counts[error_type] / error_counts['num_strains'], 2)
+  return window
+
+
+#Writes the time series generated by rolling_window_fit to a csv file, one row per window.
+def export_time_series(time_series, filename):
+  columns = ['window start', 'window end', 'num_strains', 'disk cutoff R', 'disk cutoff S',
+             'very major errors (%)', 'major errors (%)', 'minor errors (%)', 'tied optimal cutoffs']
+  try:
+    with open(filename, 'w', newline='') as output_file:
+      writer = csv.writer(output_file)
+      writer.writerow(columns)
+      writer.writerows([['' if window[column] is None else str(window[column]) for column in columns]
+                        for window in time_series])
+  except:
+    return ("The time series could not be exported. The program is trying to write to a file called '%s'. "
+            "Make sure that you don't have a file by this name already open."%filename)
+  return '0'
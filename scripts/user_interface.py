@@ -1,7 +1,12 @@
+import os
 from PyQt5 import QtCore
+from PyQt5.QtCore import QFileSystemWatcher
 from PyQt5.QtWidgets import QLabel, QWidget, QPushButton, QVBoxLayout, QMainWindow
-from PyQt5.QtWidgets import QFileDialog, QLineEdit, QHBoxLayout, QCheckBox, QComboBox
-import disk_plotting, data_processing, data_export, model_object, alerts
+from PyQt5.QtWidgets import QFileDialog, QLineEdit, QHBoxLayout, QCheckBox, QComboBox, QInputDialog
+from PyQt5.QtWidgets import QToolTip, QDialog, QTableWidget, QTableWidgetItem
+from PyQt5.QtGui import QCursor
+import disk_plotting, data_processing, data_export, model_object, model_core, alerts, time_windows, session_files
+import workspace, cell_index, workbook_export
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
@@ -15,11 +20,20 @@ class main_window(QMainWindow):
 
   def __init__(self):
     super().__init__()
+    #curr_model is the dataset currently shown; the workspace holds all of the datasets the user
+    #has imported (see workspace.py).
     self.curr_model = model_object.model_parameter_set()
+    self.workspace = workspace.analysis_workspace()
+    self.comparison_windows = []
 
     self.central_plot = Figure()
     self.canvas = FigureCanvas(self.central_plot)
     self.toolbar = NavigationToolbar(self.canvas, self)
+    #Pointing at a square of the heatmap shows how many isolates are in it and how many of them are
+    #errors; clicking on it lists the isolates.
+    self.canvas.mpl_connect('motion_notify_event', self.show_cell_tooltip)
+    self.canvas.mpl_connect('button_press_event', self.show_cell_isolates)
+    self.isolate_windows = []
     
     #In this next part, we're just building the interface by adding box layouts
     #and adding widgets to each box layout to get the overall layout we want.
@@ -29,7 +43,7 @@ class main_window(QMainWindow):
     self.resize(950,600)
     mainlayout = QVBoxLayout(self.central_widget)
     main_controls = QHBoxLayout()
-    horiz_layouts = [QHBoxLayout() for i in range(0,7)]
+    horiz_layouts = [QHBoxLayout() for i in range(0,8)]
 
     mainlayout.addWidget(self.toolbar)
     mainlayout.addWidget(self.canvas)
@@ -50,6 +64,40 @@ class main_window(QMainWindow):
     main_controls.addWidget(export_button)
     export_button.clicked.connect(self.export_results)
 
+    ###Isolates often arrive a few at a time, so the user can also add rows to the current dataset
+    #without re-importing everything, either from another csv file or by watching the file they imported.
+    append_button = QPushButton('Append data')
+    main_controls.addWidget(append_button)
+    append_button.clicked.connect(self.append_file)
+
+    self.watch_checkbox = QCheckBox('Watch file for new isolates', self)
+    self.watch_checkbox.stateChanged.connect(self.watch_file)
+    main_controls.addWidget(self.watch_checkbox)
+    #If the dataset has collection dates, the user can refit it over a series of time windows to see
+    #whether the optimal cutoffs drift over time.
+    time_window_button = QPushButton('Time windows')
+    main_controls.addWidget(time_window_button)
+    time_window_button.clicked.connect(self.time_window_analysis)
+
+    #Sessions save the whole analysis (data, breakpoints, cutoffs, options) so it can be reopened
+    #later without re-importing and refitting.
+    save_session_button = QPushButton('Save session')
+    main_controls.addWidget(save_session_button)
+    save_session_button.clicked.connect(self.save_session)
+
+    open_session_button = QPushButton('Open session')
+    main_controls.addWidget(open_session_button)
+    open_session_button.clicked.connect(self.open_session)
+
+    export_surface_button = QPushButton('Export score surface')
+    main_controls.addWidget(export_surface_button)
+    export_surface_button.clicked.connect(self.export_score_surface)
+
+    self.file_watcher = QFileSystemWatcher()
+    self.file_watcher.fileChanged.connect(self.check_watched_file)
+    #Only refit automatically once the user has fit/plotted the data at least once.
+    self.has_been_plotted = False
+
     ###Now add text boxes user can add to modify the MIC breakpoints. These are stacked next to each other
 
     self.susceptibility_label = QLabel('Susceptibility breakpoint (<=, mg/L)')
@@ -70,7 +118,8 @@ class main_window(QMainWindow):
     #Here's where the user can select the type of model they will use to fit, and the coloring scheme they
     #want for the plot.
     self.regression_type = QComboBox()
-    self.regression_type.addItem("min gini impurity")
+    for engine_name in model_core.engine_names:
+      self.regression_type.addItem(engine_name)
     self.regression_type.activated[str].connect(self.change_regression_type)
     horiz_layouts[2].addWidget(self.regression_type)
 
@@ -81,6 +130,13 @@ class main_window(QMainWindow):
     self.color_palette.activated[str].connect(self.change_color_palette)
     horiz_layouts[2].addWidget(self.color_palette)
 
+    #If the dataset has more than one disk column (e.g. several disk potencies), this selects
+    #the one shown in the heatmap and set by the disk cutoff boxes. All of them are fit.
+    self.disk_column = QComboBox()
+    self.disk_column.addItem('Disk')
+    self.disk_column.activated[int].connect(self.select_disk_column)
+    horiz_layouts[2].addWidget(self.disk_column)
+
 
     ##Now add text boxes user can add to modify the disk cutoffs if desired, after a checkbox to indicate
     #whether or not manual cutoffs should override.
@@ -95,6 +151,11 @@ class main_window(QMainWindow):
     self.mic_vs_mic_checkbox.stateChanged.connect(self.mic_vs_mic_data)
     horiz_layouts[3].addWidget(self.mic_vs_mic_checkbox)
 
+    #Shows the score of every pair of cutoffs tried during fitting next to the heatmap.
+    self.score_surface_checkbox = QCheckBox('Show score surface', self)
+    self.score_surface_checkbox.stateChanged.connect(self.show_score_surface)
+    horiz_layouts[3].addWidget(self.score_surface_checkbox)
+
     #The user-specified resistance and susceptible cutoffs and their somewhat arbitrary defaults.
     self.diskR_label = QLabel('Resistance disk cutoff (<=, mm)')
     horiz_layouts[4].addWidget(self.diskR_label)
@@ -118,6 +179,27 @@ class main_window(QMainWindow):
     self.strain_name_input.textChanged.connect(self.strain_name_change)
     horiz_layouts[6].addWidget(self.strain_name_input)
 
+    #Every imported dataset stays loaded, so the user can switch between them, or compare them
+    #side by side, without re-importing or refitting.
+    horiz_layouts[7].addWidget(QLabel('Dataset:'))
+    self.dataset_list = QComboBox()
+    self.dataset_list.activated[int].connect(self.select_dataset)
+    horiz_layouts[7].addWidget(self.dataset_list)
+    close_dataset_button = QPushButton('Close dataset')
+    horiz_layouts[7].addWidget(close_dataset_button)
+    close_dataset_button.clicked.connect(self.close_dataset)
+    compare_button = QPushButton('Compare datasets')
+    horiz_layouts[7].addWidget(compare_button)
+    compare_button.clicked.connect(self.compare_datasets)
+    export_all_button = QPushButton('Export all datasets')
+    horiz_layouts[7].addWidget(export_all_button)
+    export_all_button.clicked.connect(self.export_all_datasets)
+    #Restricts the fit, plot and error table to the isolates selected by a filter on the metadata
+    #columns and collection date (see subsets.py).
+    subset_button = QPushButton('Select subset')
+    horiz_layouts[7].addWidget(subset_button)
+    subset_button.clicked.connect(self.select_subset)
+
     mainlayout.addLayout(main_controls)
     for horiz_layout in horiz_layouts:
         mainlayout.addLayout(horiz_layout)
@@ -128,11 +210,10 @@ class main_window(QMainWindow):
   def strain_name_change(self, text):
     self.curr_model.strain_name = text
 
-  #Currently there is only one model type available; this function
-  #is here in case we ever add another...
+  #Each fitting algorithm has its own model_engine (see model_core.py). Changing the algorithm
+  #takes effect the next time the user clicks "Fit/Plot data".
   def change_regression_type(self, text):
-    if text == 'min gini model':
-      self.curr_model.model_type = 'mgm'
+    self.curr_model.set_model_type(model_core.engine_names[text])
 
   def change_color_palette(self, text):
     if text == 'Blue Palette':
@@ -142,7 +223,8 @@ class main_window(QMainWindow):
     elif text == 'Green Palette':
       self.curr_model.colormap_type = 'continuous_green'
 
-  #If loading a file, call the load_dataset method of class model_parameter_set.
+  #If loading a file, add it to the workspace as a new dataset (with the same settings as the current
+  #one), which calls the load_dataset method of class model_parameter_set.
   #If it finds a problem with the file passed to it, it will return a non-'0' error code.
   #The sudden death function (defined in alerts.py) prints
   #a message box with the error message passed to it and is used for error handling
@@ -152,9 +234,170 @@ class main_window(QMainWindow):
     filename, _ = QFileDialog.getOpenFileName(self,"Load File",
             "","CSV Files (*.csv);;", options=options)
     if filename:
-      error_code = self.curr_model.load_dataset(filename)
+      error_code = self.workspace.add_dataset(filename, self.curr_model)
+      if error_code != '0':
+        alerts.sudden_death(error_code)
+        return
+      self.select_dataset(self.workspace.active)
+
+  #Makes one of the datasets in the workspace the current one, updating the input boxes to its
+  #settings and redrawing its plot from its cached fit (if it has been fit already).
+  def select_dataset(self, index):
+    self.curr_model = self.workspace.select(index)
+    self.update_dataset_list()
+    self.update_widgets_from_model()
+    self.update_disk_column_list()
+    self.has_been_plotted = self.workspace.is_fit(index)
+    if self.watch_checkbox.isChecked():
+      self.watch_file(QtCore.Qt.Checked)
+    if self.has_been_plotted:
+      output_code = disk_plotting.gen_plot(self)
+      if output_code != '0':
+        alerts.sudden_death(output_code)
+    else:
+      self.central_plot.clf()
+      self.canvas.draw()
+
+  def update_dataset_list(self):
+    self.dataset_list.clear()
+    for name in self.workspace.names:
+      self.dataset_list.addItem(name)
+    if self.workspace.active is not None:
+      self.dataset_list.setCurrentIndex(self.workspace.active)
+
+  #Removes the current dataset from the workspace and switches to the previous one. If it was the
+  #last one, start over with an empty model that keeps the current settings.
+  def close_dataset(self):
+    if self.workspace.active is None:
+      return
+    self.workspace.remove_dataset(self.workspace.active)
+    if self.workspace.active is not None:
+      self.select_dataset(self.workspace.active)
+      return
+    empty_model = model_object.model_parameter_set()
+    for attribute in workspace.SHARED_SETTINGS:
+      setattr(empty_model, attribute, getattr(self.curr_model, attribute))
+    empty_model.set_model_type(empty_model.model_type)
+    self.curr_model = empty_model
+    self.has_been_plotted = False
+    self.update_dataset_list()
+    self.update_disk_column_list()
+    self.watch_file(QtCore.Qt.Unchecked)
+    self.central_plot.clf()
+    self.canvas.draw()
+
+  #Asks the user for a filter and refits on the isolates it selects (or on all of them if the
+  #filter is left blank).
+  def select_subset(self):
+    if self.curr_model.current_dataset['mics'] is None:
+      alerts.sudden_death("You want to select a subset of your data but you haven't loaded any? Try loading some first. "
+                          "Now there's an idea!")
+      return
+    columns = self.curr_model.metadata_names + (['date'] if self.curr_model.current_dataset['dates'] is not None else [])
+    if len(columns) == 0:
+      alerts.sudden_death("Your dataset doesn't have any metadata or collection date columns to select a subset with. "
+                          "Add a header row naming them to your csv file and try again.")
+      return
+    filter_expression, ok = QInputDialog.getText(self, 'Select subset',
+                                                 'Only use the isolates matching (e.g. site=blood AND date>=2018-01-01; '
+                                                 'leave blank to use all of them).\nColumns: %s'%', '.join(columns),
+                                                 QLineEdit.Normal, self.curr_model.subset_filter)
+    if not ok:
+      return
+    error_code = self.curr_model.set_subset_filter(filter_expression)
+    if error_code != '0':
+      alerts.sudden_death(error_code)
+      return
+    if self.has_been_plotted:
+      self.fit_data()
+
+  #Fits any datasets that haven't been fit with their current settings yet and draws all of them
+  #side by side in a separate window. Datasets that can't be fit are left out.
+  def compare_datasets(self):
+    if len(self.workspace.models) < 2:
+      alerts.sudden_death("You want to compare datasets but you have fewer than two loaded? Import some more first. "
+                          "Now there's an idea!")
+      return
+    fit_messages = self.workspace.fit_all()
+    models, names, problems = [], [], []
+    for current_model, name, fit_message in zip(self.workspace.models, self.workspace.names, fit_messages):
+      if fit_message == '0' or fit_message.startswith('!'):
+        models.append(current_model)
+        names.append(name)
+      else:
+        problems.append('%s: %s'%(name, fit_message))
+    if len(problems) > 0:
+      alerts.non_fatal_message('The following datasets could not be fit and have been left out of the '
+                               'comparison:\n\n%s'%'\n\n'.join(problems))
+    if len(models) == 0:
+      return
+    window = comparison_window()
+    output_code = window.draw_datasets(models, names)
+    if output_code != '0':
+      alerts.sudden_death(output_code)
+      return
+    #Keep a reference, otherwise the window would be garbage collected as soon as we return.
+    self.comparison_windows = [w for w in self.comparison_windows if w.isVisible()] + [window]
+
+  #Exports the results of every loaded dataset to a single workbook (see workbook_export.py), fitting
+  #any that have changed since they were last fit.
+  def export_all_datasets(self):
+    if len(self.workspace.models) == 0:
+      alerts.sudden_death("You want to export data but you haven't loaded any? Try loading some first. Now there's an idea!")
+      return
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getSaveFileName(self,"Save File",
+            "","Excel Workbooks (*.xlsx);;Zipped CSV Files (*.zip);;", options=options)
+    if filename:
+      fit_messages = self.workspace.fit_all()
+      error_code = workbook_export.export_workbook(zip(self.workspace.names, self.workspace.models, fit_messages), filename)
       if error_code != '0':
         alerts.sudden_death(error_code)
+        return
+      alerts.non_fatal_message('The results for %s datasets have been exported to "%s" .'%(len(self.workspace.models), filename))
+
+  #Adds the isolates in another csv file to the current dataset. If the data has already been
+  #plotted, refit and replot right away so the user can see the effect of the new isolates.
+  def append_file(self):
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getOpenFileName(self,"Append File",
+            "","CSV Files (*.csv);;", options=options)
+    if filename:
+      error_code = self.curr_model.append_dataset(filename)
+      if error_code != '0':
+        alerts.sudden_death(error_code)
+        return
+      if self.has_been_plotted:
+        self.fit_data()
+
+  #While the box is checked, whenever the file the data was imported from changes, any new rows
+  #are appended to the dataset and the fit and plot are updated.
+  def watch_file(self, state):
+    if len(self.file_watcher.files()) > 0:
+      self.file_watcher.removePaths(self.file_watcher.files())
+    if state == QtCore.Qt.Checked and self.curr_model.source_filename is not None:
+      self.file_watcher.addPath(self.curr_model.source_filename)
+
+  def check_watched_file(self, path):
+    #If reloading the file failed last time, there is no data left to add to.
+    if self.curr_model.current_dataset['mics'] is None:
+      self.watch_checkbox.setChecked(False)
+      return
+    num_strains = len(self.curr_model.current_dataset['mics'])
+    error_code = self.curr_model.append_new_rows_from_file()
+    #Some editors save a file by replacing it, in which case the watcher stops
+    #following it, so add it back.
+    if path not in self.file_watcher.files() and self.curr_model.source_filename is not None:
+      self.file_watcher.addPath(self.curr_model.source_filename)
+    if error_code != '0':
+      #The file shrank and couldn't be reloaded, so the dataset is gone and there is nothing left to watch.
+      if self.curr_model.current_dataset['mics'] is None:
+        self.watch_checkbox.setChecked(False)
+      alerts.sudden_death(error_code)
+      return
+    if self.has_been_plotted:
+      if len(self.curr_model.current_dataset['mics']) != num_strains:
+        self.fit_data()
 
 
 
@@ -164,16 +407,20 @@ class main_window(QMainWindow):
   #For cases where no fitting is required (MIC vs MIC data, user-specified cutoffs) it will make no changes
   #to the cutoffs and return '0' so that we can proceed to data plotting.
   def fit_data(self):
-    output_code = data_processing.fit_data(self.curr_model)
+    if self.workspace.active is None:
+      output_code = data_processing.fit_data(self.curr_model)
+    else:
+      output_code = self.workspace.fit_dataset(self.workspace.active)
         
-    #If it was possible to fit using several different window sizes, the fitting function will return a
-    #code starting with !. This is not an error, just an informational message. The end user asked
-    #that the program make them aware whenever this occurred.
+    #If several pairs of cutoffs fit the data equally well, the fitting function will return a
+    #code starting with ! followed by the list of them. This is not an error, just an informational
+    #message. The end user asked that the program make them aware whenever this occurred.
     if output_code.startswith('!'):
-      window_sizes = output_code.split('!, ')[1]
-      alerts.non_fatal_message('It was possible to fit the data using intermediate disk zone sizes of '
-                           '%s mm. The program has defaulted to the smallest window size possible.'
-                           %window_sizes)
+      tied_cutoffs = output_code.split('!, ')[1]
+      alerts.non_fatal_message('It was possible to fit the data equally well using any of the following disk cutoffs (mm): '
+                           '%s. The program has defaulted to the smallest intermediate zone possible (and, for that '
+                           'zone size, the largest cutoffs). Check "Show score surface" to see how the fit '
+                           'score varies with the cutoffs.'%tied_cutoffs)
     #If neither ! nor 0, the fitting function returned an error, tell the user what it is.
     elif output_code != '0':
       alerts.sudden_death(output_code)
@@ -187,6 +434,7 @@ class main_window(QMainWindow):
     if output_code != '0':
       alerts.sudden_death(output_code)
       return
+    self.has_been_plotted = True
     
 
 
@@ -222,6 +470,14 @@ class main_window(QMainWindow):
     else:
       self.curr_model.use_user_defined_disk_cutoffs = False
 
+  #Redraws the plot with or without the score surface panel (no refitting needed).
+  def show_score_surface(self, state):
+    self.curr_model.show_score_surface = (state == QtCore.Qt.Checked)
+    if self.has_been_plotted:
+      output_code = disk_plotting.gen_plot(self)
+      if output_code != '0':
+        alerts.sudden_death(output_code)
+
   #Because of how susceptibility and resistance are defined differently for disks vs MICs, if the user selects
   #MIC vs MIC, we need to change the labels on the cutoff boxes. Same in reverse if they indicate they are
   #loading disk data by unchecking the MIC vs MIC box.
@@ -241,6 +497,166 @@ class main_window(QMainWindow):
       self.diskS_label.setText('Susceptibility disk cutoff(>=, mm)')
       self.diskR_label.setText('Resistance disk cutoff (<=, mm)')
 
+  #Asks the user for the window and step sizes, refits every window (see time_windows.py)
+  #and saves the resulting time series of cutoffs and error rates to a csv file.
+  def time_window_analysis(self):
+    window_days, ok = QInputDialog.getInt(self, 'Time windows', 'Window length (days):', 365, 1, 36500)
+    if not ok:
+      return
+    step_days, ok = QInputDialog.getInt(self, 'Time windows', 'Step between windows (days):', 90, 1, 36500)
+    if not ok:
+      return
+    window_type, ok = QInputDialog.getItem(self, 'Time windows', 'Window type:',
+                                           ['Rolling', 'Expanding'], 0, False)
+    if not ok:
+      return
+    error_code, time_series = time_windows.rolling_window_fit(self.curr_model, window_days, step_days,
+                                                              window_type == 'Expanding')
+    if error_code != '0':
+      alerts.sudden_death(error_code)
+      return
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getSaveFileName(self,"Save File",
+            "","CSV Files (*.csv);;", options=options)
+    if filename:
+      error_code = time_windows.export_time_series(time_series, filename)
+      if error_code != '0':
+        alerts.sudden_death(error_code)
+        return
+      alerts.non_fatal_message('The cutoffs and error rates for %s time windows have been exported to '
+                               'a csv file entitled "%s" .'%(len(time_series), filename))
+
+  def save_session(self):
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getSaveFileName(self,"Save Session",
+            "","Disk Fitter Sessions (*.dfs);;", options=options)
+    if filename:
+      error_code = session_files.save_session(self.curr_model, filename)
+      if error_code != '0':
+        alerts.sudden_death(error_code)
+        return
+      alerts.non_fatal_message('Your session has been saved to a file entitled "%s" .'%filename)
+
+  #Replaces the current model with the one stored in a session file, updates all of the
+  #input boxes to match and redraws the plot using the saved cutoffs (no refitting needed).
+  def open_session(self):
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getOpenFileName(self,"Open Session",
+            "","Disk Fitter Sessions (*.dfs);;", options=options)
+    if not filename:
+      return
+    error_code, restored_model = session_files.load_session(filename)
+    if error_code != '0':
+      alerts.sudden_death(error_code)
+      return
+    #The session already contains the fit, so the workspace doesn't need to refit it.
+    self.workspace.add_model(os.path.splitext(os.path.basename(filename))[0], restored_model, '0')
+    self.select_dataset(self.workspace.active)
+
+  #Sets the text boxes, checkboxes and combo boxes to the values stored in self.curr_model.
+  #Signals are blocked while doing so, since otherwise e.g. checking the MIC vs MIC box would
+  #pop up the message explaining what MIC vs MIC mode is.
+  def update_widgets_from_model(self):
+    widgets = [self.susceptibility_breakpoint, self.resistance_breakpoint, self.diskS_breakpoint,
+               self.diskR_breakpoint, self.strain_name_input, self.manual_override,
+               self.mic_vs_mic_checkbox, self.color_palette, self.regression_type,
+               self.score_surface_checkbox]
+    for widget in widgets:
+      widget.blockSignals(True)
+    self.susceptibility_breakpoint.setText(str(self.curr_model.ycutoffS))
+    self.resistance_breakpoint.setText(str(self.curr_model.ycutoffR))
+    self.diskS_breakpoint.setText(str(self.curr_model.xcutoffS))
+    self.diskR_breakpoint.setText(str(self.curr_model.xcutoffR))
+    self.strain_name_input.setText(self.curr_model.strain_name)
+    self.manual_override.setChecked(self.curr_model.use_user_defined_disk_cutoffs)
+    self.mic_vs_mic_checkbox.setChecked(self.curr_model.mic_vs_mic)
+    self.score_surface_checkbox.setChecked(self.curr_model.show_score_surface)
+    if self.curr_model.mic_vs_mic:
+      self.diskS_label.setText('Susceptibility cutoff (<=, mg/L)')
+      self.diskR_label.setText('Resistance cutoff (>=, mg/L)')
+    else:
+      self.diskS_label.setText('Susceptibility disk cutoff(>=, mm)')
+      self.diskR_label.setText('Resistance disk cutoff (<=, mm)')
+    palettes = {'christmas_colors':'Christmas Colors', 'continuous_blue':'Blue Palette',
+                'continuous_green':'Green Palette'}
+    self.color_palette.setCurrentText(palettes[self.curr_model.colormap_type])
+    for engine_name, model_type in model_core.engine_names.items():
+      if model_type == self.curr_model.model_type:
+        self.regression_type.setCurrentText(engine_name)
+    for widget in widgets:
+      widget.blockSignals(False)
+
+  #Returns the cell_index for the heatmap and the (x bin, y bin) of the heatmap cell under the mouse, or
+  #None, None if the mouse isn't over the heatmap. The heatmap is always the first subplot.
+  def heatmap_cell(self, event):
+    if (not self.has_been_plotted or len(self.central_plot.axes) == 0 or event.inaxes is not self.central_plot.axes[0]
+        or event.xdata is None):
+      return None, None
+    index = disk_plotting.heatmap_cell_index(self.curr_model)
+    if index is None:
+      return None, None
+    return index, index.find_cell(event.xdata, event.ydata)
+
+  def show_cell_tooltip(self, event):
+    index, cell = self.heatmap_cell(event)
+    if cell is None:
+      QToolTip.hideText()
+      return
+    QToolTip.showText(QCursor.pos(), cell_index.describe_cell(self.curr_model, index, cell[0], cell[1]))
+
+  #Opens a table listing the isolates in the heatmap cell the user clicked on (unless they are
+  #using the toolbar to pan or zoom).
+  def show_cell_isolates(self, event):
+    if self.toolbar.mode:
+      return
+    index, cell = self.heatmap_cell(event)
+    if cell is None:
+      return
+    rows = cell_index.isolate_table(self.curr_model, index, cell[0], cell[1])
+    if len(rows) == 0:
+      return
+    header = cell_index.isolate_table_header(self.curr_model)
+    dialog = QDialog(self)
+    dialog.setWindowTitle(cell_index.describe_cell(self.curr_model, index, cell[0], cell[1]).split('\n')[0])
+    table = QTableWidget(len(rows), len(header), dialog)
+    table.setHorizontalHeaderLabels(header)
+    for i, row in enumerate(rows):
+      for j, value in enumerate(row):
+        table.setItem(i, j, QTableWidgetItem(value))
+    table.resizeColumnsToContents()
+    layout = QVBoxLayout(dialog)
+    layout.addWidget(table)
+    dialog.resize(600, 400)
+    dialog.show()
+    self.isolate_windows = [w for w in self.isolate_windows if w.isVisible()] + [dialog]
+
+  #Fills the disk column box with the names of the disk columns in the current dataset.
+  def update_disk_column_list(self):
+    self.disk_column.clear()
+    for name in self.curr_model.disk_column_names:
+      self.disk_column.addItem(name)
+    self.disk_column.setCurrentIndex(self.curr_model.active_disk_column)
+
+  #Switches to another disk column, showing its cutoffs in the disk cutoff boxes. If the data has
+  #already been plotted, refit and replot so the heatmap and score surface are for the new column.
+  def select_disk_column(self, index):
+    self.curr_model.select_disk_column(index)
+    self.diskS_breakpoint.setText(str(self.curr_model.xcutoffS))
+    self.diskR_breakpoint.setText(str(self.curr_model.xcutoffR))
+    if self.has_been_plotted:
+      self.fit_data()
+
+  def export_score_surface(self):
+    options = QFileDialog.Options()
+    filename, _ = QFileDialog.getSaveFileName(self,"Save File",
+            "","CSV Files (*.csv);;", options=options)
+    if filename:
+      error_code = data_export.export_score_surface(self.curr_model, filename)
+      if error_code != '0':
+        alerts.sudden_death(error_code)
+        return
+      alerts.non_fatal_message('The score surface has been exported to a csv file entitled "%s" .'%filename)
+
   #The end user wanted the ability to output to a csv file with the same data
   #as contained in the plot but in a text-based histogram.
   #This is all handled under data_export.py
@@ -254,3 +670,29 @@ class main_window(QMainWindow):
         alerts.sudden_death(error_code)
         return
       alerts.non_fatal_message('Your results have been exported to a csv file entitled "%s" .'%filename)
+
+
+#A separate window showing several datasets side by side (heatmaps on top, error tables underneath),
+#drawn by disk_plotting.draw_comparison.
+class comparison_window(QMainWindow):
+
+  def __init__(self):
+    super().__init__()
+    self.comparison_plot = Figure()
+    self.canvas = FigureCanvas(self.comparison_plot)
+    self.toolbar = NavigationToolbar(self.canvas, self)
+    self.setWindowTitle('Disk Fitter 1.0 - dataset comparison')
+    self.central_widget = QWidget()
+    self.setCentralWidget(self.central_widget)
+    mainlayout = QVBoxLayout(self.central_widget)
+    mainlayout.addWidget(self.toolbar)
+    mainlayout.addWidget(self.canvas)
+
+  def draw_datasets(self, models, names):
+    self.resize(min(450 * len(models), 1800), 800)
+    output_code = disk_plotting.draw_comparison(self.comparison_plot, models, names)
+    if output_code != '0':
+      return output_code
+    self.canvas.draw()
+    self.show()
+    return '0'
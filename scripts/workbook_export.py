@@ -0,0 +1,248 @@
+import os, re, io, csv, zipfile, argparse
+from xml.sax.saxutils import escape
+import numpy as np
+import data_export, generate_tabletext, data_processing, subsets, command_line
+
+#For batch runs the team wants a single deliverable rather than one csv per dataset. export_workbook
+#writes the results of any number of datasets into one file: a summary sheet with one row per dataset,
+#then one sheet per dataset holding its fit settings, the error table and the text-based histogram
+#(the same content as data_export.export_results). The file is either an Excel workbook (.xlsx) or,
+#for tools that can't read those, a zip file with one csv per sheet (.zip).
+#Each dataset's sheet is streamed into the output file as soon as it is generated, and both the error
+#table and the histogram come from the dataset's count table (see count_tables.py), not from the raw
+#isolates, so the datasets can be loaded one at a time and dropped once written, and exporting
+#hundreds of them only takes as long as fitting them. The workbook is written directly as the zipped
+#XML files that make up an .xlsx file, so no spreadsheet library is needed. Can be run from the command
+#line, e.g.
+#  python workbook_export.py site_a.csv site_b.csv -o results.xlsx
+#(run python workbook_export.py --help for the full list of options).
+
+WORKBOOK_FORMATS = ['.xlsx', '.zip']
+
+SUMMARY_COLUMNS = ['Dataset', 'Source file', 'Subset', 'Fit', 'Disk column', 'Disk cutoff R (<=)',
+                   'Disk cutoff S (>=)', 'No. isolates', 'Very major errors', 'Very major (%)', 'Major errors',
+                   'Major (%)', 'Minor errors', 'Minor (%)']
+
+#Excel doesn't allow these characters in sheet names, or names longer than 31 characters.
+SHEET_NAME_PATTERN = re.compile(r'[\[\]:*?/\\]')
+MAX_SHEET_NAME_LENGTH = 31
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Override PartName="/xl/workbook.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>%s</Types>')
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet%s.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+PACKAGE_RELATIONSHIPS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                         'relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>%s</sheets></workbook>')
+WORKBOOK_RELATIONSHIPS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                          '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">%s'
+                          '</Relationships>')
+SHEET_RELATIONSHIP = ('<Relationship Id="rId%s" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                      'relationships/worksheet" Target="worksheets/sheet%s.xml"/>')
+SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+SHEET_END = '</sheetData></worksheet>'
+
+
+#Writes sheets into an .xlsx file one at a time. Numbers are stored as numbers and everything else
+#as text. The list of sheets is written when the workbook is closed, with the summary sheet first.
+class xlsx_writer():
+
+  def __init__(self, filename):
+    self.archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+    #The sheets in the order they are listed, and the number of each sheet's file (sheets are
+    #numbered in the order they were written, whatever order they are listed in).
+    self.sheet_names = []
+    self.sheet_numbers = {}
+
+  def add_sheet(self, name, rows, first=False):
+    if first:
+      self.sheet_names.insert(0, name)
+    else:
+      self.sheet_names.append(name)
+    self.sheet_numbers[name] = len(self.sheet_numbers) + 1
+    with self.archive.open('xl/worksheets/sheet%s.xml'%self.sheet_numbers[name], 'w') as sheet_file:
+      sheet_file.write(SHEET_START.encode())
+      for i, row in enumerate(rows):
+        sheet_file.write(('<row r="%s">%s</row>'%(i + 1, ''.join([xlsx_cell(value) for value in row]))).encode())
+      sheet_file.write(SHEET_END.encode())
+
+  def close(self):
+    numbers = [self.sheet_numbers[name] for name in self.sheet_names]
+    self.archive.writestr('[Content_Types].xml', CONTENT_TYPES%''.join([SHEET_CONTENT_TYPE%number for number in numbers]))
+    self.archive.writestr('_rels/.rels', PACKAGE_RELATIONSHIPS)
+    self.archive.writestr('xl/workbook.xml', WORKBOOK%''.join(['<sheet name="%s" sheetId="%s" r:id="rId%s"/>'%(
+                                                               escape(name, {'"':'&quot;'}), i + 1, number)
+                                                               for i, (name, number) in enumerate(zip(self.sheet_names, numbers))]))
+    self.archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELATIONSHIPS%''.join([SHEET_RELATIONSHIP%(number, number)
+                                                                                       for number in numbers]))
+    self.archive.close()
+
+
+def xlsx_cell(value):
+  if isinstance(value, np.generic):
+    value = value.item()
+  if isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value):
+    return '<c><v>%s</v></c>'%repr(value)
+  if value is None or value == '':
+    return '<c/>'
+  return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>'%escape(str(value))
+
+
+#Writes sheets into a zip file as one csv file per sheet.
+class csv_bundle_writer():
+
+  def __init__(self, filename):
+    self.archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+
+  def add_sheet(self, name, rows, first=False):
+    with self.archive.open('%s.csv'%name, 'w') as sheet_file:
+      text_file = io.TextIOWrapper(sheet_file, newline='')
+      csv.writer(text_file).writerows([['' if value is None else value for value in row] for row in rows])
+      text_file.flush()
+      text_file.detach()
+
+  def close(self):
+    self.archive.close()
+
+
+#A name for a dataset's sheet that Excel will accept and that no other sheet has.
+def sheet_name(name, used_names):
+  base_name = SHEET_NAME_PATTERN.sub('_', name).strip("' ")[:MAX_SHEET_NAME_LENGTH] or 'Dataset'
+  name, number = base_name, 1
+  while name.lower() in used_names:
+    number += 1
+    suffix = ' (%s)'%number
+    name = base_name[:MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix
+  used_names.add(name.lower())
+  return name
+
+
+#The rows of a dataset's sheet: its fit settings, the error table and the text-based histogram.
+def dataset_rows(current_model, name, fit_message):
+  rows = [['Dataset', name], ['Source file', current_model.source_filename or ''],
+          ['Organism', current_model.strain_name], ['Algorithm', current_model.model_type],
+          ['Susceptibility breakpoint (<=, mg/L)', float(current_model.ycutoffS)],
+          ['Resistance breakpoint (>=, mg/L)', float(current_model.ycutoffR)],
+          ['Subset', current_model.subset_filter], ['Fit', fit_message_text(fit_message)], []]
+  rows += [[text.replace('\n', ' ') for text in row] for row in generate_tabletext.generate_celltext(current_model)]
+  rows += [[], ['The chart below plots disk zone (on x) vs mic (on y)']]
+  rows += data_export.histogram_rows(current_model)
+  return rows
+
+
+#The summary sheet row for a dataset: its cutoffs and errors for the selected disk column. As in the
+#error table, counts are total weights, to two decimal places, if the isolates have sample weights.
+def summary_row(current_model, name, fit_message):
+  error_counts = {error_type:round(count, 2) if isinstance(count, float) else count
+                  for error_type, count in current_model.error_counts.items()}
+  row = [name, current_model.source_filename or '', current_model.subset_filter, fit_message_text(fit_message),
+         current_model.disk_column_names[current_model.active_disk_column], float(current_model.xcutoffR),
+         float(current_model.xcutoffS), error_counts['num_strains']]
+  for error_type in ['very major errors', 'major errors', 'minor errors']:
+    row += [error_counts[error_type], round(100 * error_counts[error_type] / max(error_counts['num_strains'], 1), 2)]
+  return row
+
+
+#fit_data returns '0' if the fit worked, or the tied cutoffs (starting with '!') if several were equally good.
+def fit_message_text(fit_message):
+  if fit_message == '0':
+    return 'OK'
+  if fit_message.startswith('!'):
+    return 'Several cutoffs were equally good: %s'%fit_message[1:].strip(' ,')
+  return fit_message
+
+
+#Writes the results of a series of datasets to a single .xlsx workbook or .zip bundle of csv files
+#(chosen by the extension of filename). datasets can be any iterable of (name, model, fit message)
+#tuples, where the fit message is the one data_processing.fit_data returned (the model is expected to
+#have been fit already); each is written out before the next one is taken, so a generator that loads
+#them one at a time keeps only one in memory. Datasets that couldn't be fit are listed in the summary
+#with the reason. Returns an error message ('0' if there was no error).
+def export_workbook(datasets, filename):
+  extension = os.path.splitext(filename)[1].lower()
+  if extension not in WORKBOOK_FORMATS:
+    return "Workbooks can only be saved as %s files."%' or '.join(WORKBOOK_FORMATS)
+  try:
+    writer = xlsx_writer(filename) if extension == '.xlsx' else csv_bundle_writer(filename)
+  except:
+    return ("The workbook could not be exported. The program is trying to write to a file called '%s'. Make sure that you don't "
+      "have a file by this name already open."%filename)
+  summary, used_names = [SUMMARY_COLUMNS], {'summary'}
+  try:
+    for name, current_model, fit_message in datasets:
+      if current_model.current_dataset['mics'] is None or not (fit_message == '0' or fit_message.startswith('!')):
+        summary.append([name, '', '', fit_message])
+        continue
+      error_code = current_model.update_error_tables(current_model.mic_vs_mic)
+      if error_code != '0':
+        summary.append([name, current_model.source_filename or '', current_model.subset_filter, error_code])
+        continue
+      writer.add_sheet(sheet_name(name, used_names), dataset_rows(current_model, name, fit_message))
+      summary.append(summary_row(current_model, name, fit_message))
+    writer.add_sheet('Summary', summary, first=True)
+    writer.close()
+  except:
+    #Don't leave a half-written workbook behind.
+    writer.archive.close()
+    try:
+      os.remove(filename)
+    except:
+      pass
+    return ("The workbook '%s' could not be written. Make sure there is enough disk space and that the datasets "
+            "can still be read, and try again."%filename)
+  return '0'
+
+
+#Loads and fits each of the csv files in turn (with the same settings as the batch report generator),
+#yielding them for export_workbook. If a settings group_by column is given, each value of it is yielded
+#as a separate dataset.
+def fitted_datasets(filenames, settings=command_line.DEFAULT_SETTINGS):
+  for filename in filenames:
+    name = os.path.splitext(os.path.basename(filename))[0]
+    error_code, current_model = command_line.load_model(filename, settings)
+    if error_code != '0':
+      yield name, current_model, error_code
+      continue
+    groups = [(name, settings.get('subset_filter', ''))]
+    if settings.get('group_by', '') != '':
+      try:
+        groups = [('%s_%s'%(name, value), subset_filter) for value, subset_filter in
+                  subsets.group_filters(current_model, settings['group_by'], settings.get('subset_filter', ''))]
+      except ValueError as error:
+        yield name, current_model, str(error)
+        continue
+    for group_name, subset_filter in groups:
+      fit_message = current_model.set_subset_filter(subset_filter)
+      if fit_message == '0':
+        fit_message = data_processing.fit_data(current_model)
+      yield group_name, current_model, fit_message
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Fit a batch of csv files and export all of the results to a single '
+                                               'workbook.')
+  parser.add_argument('filenames', nargs='+', help='csv files to fit (same format as for Import Data)')
+  parser.add_argument('-o', '--output', default='results.xlsx', help='the workbook to write (.xlsx, or .zip for a '
+                      'bundle of csv files)')
+  command_line.add_common_arguments(parser, workers_option=False)
+  parser.add_argument('--group-by', default='', help='export each value of this metadata column as a separate dataset')
+  args = parser.parse_args()
+  settings = dict(command_line.settings_from_arguments(args), group_by=args.group_by)
+  error_code = export_workbook(fitted_datasets(args.filenames, settings), args.output)
+  if error_code != '0':
+    print(error_code)
+    return
+  print('Wrote the results for %s files to %s'%(len(args.filenames), args.output))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,98 @@
+import os
+import model_object, data_processing
+
+#A workspace holds several datasets at once (e.g. from different sites, years or testing labs),
+#each in its own model_parameter_set, so the user can switch between them or compare them side
+#by side without re-importing anything. Each model keeps its own count table, fit and error
+#tables, and the workspace remembers the settings each dataset was last fit with, so switching
+#datasets, adding a new one or redrawing the comparison view only refits the datasets whose
+#data or settings have changed since.
+
+#The settings a newly imported dataset takes from the dataset that was active, so that it starts
+#out with the same breakpoints and options the user was working with.
+SHARED_SETTINGS = ['model_type', 'ycutoffS', 'ycutoffR', 'xcutoffS', 'xcutoffR', 'strain_name',
+                   'use_user_defined_disk_cutoffs', 'mic_vs_mic', 'colormap_type', 'show_score_surface']
+
+
+class analysis_workspace():
+
+  def __init__(self):
+    self.models = []
+    self.names = []
+    #The fit_key of each dataset when it was last fit (None if it hasn't been) and the message
+    #data_processing.fit_data returned for it.
+    self.fit_keys = []
+    self.fit_messages = []
+    self.active = None
+
+  def active_model(self):
+    if self.active is None:
+      return None
+    return self.models[self.active]
+
+  #Adds a model that has already been set up (e.g. one restored from a session file) and makes
+  #it the active dataset. If it has already been fit, pass the fit message so that it isn't refit.
+  def add_model(self, name, current_model, fit_message=None):
+    self.models.append(current_model)
+    self.names.append(name)
+    if fit_message is None:
+      self.fit_keys.append(None)
+    else:
+      self.fit_keys.append(self.fit_key(current_model))
+    self.fit_messages.append(fit_message)
+    self.active = len(self.models) - 1
+    return current_model
+
+  #Imports a csv file as a new dataset with the same settings as settings_model (if given), and
+  #makes it the active dataset. Returns an error message ('0' if there was no error); if the
+  #file couldn't be loaded nothing is added.
+  def add_dataset(self, filename, settings_model=None):
+    new_model = model_object.model_parameter_set()
+    if settings_model is not None:
+      for attribute in SHARED_SETTINGS:
+        setattr(new_model, attribute, getattr(settings_model, attribute))
+    error_code = new_model.load_dataset(filename)
+    if error_code != '0':
+      return error_code
+    self.add_model(os.path.splitext(os.path.basename(filename))[0], new_model)
+    return '0'
+
+  def remove_dataset(self, index):
+    for dataset_list in [self.models, self.names, self.fit_keys, self.fit_messages]:
+      del dataset_list[index]
+    if len(self.models) == 0:
+      self.active = None
+    elif self.active >= index:
+      self.active = max(self.active - 1, 0)
+
+  def select(self, index):
+    self.active = index
+    return self.models[index]
+
+  #Everything the result of data_processing.fit_data depends on. The cutoffs are included (and the key
+  #is taken after fitting) so that if the user edits the cutoffs by hand, the next fit puts the fitted
+  #ones back.
+  def fit_key(self, current_model):
+    return (str(current_model.ycutoffS), str(current_model.ycutoffR), current_model.model_type,
+            current_model.mic_vs_mic, current_model.use_user_defined_disk_cutoffs,
+            current_model.active_disk_column, str(current_model.xcutoffS), str(current_model.xcutoffR),
+            current_model.data_version, current_model.subset_filter)
+
+  #Fits a dataset unless it has already been fit with the same data and settings, and returns the
+  #message from data_processing.fit_data ('0', a list of tied cutoffs starting with '!' or an error).
+  def fit_dataset(self, index):
+    current_model = self.models[index]
+    if self.fit_keys[index] != self.fit_key(current_model):
+      self.fit_messages[index] = data_processing.fit_data(current_model)
+      if self.fit_messages[index] == '0' or self.fit_messages[index].startswith('!'):
+        self.fit_keys[index] = self.fit_key(current_model)
+      else:
+        self.fit_keys[index] = None
+    return self.fit_messages[index]
+
+  def is_fit(self, index):
+    return self.fit_keys[index] is not None
+
+  #Fits every dataset that needs it, returning the fit message for each.
+  def fit_all(self):
+    return [self.fit_dataset(i) for i in range(0, len(self.models))]
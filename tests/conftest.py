@@ -0,0 +1,9 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+@pytest.fixture
+def example_data():
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_data')
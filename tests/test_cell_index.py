@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import model_object, data_processing, disk_plotting, cell_index
+
+
+def fitted_model(filename):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  data_processing.fit_data(current_model)
+  current_model.update_error_tables()
+  return current_model
+
+
+#Each cell must hold exactly the isolates that fall in it, in the order they are in the dataset,
+#with the same binning as hist2d; points off the edge of the heatmap are in no cell.
+def test_cells_hold_the_isolates_in_them():
+  rng = np.random.default_rng(6)
+  x = np.concatenate([rng.uniform(3, 52, size=2000), [5, 49, 50]])
+  y = rng.uniform(-1, 11, size=x.shape[0])
+  xbins, ybins = np.arange(5, 50, 1), np.linspace(0, 10, 15)
+  index = cell_index.cell_index(x, y, xbins, ybins, [str(value) for value in xbins[:-1]], list(ybins[:-1]))
+  expected_counts = np.histogram2d(x, y, bins=[xbins, ybins])[0]
+  num_in_cells = 0
+  for x_bin in range(0, xbins.shape[0] - 1):
+    for y_bin in range(0, ybins.shape[0] - 1):
+      isolates = index.isolates(x_bin, y_bin)
+      expected_isolates = np.nonzero((x >= xbins[x_bin]) & ((x < xbins[x_bin+1]) | (x_bin == xbins.shape[0] - 2) & (x == xbins[-1])) &
+                                     (y >= ybins[y_bin]) & ((y < ybins[y_bin+1]) | (y_bin == ybins.shape[0] - 2) & (y == ybins[-1])))[0]
+      assert np.array_equal(isolates, expected_isolates)
+      assert isolates.shape[0] == expected_counts[x_bin, y_bin]
+      num_in_cells += isolates.shape[0]
+  assert num_in_cells == expected_counts.sum()
+  assert index.offsets[-1] == x.shape[0]
+  assert index.find_cell(49.5, 5) is None
+  assert index.find_cell(49, 10) == (43, 13)
+
+
+#The isolates the tooltip and the isolate table describe for each cell are the ones counted in that
+#cell of the heatmap, and their errors add up to the error table.
+def test_cell_descriptions_match_the_heatmap_and_error_table(example_data):
+  current_model = fitted_model(os.path.join(example_data, 'example_dataset.csv'))
+  index = disk_plotting.heatmap_cell_index(current_model)
+  xbins, ybins, x_labels, y_labels = disk_plotting.heatmap_bins(current_model)
+  x, yreal, counts = disk_plotting.heatmap_values(current_model)
+  heatmap_counts = np.histogram2d(x, yreal, bins=[xbins, ybins], weights=counts)[0]
+  error_counts = np.zeros(4, dtype=np.int64)
+  for x_bin in range(0, xbins.shape[0] - 1):
+    for y_bin in range(0, ybins.shape[0] - 1):
+      rows = cell_index.isolate_table(current_model, index, x_bin, y_bin)
+      assert len(rows) == heatmap_counts[x_bin, y_bin]
+      description = cell_index.describe_cell(current_model, index, x_bin, y_bin)
+      assert description.split('\n')[1].startswith('%s isolates:'%len(rows))
+      cell_errors = [[row[-1] for row in rows].count(label) for label in cell_index.ERROR_LABELS[1:]]
+      assert description.endswith('%s very major, %s major, %s minor errors'%tuple(cell_errors))
+      error_counts[1:] += cell_errors
+      for row in rows:
+        assert float(row[1]) == current_model.current_dataset['mics'][int(row[0]) - 1]
+        assert float(row[2]) == current_model.current_dataset['disks'][int(row[0]) - 1]
+  assert list(error_counts[1:]) == [current_model.error_counts['very major errors'],
+                                    current_model.error_counts['major errors'],
+                                    current_model.error_counts['minor errors']]
+
+
+#The index is rebuilt when the data or the selected disk column change, and not otherwise.
+def test_cell_index_is_rebuilt_only_when_the_data_change(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  (tmp_path / 'first.csv').write_text('\n'.join(lines[:200]) + '\n')
+  (tmp_path / 'second.csv').write_text('\n'.join(lines[200:]) + '\n')
+  current_model = fitted_model(str(tmp_path / 'first.csv'))
+  index = disk_plotting.heatmap_cell_index(current_model)
+  assert disk_plotting.heatmap_cell_index(current_model) is index
+  assert current_model.append_dataset(str(tmp_path / 'second.csv')) == '0'
+  assert disk_plotting.heatmap_cell_index(current_model) is not index
+  assert disk_plotting.heatmap_cell_index(current_model).offsets[-1] == len(lines)
@@ -0,0 +1,58 @@
+import numpy as np
+import count_tables
+
+
+def random_isolates(seed, num_isolates, num_disk_columns=1):
+  rng = np.random.default_rng(seed)
+  mics = rng.choice([0.25, 0.5, 1, 2, 4, 8, 16, 32], size=num_isolates)
+  disks = rng.integers(6, 40, size=(num_isolates, num_disk_columns)).astype(np.float64)
+  return mics, disks
+
+
+#The counts of isolates added in batches must be the same as if they had all been counted at once,
+#including when later batches bring in disk and mic values the table hasn't seen yet.
+def test_add_rows_in_batches_matches_one_batch():
+  mics, disks = random_isolates(0, 500, 2)
+  all_at_once = count_tables.count_table(2)
+  all_at_once.add_rows(mics, disks)
+  in_batches = count_tables.count_table(2)
+  for start in range(0, 500, 37):
+    in_batches.add_rows(mics[start:start+37], disks[start:start+37])
+  assert np.array_equal(in_batches.disk_values, all_at_once.disk_values)
+  assert np.array_equal(in_batches.mic_values, all_at_once.mic_values)
+  assert np.array_equal(in_batches.counts, all_at_once.counts)
+  assert in_batches.num_strains() == 500
+
+
+def test_counts_match_isolates():
+  mics, disks = random_isolates(1, 200)
+  table = count_tables.count_table()
+  table.add_rows(mics, disks)
+  for i, disk in enumerate(table.disk_values):
+    for j, mic in enumerate(table.mic_values):
+      assert table.counts[0,i,j] == np.sum((disks[:,0] == disk) & (mics == mic))
+
+
+#Adding and then removing weighted isolates must leave exactly zero behind, not rounding errors,
+#so that the emptied cells don't widen the range of cutoffs the fit tries.
+def test_remove_cells_weighted_leaves_empty_cells_at_zero():
+  mics, disks = random_isolates(2, 300)
+  weights = np.random.default_rng(3).uniform(0.1, 3.0, size=300)
+  table = count_tables.count_table(1, weighted=True)
+  table.add_rows(mics[:100], disks[:100], weights[:100])
+  table.extend_axes(mics, disks)
+  expected = table.counts.copy()
+  cells = table.cell_indices(mics[100:], disks[100:])
+  table.add_cells(cells, weights[100:])
+  table.remove_cells(cells, weights[100:])
+  assert np.allclose(table.counts, expected, rtol=0, atol=1e-9)
+  assert np.array_equal(table.counts == 0, expected == 0)
+  assert table.is_weighted()
+
+
+def test_weighted_counts_are_total_weights():
+  table = count_tables.count_table(1, weighted=True)
+  table.add_rows([1.0, 1.0, 4.0], [20.0, 20.0, 12.0], [0.5, 1.25, 2.0])
+  assert table.counts.dtype == np.float64
+  assert table.counts[0, list(table.disk_values).index(20.0), list(table.mic_values).index(1.0)] == 1.75
+  assert table.num_strains() == 3.75
@@ -0,0 +1,107 @@
+import os
+import model_object, data_processing, data_export
+
+
+def load(tmp_path, rows):
+  filename = str(tmp_path / 'data.csv')
+  with open(filename, 'w') as output_file:
+    output_file.write('\n'.join(['%s,%s'%row for row in rows]) + '\n')
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  return current_model
+
+
+#Resistant isolates all at 10mm and susceptible isolates all at 20mm: every cutoff_R from 10 to 19 separates
+#them perfectly, whatever the width (an intermediate zone that only contains susceptible isolates is pure too).
+def separable_model(tmp_path):
+  return load(tmp_path, [(32, 10)]*5 + [(1, 20)]*5)
+
+
+def test_fit_reports_every_tied_optimum(tmp_path):
+  current_model = separable_model(tmp_path)
+  error_code = data_processing.fit_data(current_model)
+  expected_optima = [(float(cutoff_R), float(cutoff_R + width)) for cutoff_R in range(10, 20)
+                     for width in range(1, 5)]
+  assert sorted(current_model.model_engine.tied_optima) == expected_optima
+  assert error_code.startswith('!, ')
+  assert error_code.split(', ')[1:] == ['R <=%s / S >=%s'%optimum for optimum in current_model.model_engine.tied_optima]
+  #Of the tied optima, the one with the smallest width and then the largest cutoff_R is used.
+  assert (current_model.xcutoffR, current_model.xcutoffS) == (19.0, 20.0)
+
+
+def test_fit_with_a_single_optimum_reports_no_ties(tmp_path):
+  current_model = load(tmp_path, [(32, 10)]*5 + [(8, 11)]*3 + [(1, 12)]*5)
+  assert data_processing.fit_data(current_model) == '0'
+  assert current_model.model_engine.tied_optima == [(10.0, 12.0)]
+  assert (current_model.xcutoffR, current_model.xcutoffS) == (10.0, 12.0)
+
+
+def test_score_surface_export_lists_tied_optima(tmp_path):
+  current_model = separable_model(tmp_path)
+  data_processing.fit_data(current_model)
+  filename = str(tmp_path / 'surface.csv')
+  assert data_export.export_score_surface(current_model, filename) == '0'
+  lines = open(filename).read().splitlines()
+  assert len(lines[1:lines.index('')]) == current_model.model_engine.score_surface.shape[0]
+  optima = lines[lines.index('Resistance disk cutoff (<=),Susceptibility disk cutoff (>=)') + 1:]
+  assert optima == ['%s,%s'%optimum for optimum in current_model.model_engine.tied_optima]
+
+
+#The score surface belongs to the fitted cutoffs, so there is none to show or export once the user
+#switches to manual cutoffs or MIC vs MIC mode.
+def test_score_surface_is_cleared_for_manual_cutoffs(tmp_path):
+  current_model = separable_model(tmp_path)
+  data_processing.fit_data(current_model)
+  current_model.use_user_defined_disk_cutoffs = True
+  current_model.xcutoffR, current_model.xcutoffS = 12.0, 15.0
+  assert data_processing.fit_data(current_model) == '0'
+  assert current_model.model_engine.score_surface is None
+  assert current_model.model_engine.tied_optima == []
+  filename = str(tmp_path / 'surface.csv')
+  assert data_export.export_score_surface(current_model, filename) != '0'
+  assert not os.path.exists(filename)
+
+
+#All of the disk columns are fit in one batch; each must get the cutoffs it would get on its own.
+def test_each_disk_column_is_fit_as_if_alone(tmp_path):
+  rows = [(32, 10, 14), (32, 12, 15), (16, 13, 18), (8, 15, 19), (4, 16, 22), (2, 18, 24), (1, 20, 23),
+          (32, 11, 17), (1, 19, 25), (4, 17, 20), (16, 14, 16), (2, 21, 26)]
+  filename = str(tmp_path / 'columns.csv')
+  with open(filename, 'w') as output_file:
+    output_file.write('MIC,10 ug,30 ug\n' + '\n'.join(['%s,%s,%s'%row for row in rows]) + '\n')
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  data_processing.fit_data(current_model)
+  for column in range(0,2):
+    single_column_model = load(tmp_path, [(row[0], row[1 + column]) for row in rows])
+    data_processing.fit_data(single_column_model)
+    assert current_model.disk_column_cutoffs[column] == [single_column_model.xcutoffR, single_column_model.xcutoffS]
+    current_model.select_disk_column(column)
+    assert (current_model.xcutoffR, current_model.xcutoffS) == (single_column_model.xcutoffR, single_column_model.xcutoffS)
+  #Cutoffs the user sets for one column are kept when switching to another and back.
+  current_model.xcutoffR, current_model.xcutoffS = 20.0, 23.0
+  current_model.select_disk_column(0)
+  current_model.select_disk_column(1)
+  assert (current_model.xcutoffR, current_model.xcutoffS) == (20.0, 23.0)
+
+
+#Whole-number weights must give the same fit and error counts as repeating each isolate that many times.
+def test_weighted_fit_matches_repeated_isolates(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  weights = [1 + i % 3 for i in range(0, len(lines))]
+  (tmp_path / 'weighted.csv').write_text('MIC,Disk,weight\n' + '\n'.join(['%s,%s'%(line, weight) for line, weight
+                                                                          in zip(lines, weights)]) + '\n')
+  (tmp_path / 'repeated.csv').write_text('\n'.join([line for line, weight in zip(lines, weights)
+                                                    for i in range(0, weight)]) + '\n')
+  fitted_models = []
+  for filename in ['weighted.csv', 'repeated.csv']:
+    current_model = model_object.model_parameter_set()
+    assert current_model.load_dataset(str(tmp_path / filename)) == '0'
+    data_processing.fit_data(current_model)
+    current_model.update_error_tables()
+    fitted_models.append(current_model)
+  weighted_model, repeated_model = fitted_models
+  assert weighted_model.count_table.is_weighted()
+  assert (weighted_model.xcutoffR, weighted_model.xcutoffS) == (repeated_model.xcutoffR, repeated_model.xcutoffS)
+  assert weighted_model.model_engine.tied_optima == repeated_model.model_engine.tied_optima
+  assert {name:float(count) for name, count in weighted_model.error_counts.items()} == repeated_model.error_counts
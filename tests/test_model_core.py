@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pytest
+import model_core, count_tables
+
+
+#The fit as it was done before the engines worked from count tables: every isolate is assigned a
+#category and the impurity of each proposed split is calculated from the isolates themselves.
+def baseline_impurity(model_type, population):
+  fractions = np.asarray([np.sum(population == i) for i in range(0,3)]) / population.shape[0]
+  if model_type == 'mgm':
+    return 1 - np.sum(fractions**2)
+  elif model_type == 'mem':
+    return -np.sum([fraction * np.log2(fraction) for fraction in fractions if fraction > 0])
+  return 1 - np.max(fractions)
+
+
+def baseline_score(model_type, input_x, input_y, proposed_cutoff_S, proposed_cutoff_R):
+  category_indices = [np.argwhere(input_x >= proposed_cutoff_S).flatten(),
+                      np.argwhere(input_x <= proposed_cutoff_R).flatten(),
+                      np.argwhere((input_x < proposed_cutoff_S) & (input_x > proposed_cutoff_R)).flatten()]
+  base_score = 0
+  for category_index in category_indices:
+    if category_index.shape[0] > 0:
+      base_score += (category_index.shape[0] / input_x.shape[0]) * baseline_impurity(model_type, input_y[category_index])
+  return base_score
+
+
+#Returns the cutoffs and the tied widths, as model_core.impurity_model.fit_disk_counts does. Scores
+#are compared with a small tolerance, since they are summed in a different order here.
+def baseline_fit(model_type, input_x, input_y):
+  allowed_widths = [1.0, 2.0, 3.0, 4.0]
+  best_score_so_far = np.full((4), np.inf)
+  best_cutoffs_so_far = np.zeros((4,2))
+  for i, width in enumerate(allowed_widths):
+    proposed_cutoff_R = np.min(input_x)
+    while proposed_cutoff_R <= np.max(input_x):
+      current_score = baseline_score(model_type, input_x, input_y, proposed_cutoff_R + width, proposed_cutoff_R)
+      if current_score <= best_score_so_far[i] + 1e-12:
+        best_score_so_far[i] = min(current_score, best_score_so_far[i])
+        best_cutoffs_so_far[i] = [proposed_cutoff_R, proposed_cutoff_R + width]
+      proposed_cutoff_R += 1
+  tied = np.abs(best_score_so_far - np.min(best_score_so_far)) <= 1e-12
+  best_result_index = np.argmax(tied)
+  tied_widths = [str(allowed_widths[i]) for i in range(0,4) if tied[i]] if np.sum(tied) > 1 else []
+  return best_cutoffs_so_far[best_result_index,0], best_cutoffs_so_far[best_result_index,1], tied_widths
+
+
+def count_table_fit(model_type, mics, disks, ycutoffS, ycutoffR):
+  table = count_tables.count_table()
+  table.add_rows(mics, disks[:,None])
+  disk_values, class_counts = table.class_counts(ycutoffS, ycutoffR)
+  engine = model_core.new_engine(model_type)
+  tied_widths = engine.fit_disk_counts(disk_values, class_counts[0])
+  return engine.cutoff_R, engine.cutoff_S, tied_widths
+
+
+def categories(mics, ycutoffS, ycutoffR):
+  y = np.ones(mics.shape[0], dtype=np.int64)
+  y[mics <= ycutoffS] = 2
+  y[mics >= ycutoffR] = 0
+  return y
+
+
+@pytest.mark.parametrize('model_type', list(model_core.model_engines))
+@pytest.mark.parametrize('filename', ['example_dataset.csv', 'test_2.csv', 'smalltest.csv'])
+def test_engine_matches_baseline_fit_on_example_data(example_data, model_type, filename):
+  raw = np.loadtxt(os.path.join(example_data, filename), delimiter=',', ndmin=2)
+  mics, disks = raw[:,0], raw[:,1]
+  for ycutoffS, ycutoffR in [(4.0, 16.0), (1.0, 8.0), (2.0, 4.0)]:
+    y = categories(mics, ycutoffS, ycutoffR)
+    if np.sum(y == 0) == 0 or np.sum(y == 2) == 0:
+      continue
+    assert count_table_fit(model_type, mics, disks, ycutoffS, ycutoffR) == baseline_fit(model_type, disks, y)
+
+
+#Small datasets with a narrow range of disk values have many tied optima, so these check the tie
+#rule (smallest width, then largest cutoff_R) as well as the scores.
+@pytest.mark.parametrize('model_type', list(model_core.model_engines))
+def test_engine_matches_baseline_fit_on_random_data(model_type):
+  rng = np.random.default_rng(4)
+  for trial in range(0,40):
+    num_isolates = rng.integers(5, 60)
+    mics = rng.choice([0.5, 1, 2, 4, 8, 16, 32], size=num_isolates)
+    disks = rng.integers(6, rng.integers(10, 30), size=num_isolates).astype(np.float64)
+    y = categories(mics, 2.0, 8.0)
+    if np.sum(y == 0) == 0 or np.sum(y == 2) == 0:
+      continue
+    assert count_table_fit(model_type, mics, disks, 2.0, 8.0) == baseline_fit(model_type, disks, y)
+
+
+#Fitting several count tables in one batch must give each the same result as fitting it alone.
+def test_batch_fit_matches_separate_fits():
+  rng = np.random.default_rng(5)
+  disk_values = np.arange(6.0, 41.0)
+  class_counts = rng.poisson(0.7, size=(6, disk_values.shape[0], 3))
+  #A table whose isolates only cover part of the disk axis.
+  class_counts[2,:10] = 0
+  class_counts[2,25:] = 0
+  engine = model_core.new_engine('mgm')
+  fit = engine.fit_disk_counts_batch(disk_values, class_counts)
+  for i in range(0,6):
+    tied_widths = engine.select_fit(fit, (i,))
+    cutoffs = (engine.cutoff_R, engine.cutoff_S, tied_widths, engine.tied_optima)
+    separate_engine = model_core.new_engine('mgm')
+    separate_tied_widths = separate_engine.fit_disk_counts(disk_values, class_counts[i])
+    assert cutoffs == (separate_engine.cutoff_R, separate_engine.cutoff_S, separate_tied_widths,
+                       separate_engine.tied_optima)
+    assert np.array_equal(engine.score_surface, separate_engine.score_surface)
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import model_object
+
+
+def load(filename):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  return current_model
+
+
+def assert_same_data(current_model, expected_model):
+  for column in ['mics', 'disk_columns', 'dates', 'weights', 'metadata']:
+    if expected_model.current_dataset.get(column) is None:
+      assert current_model.current_dataset.get(column) is None
+    else:
+      assert np.array_equal(current_model.current_dataset[column], expected_model.current_dataset[column])
+  assert np.array_equal(current_model.count_table.disk_values, expected_model.count_table.disk_values)
+  assert np.array_equal(current_model.count_table.mic_values, expected_model.count_table.mic_values)
+  assert np.array_equal(current_model.count_table.counts, expected_model.count_table.counts)
+
+
+def test_append_dataset_matches_loading_everything(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  (tmp_path / 'first.csv').write_text('\n'.join(lines[:200]) + '\n')
+  (tmp_path / 'second.csv').write_text('\n'.join(lines[200:]) + '\n')
+  current_model = load(str(tmp_path / 'first.csv'))
+  assert current_model.append_dataset(str(tmp_path / 'second.csv')) == '0'
+  assert_same_data(current_model, load(os.path.join(example_data, 'example_dataset.csv')))
+
+
+#Watching a file reads only the complete lines added since it was last read; a line that hasn't
+#been finished yet is left for the next time.
+def test_watched_file_reads_only_complete_new_lines(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  watched_file = tmp_path / 'watched.csv'
+  watched_file.write_text('\n'.join(lines[:100]) + '\n')
+  current_model = load(str(watched_file))
+  with open(str(watched_file), 'a') as output_file:
+    output_file.write('\n'.join(lines[100:150]) + '\n' + lines[150][:2])
+  assert current_model.append_new_rows_from_file() == '0'
+  assert current_model.current_dataset['mics'].shape[0] == 150
+  with open(str(watched_file), 'a') as output_file:
+    output_file.write(lines[150][2:] + '\n' + '\n'.join(lines[151:]) + '\n')
+  assert current_model.append_new_rows_from_file() == '0'
+  assert_same_data(current_model, load(os.path.join(example_data, 'example_dataset.csv')))
+  assert current_model.append_new_rows_from_file() == '0'
+  assert current_model.current_dataset['mics'].shape[0] == len(lines)
+
+
+#A watched file that gets shorter was replaced, so it is read again from the start.
+def test_watched_file_that_shrinks_is_reloaded(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  watched_file = tmp_path / 'watched.csv'
+  watched_file.write_text('\n'.join(lines) + '\n')
+  current_model = load(str(watched_file))
+  watched_file.write_text('\n'.join(lines[:50]) + '\n')
+  assert current_model.append_new_rows_from_file() == '0'
+  assert current_model.current_dataset['mics'].shape[0] == 50
+  assert current_model.count_table.num_strains() == 50
+
+
+def test_bad_new_rows_are_not_added(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  watched_file = tmp_path / 'watched.csv'
+  watched_file.write_text('\n'.join(lines[:100]) + '\n')
+  current_model = load(str(watched_file))
+  with open(str(watched_file), 'a') as output_file:
+    output_file.write(lines[100] + '\nnot,a,number\n')
+  assert current_model.append_new_rows_from_file() != '0'
+  assert current_model.current_dataset['mics'].shape[0] == 100
+  assert current_model.count_table.num_strains() == 100
+
+
+#Writes the given rows of the example data with two disk columns, in the given order (the '30 ug'
+#column is the '10 ug' one plus a few mm).
+def write_two_disk_columns(example_data, filename, column_names, rows=slice(None)):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()[rows]
+  columns = {'10 ug':[line.split(',')[1] for line in lines],
+             '30 ug':[str(float(line.split(',')[1]) + 3 + i % 4) for i, line in enumerate(lines)]}
+  with open(filename, 'w') as output_file:
+    output_file.write(','.join(['MIC'] + column_names) + '\n')
+    output_file.write('\n'.join([','.join([line.split(',')[0]] + [columns[name][i] for name in column_names])
+                                 for i, line in enumerate(lines)]) + '\n')
+
+
+def test_load_several_disk_columns(example_data, tmp_path):
+  write_two_disk_columns(example_data, str(tmp_path / 'data.csv'), ['10 ug', '30 ug'])
+  current_model = load(str(tmp_path / 'data.csv'))
+  single_column_model = load(os.path.join(example_data, 'example_dataset.csv'))
+  assert current_model.disk_column_names == ['10 ug', '30 ug']
+  assert current_model.current_dataset['disk_columns'].shape == (single_column_model.current_dataset['mics'].shape[0], 2)
+  assert np.array_equal(current_model.current_dataset['disks'], single_column_model.current_dataset['disks'])
+  assert current_model.count_table.counts.shape[0] == 2
+  assert np.array_equal(current_model.count_table.counts[0].sum(axis=0), current_model.count_table.counts[1].sum(axis=0))
+  current_model.select_disk_column(1)
+  assert np.array_equal(current_model.current_dataset['disks'], current_model.current_dataset['disk_columns'][:,1])
+
+
+#The disk columns of an appended file are matched up with the loaded ones by name.
+def test_append_dataset_matches_disk_columns_by_name(example_data, tmp_path):
+  write_two_disk_columns(example_data, str(tmp_path / 'all.csv'), ['10 ug', '30 ug'])
+  write_two_disk_columns(example_data, str(tmp_path / 'first.csv'), ['10 ug', '30 ug'], slice(None, 200))
+  write_two_disk_columns(example_data, str(tmp_path / 'second.csv'), ['30 ug', '10 ug'], slice(200, None))
+  current_model = load(str(tmp_path / 'first.csv'))
+  assert current_model.append_dataset(str(tmp_path / 'second.csv')) == '0'
+  assert_same_data(current_model, load(str(tmp_path / 'all.csv')))
+
+
+def test_append_dataset_with_other_disk_columns_fails(example_data, tmp_path):
+  write_two_disk_columns(example_data, str(tmp_path / 'first.csv'), ['10 ug', '30 ug'], slice(None, 200))
+  write_two_disk_columns(example_data, str(tmp_path / 'second.csv'), ['10 ug', '30 ug'], slice(200, None))
+  (tmp_path / 'second.csv').write_text((tmp_path / 'second.csv').read_text().replace('30 ug', '5 ug'))
+  current_model = load(str(tmp_path / 'first.csv'))
+  assert current_model.append_dataset(str(tmp_path / 'second.csv')) != '0'
+  assert current_model.current_dataset['mics'].shape[0] == 200
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pytest
+import model_object, model_core, count_tables, data_processing, power_simulation
+
+
+def example_distribution():
+  return power_simulation.parametric_model([0.5, 1, 2, 4, 8, 16, 32], [0.2, 0.25, 0.15, 0.05, 0.05, 0.1, 0.2],
+                                           [28, 26, 23, 20, 17, 13, 9], [2.5, 2.5, 3, 3, 3, 2.5, 2])
+
+
+def simulation_settings(**settings):
+  return dict(dict(power_simulation.DEFAULT_SETTINGS, sample_sizes=[60, 150], num_studies=300, seed=11), **settings)
+
+
+def test_parametric_model_probabilities(tmp_path):
+  sim_model = example_distribution()
+  assert sim_model.probabilities.shape == (45, 7)
+  assert np.isclose(sim_model.probabilities.sum(), 1)
+  assert np.allclose(sim_model.probabilities.sum(axis=0), np.asarray([0.2, 0.25, 0.15, 0.05, 0.05, 0.1, 0.2]))
+  (tmp_path / 'distribution.csv').write_text('MIC,proportion,zone mean,zone sd\n32,2,9,2\n0.5,2,28,2.5\n4,1,20,3\n')
+  error_code, read_model = power_simulation.read_distribution_file(str(tmp_path / 'distribution.csv'))
+  assert error_code == '0'
+  assert np.array_equal(read_model.mic_values, [0.5, 4, 32])
+  assert np.allclose(read_model.probabilities.sum(axis=0), [0.4, 0.2, 0.4])
+  (tmp_path / 'distribution.csv').write_text('MIC,proportion,zone mean,zone sd\n32,2,9,0\n')
+  assert power_simulation.read_distribution_file(str(tmp_path / 'distribution.csv'))[0] != '0'
+
+
+#The true results of a reference dataset are those of fitting the dataset itself.
+def test_reference_model_truth_matches_fitting_the_dataset(example_data):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(os.path.join(example_data, 'example_dataset.csv')) == '0'
+  error_code, sim_model = power_simulation.reference_model(current_model)
+  assert error_code == '0'
+  assert np.isclose(sim_model.probabilities.sum(), 1)
+  data_processing.fit_data(current_model)
+  current_model.update_error_tables()
+  error_code, truth = power_simulation.true_results(sim_model, 'mgm', 4.0, 16.0)
+  assert error_code == '0'
+  assert (truth['cutoff R'], truth['cutoff S']) == (current_model.xcutoffR, current_model.xcutoffS)
+  for error_type in ['very major errors', 'major errors', 'minor errors']:
+    assert np.isclose(truth[error_type + ' (%)'],
+                      100.0 * current_model.error_counts[error_type] / current_model.error_counts['num_strains'])
+
+
+#Every study in a batch must get the cutoffs and error rates it would get if it were fit on its own.
+@pytest.mark.parametrize('model_type', list(model_core.model_engines))
+def test_batched_studies_match_separate_fits(model_type):
+  sim_model = example_distribution()
+  sample_size, cutoffs_R, cutoffs_S, error_rates = power_simulation.simulate_studies(
+    (sim_model, model_type, 4.0, 16.0, 40, 50, np.random.SeedSequence(3)))
+  counts = np.random.default_rng(np.random.SeedSequence(3)).multinomial(40, sim_model.probabilities.ravel(), size=50)
+  for i in range(0,50):
+    table = count_tables.count_table()
+    table.disk_values, table.mic_values = sim_model.disk_values, sim_model.mic_values
+    table.counts = counts[i].reshape((1,) + sim_model.probabilities.shape)
+    disk_values, class_counts = table.class_counts(4.0, 16.0)
+    if class_counts[0,:,0].sum() == 0 or class_counts[0,:,2].sum() == 0:
+      assert np.isnan(cutoffs_R[i]) and np.isnan(error_rates[i]).all()
+      continue
+    engine = model_core.new_engine(model_type)
+    engine.fit_disk_counts(disk_values, class_counts[0])
+    assert (cutoffs_R[i], cutoffs_S[i]) == (engine.cutoff_R, engine.cutoff_S)
+    error_counts = table.tabulate_errors(4.0, 16.0, engine.cutoff_S, engine.cutoff_R)['error_counts']
+    assert np.allclose(error_rates[i], [100.0 * error_counts[error_type] / 40 for error_type
+                                        in ['very major errors', 'major errors', 'minor errors']])
+
+
+#With a seed the simulation is repeatable, however many worker processes it is spread across.
+def test_simulation_with_a_seed_is_repeatable():
+  sim_model = example_distribution()
+  error_code, truth, curves = power_simulation.run_simulation(sim_model, simulation_settings(), num_workers=1)
+  assert error_code == '0'
+  assert [curve['sample size'] for curve in curves] == [60, 150]
+  assert all([curve['num studies'] == 300 for curve in curves])
+  assert power_simulation.run_simulation(sim_model, simulation_settings(), num_workers=2) == (error_code, truth, curves)
+  assert power_simulation.run_simulation(sim_model, simulation_settings(seed=12), num_workers=1)[2] != curves
+  #Larger studies find the true cutoffs more often.
+  assert curves[1]['same cutoffs (%)'] >= curves[0]['same cutoffs (%)']
+
+
+def test_simulation_settings_are_checked():
+  sim_model = example_distribution()
+  assert power_simulation.run_simulation(sim_model, simulation_settings(sample_sizes=[0]))[0] != '0'
+  assert power_simulation.run_simulation(sim_model, simulation_settings(ycutoffS='x'))[0] != '0'
+  assert power_simulation.run_simulation(sim_model, simulation_settings(ycutoffS=64, ycutoffR=128))[0] != '0'
@@ -0,0 +1,94 @@
+import os, gc, weakref
+import numpy as np
+import model_object, data_processing, session_files
+
+
+def fitted_model(filename):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  data_processing.fit_data(current_model)
+  current_model.update_error_tables()
+  return current_model
+
+
+#Weak references to every memory map of filename among the model's arrays.
+def memory_maps(current_model, filename):
+  return [weakref.ref(array) for array in session_files.session_arrays(current_model).values()
+          if isinstance(array, np.memmap) and session_files.is_mapped_from(array, filename)]
+
+
+def assert_same_session(current_model, expected_model):
+  for column in expected_model.current_dataset:
+    if expected_model.current_dataset[column] is None:
+      assert current_model.current_dataset[column] is None
+    else:
+      assert np.array_equal(current_model.current_dataset[column], expected_model.current_dataset[column])
+  assert np.array_equal(current_model.count_table.counts, expected_model.count_table.counts)
+  assert np.array_equal(current_model.model_engine.score_surface, expected_model.model_engine.score_surface)
+  assert current_model.model_engine.tied_optima == expected_model.model_engine.tied_optima
+  assert current_model.error_counts == expected_model.error_counts
+  assert (current_model.xcutoffR, current_model.xcutoffS) == (expected_model.xcutoffR, expected_model.xcutoffS)
+
+
+def test_session_round_trip(example_data, tmp_path):
+  lines = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  filename = str(tmp_path / 'meta.csv')
+  with open(filename, 'w') as output_file:
+    output_file.write('MIC,Disk,site,weight\n')
+    output_file.write('\n'.join(['%s,%s,%s'%(line, ['blood', 'urine', 'lung'][i % 3], 1 + (i % 4) / 2)
+                                 for i, line in enumerate(lines)]) + '\n')
+  current_model = fitted_model(filename)
+  assert current_model.set_subset_filter('site!=lung') == '0'
+  data_processing.fit_data(current_model)
+  current_model.update_error_tables()
+  assert session_files.save_session(current_model, str(tmp_path / 'analysis.dfs')) == '0'
+  error_code, opened_model = session_files.load_session(str(tmp_path / 'analysis.dfs'))
+  assert error_code == '0'
+  assert_same_session(opened_model, current_model)
+  assert opened_model.subset_filter == 'site!=lung'
+  assert np.array_equal(opened_model.subset_mask, current_model.subset_mask)
+  assert np.array_equal(opened_model.subset_table.counts, current_model.subset_table.counts)
+  assert opened_model.metadata_categories == current_model.metadata_categories
+
+
+#A session that was opened from a file (so its arrays are memory-mapped from it) must be
+#able to be saved back over that same file without losing any of its data.
+def test_save_over_opened_session(example_data, tmp_path):
+  current_model = fitted_model(os.path.join(example_data, 'example_dataset.csv'))
+  filename = str(tmp_path / 'analysis.dfs')
+  assert session_files.save_session(current_model, filename) == '0'
+
+  error_code, opened_model = session_files.load_session(filename)
+  assert error_code == '0'
+  assert len(memory_maps(opened_model, filename)) > 0
+  assert session_files.save_session(opened_model, filename) == '0'
+  #The model that was opened from the file must still be readable after the file was replaced.
+  assert_same_session(opened_model, current_model)
+
+  error_code, reopened_model = session_files.load_session(filename)
+  assert error_code == '0'
+  assert_same_session(reopened_model, current_model)
+  assert os.listdir(str(tmp_path)) == ['analysis.dfs']
+
+
+#On Windows a file can't be replaced while it is memory-mapped, so saving over the file a session
+#was opened from only works if its memory maps have all been released first. This checks that
+#they have, whatever the platform the tests are run on.
+def test_save_over_opened_session_releases_the_file(example_data, tmp_path, monkeypatch):
+  filename = str(tmp_path / 'analysis.dfs')
+  assert session_files.save_session(fitted_model(os.path.join(example_data, 'example_dataset.csv')), filename) == '0'
+  error_code, opened_model = session_files.load_session(filename)
+  assert error_code == '0'
+  maps = memory_maps(opened_model, filename)
+  replace = os.replace
+
+  def replace_like_windows(source, destination):
+    gc.collect()
+    if any([memory_map() is not None for memory_map in maps]):
+      raise PermissionError('The file is in use by another process')
+    replace(source, destination)
+
+  monkeypatch.setattr(session_files.os, 'replace', replace_like_windows)
+  assert session_files.save_session(opened_model, filename) == '0'
+  assert not any([session_files.is_mapped_from(array, filename)
+                  for array in session_files.session_arrays(opened_model).values()])
@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import pytest
+import model_object, subsets
+
+
+SITES = ['blood', 'urine', 'lung']
+REGIONS = ['north', 'south', 'east', 'west']
+
+
+#The example data with a site, region and collection date for each isolate. Returns the file's
+#lines (header first) and the metadata of each isolate.
+def write_metadata_dataset(example_data, filename):
+  rng = np.random.default_rng(8)
+  rows = open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()
+  isolates = [{'site':SITES[rng.integers(0, 3)], 'region':REGIONS[rng.integers(0, 4)],
+               'date':np.datetime64('2016-01-01') + rng.integers(0, 1500)} for row in rows]
+  lines = ['MIC,Disk,meta:site,meta:region,date'] + ['%s,%s,%s,%s'%(row, isolate['site'], isolate['region'], isolate['date'])
+                                                     for row, isolate in zip(rows, isolates)]
+  with open(filename, 'w') as output_file:
+    output_file.write('\n'.join(lines) + '\n')
+  return lines, isolates
+
+
+def load(filename):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  return current_model
+
+
+#The nonzero cells of a count table, so that tables with different disk and mic value axes can be compared.
+def table_cells(table):
+  return {(column, table.disk_values[i], table.mic_values[j]):table.counts[column,i,j]
+          for column, i, j in np.argwhere(table.counts)}
+
+
+FILTERS = [
+  ('site=blood', lambda isolate: isolate['site'] == 'blood'),
+  ('site!=blood', lambda isolate: isolate['site'] != 'blood'),
+  ('site=blood AND region=north', lambda isolate: isolate['site'] == 'blood' and isolate['region'] == 'north'),
+  ('region=north OR region=east', lambda isolate: isolate['region'] in ['north', 'east']),
+  ('site=urine AND region!=west OR site=lung', lambda isolate: (isolate['site'] == 'urine' and isolate['region'] != 'west') or isolate['site'] == 'lung'),
+  ('date>=2018-01-01', lambda isolate: isolate['date'] >= np.datetime64('2018-01-01')),
+  ('date<2017-06', lambda isolate: isolate['date'] < np.datetime64('2017-06-01')),
+  ('META:Site=lung and Date>2016-03-05', lambda isolate: isolate['site'] == 'lung' and isolate['date'] > np.datetime64('2016-03-05')),
+  ('site=blood OR site=nowhere', lambda isolate: isolate['site'] == 'blood'),
+]
+
+
+@pytest.mark.parametrize('filter_expression, passes', FILTERS)
+def test_filter_selects_matching_isolates(example_data, tmp_path, filter_expression, passes):
+  lines, isolates = write_metadata_dataset(example_data, str(tmp_path / 'data.csv'))
+  current_model = load(str(tmp_path / 'data.csv'))
+  expected_mask = np.asarray([passes(isolate) for isolate in isolates])
+  assert np.array_equal(subsets.evaluate_filter(current_model, filter_expression), expected_mask)
+  #Checking only some of the rows, as is done for appended isolates, gives the same answer for them.
+  rows = np.arange(100, 301)
+  assert np.array_equal(subsets.evaluate_filter(current_model, filter_expression, rows), expected_mask[rows])
+  #The subset's count table is the same as if only the selected isolates had been loaded.
+  assert current_model.set_subset_filter(filter_expression) == '0'
+  (tmp_path / 'subset.csv').write_text('\n'.join([lines[0]] + [line for line, selected in zip(lines[1:], expected_mask)
+                                                               if selected]) + '\n')
+  assert table_cells(current_model.subset_table) == table_cells(load(str(tmp_path / 'subset.csv')).count_table)
+
+
+@pytest.mark.parametrize('filter_expression', ['site', 'site=blood AND =north', 'colour=red', 'site>blood',
+                                               'date>=yesterday'])
+def test_invalid_filter_keeps_the_previous_one(example_data, tmp_path, filter_expression):
+  write_metadata_dataset(example_data, str(tmp_path / 'data.csv'))
+  current_model = load(str(tmp_path / 'data.csv'))
+  assert current_model.set_subset_filter('site=blood') == '0'
+  subset_mask = current_model.subset_mask.copy()
+  with pytest.raises(ValueError):
+    subsets.evaluate_filter(current_model, filter_expression)
+  assert current_model.set_subset_filter(filter_expression) != '0'
+  assert current_model.subset_filter == 'site=blood'
+  assert np.array_equal(current_model.subset_mask, subset_mask)
+
+
+def test_filter_that_matches_nothing_is_refused(example_data, tmp_path):
+  write_metadata_dataset(example_data, str(tmp_path / 'data.csv'))
+  current_model = load(str(tmp_path / 'data.csv'))
+  assert current_model.set_subset_filter('site=nowhere') != '0'
+  assert current_model.subset_mask is None
+  assert current_model.active_count_table() is current_model.count_table
+
+
+#Appended isolates that pass the filter join the subset; the bitmap index is rebuilt for the next filter.
+def test_appended_isolates_extend_the_subset(example_data, tmp_path):
+  lines, isolates = write_metadata_dataset(example_data, str(tmp_path / 'all.csv'))
+  (tmp_path / 'first.csv').write_text('\n'.join(lines[:301]) + '\n')
+  (tmp_path / 'second.csv').write_text('\n'.join([lines[0]] + lines[301:]) + '\n')
+  current_model = load(str(tmp_path / 'first.csv'))
+  assert current_model.set_subset_filter('site=urine OR date<2017-01-01') == '0'
+  index = subsets.get_metadata_index(current_model)
+  assert current_model.append_dataset(str(tmp_path / 'second.csv')) == '0'
+  all_model = load(str(tmp_path / 'all.csv'))
+  assert all_model.set_subset_filter('site=urine OR date<2017-01-01') == '0'
+  assert np.array_equal(current_model.subset_mask, all_model.subset_mask)
+  assert table_cells(current_model.subset_table) == table_cells(all_model.subset_table)
+  assert subsets.get_metadata_index(current_model) is not index
+  assert subsets.get_metadata_index(current_model).num_rows == len(lines) - 1
+  assert current_model.set_subset_filter('region=south') == '0'
+  assert np.array_equal(current_model.subset_mask, [isolate['region'] == 'south' for isolate in isolates])
+
+
+def test_group_filters(example_data, tmp_path):
+  write_metadata_dataset(example_data, str(tmp_path / 'data.csv'))
+  current_model = load(str(tmp_path / 'data.csv'))
+  groups = subsets.group_filters(current_model, 'SITE', 'region=north OR date>=2019-01-01')
+  assert sorted([value for value, filter_expression in groups]) == sorted(SITES)
+  total_mask = np.zeros(current_model.current_dataset['mics'].shape[0], dtype=bool)
+  for value, filter_expression in groups:
+    group_mask = subsets.evaluate_filter(current_model, filter_expression)
+    assert not (total_mask & group_mask).any()
+    total_mask |= group_mask
+  assert np.array_equal(total_mask, subsets.evaluate_filter(current_model, 'region=north OR date>=2019-01-01'))
+  with pytest.raises(ValueError):
+    subsets.group_filters(current_model, 'date')
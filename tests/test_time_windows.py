@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+import model_object, data_processing, time_windows
+
+
+#Writes the example dataset with a collection date (spread over about three years) and, optionally,
+#a weight for each isolate, and returns the filename and the rows.
+def write_dated_dataset(example_data, tmp_path, weighted=False):
+  rng = np.random.default_rng(7)
+  rows = [line.split(',') for line in open(os.path.join(example_data, 'example_dataset.csv')).read().splitlines()]
+  dates = np.datetime64('2017-01-01') + rng.integers(0, 1100, size=len(rows))
+  weights = np.round(rng.uniform(0.2, 3.0, size=len(rows)), 3)
+  header = 'MIC,Disk,date' + (',weight' if weighted else '')
+  lines = ['%s,%s,%s'%(row[0], row[1], date) + (',%s'%weight if weighted else '')
+           for row, date, weight in zip(rows, dates, weights)]
+  filename = str(tmp_path / 'dated.csv')
+  with open(filename, 'w') as output_file:
+    output_file.write('\n'.join([header] + lines) + '\n')
+  return filename, header, lines, dates
+
+
+#Fits the isolates collected between start and end (inclusive) from scratch, the way the main
+#window would if they were the only ones in the file.
+def brute_force_window(header, lines, dates, start, end, tmp_path):
+  selected = [line for line, date in zip(lines, dates) if start <= date <= end]
+  filename = str(tmp_path / 'window.csv')
+  with open(filename, 'w') as output_file:
+    output_file.write('\n'.join([header] + selected) + '\n')
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  fit_message = data_processing.fit_data(current_model)
+  if fit_message != '0' and not fit_message.startswith('!'):
+    return len(selected), None
+  current_model.update_error_tables()
+  return current_model.count_table.num_strains(), current_model
+
+
+@pytest.mark.parametrize('expanding', [False, True])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_windows_match_refitting_each_window(example_data, tmp_path, expanding, weighted):
+  filename, header, lines, dates = write_dated_dataset(example_data, tmp_path, weighted)
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  error_code, time_series = time_windows.rolling_window_fit(current_model, 365, 120, expanding)
+  assert error_code == '0'
+  assert len(time_series) > 3
+  assert time_series[0]['window start'] == dates.min()
+  assert time_series[-1]['window end'] >= dates.max()
+  for window in time_series:
+    num_strains, window_model = brute_force_window(header, lines, dates, window['window start'],
+                                                   window['window end'], tmp_path)
+    assert window['num_strains'] == pytest.approx(num_strains)
+    if window_model is None:
+      assert window['disk cutoff R'] is None
+      continue
+    assert (window['disk cutoff R'], window['disk cutoff S']) == (window_model.xcutoffR, window_model.xcutoffS)
+    for error_type in ['very major errors', 'major errors', 'minor errors']:
+      assert window[error_type + ' (%)'] == pytest.approx(
+        round(100 * window_model.error_counts[error_type] / window_model.error_counts['num_strains'], 2))
+
+
+def test_step_longer_than_window(example_data, tmp_path):
+  filename, header, lines, dates = write_dated_dataset(example_data, tmp_path)
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(filename) == '0'
+  error_code, time_series = time_windows.rolling_window_fit(current_model, 30, 200)
+  assert error_code == '0'
+  for window in time_series:
+    assert window['num_strains'] == np.sum((dates >= window['window start']) & (dates <= window['window end']))
+
+
+def test_dataset_without_dates(example_data):
+  current_model = model_object.model_parameter_set()
+  assert current_model.load_dataset(os.path.join(example_data, 'example_dataset.csv')) == '0'
+  error_code, time_series = time_windows.rolling_window_fit(current_model, 365, 30)
+  assert error_code != '0' and time_series == []
@@ -0,0 +1,105 @@
+import os, io, csv, zipfile, numbers
+import xml.etree.ElementTree as ElementTree
+import command_line, workbook_export
+
+NAMESPACES = {'main':'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+              'relationships':'http://schemas.openxmlformats.org/package/2006/relationships'}
+
+
+#Reads an .xlsx file written by workbook_export back into {sheet name: rows}, with numbers as floats
+#and text as strings, going through the workbook's relationships as a spreadsheet program would.
+def read_xlsx(filename):
+  with zipfile.ZipFile(filename) as archive:
+    content_types = ElementTree.fromstring(archive.read('[Content_Types].xml'))
+    overrides = [override.get('PartName') for override in content_types]
+    assert ElementTree.fromstring(archive.read('_rels/.rels'))[0].get('Target') == 'xl/workbook.xml'
+    targets = {relationship.get('Id'):relationship.get('Target') for relationship
+               in ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))}
+    sheets = {}
+    for sheet in ElementTree.fromstring(archive.read('xl/workbook.xml')).find('main:sheets', NAMESPACES):
+      target = 'xl/' + targets[sheet.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')]
+      assert '/' + target in overrides
+      rows = []
+      for row in ElementTree.fromstring(archive.read(target)).find('main:sheetData', NAMESPACES):
+        rows.append([cell_value(cell) for cell in row])
+      sheets[sheet.get('name')] = rows
+  return sheets
+
+
+def cell_value(cell):
+  if cell.get('t') == 'inlineStr':
+    return cell.find('main:is/main:t', NAMESPACES).text
+  value = cell.find('main:v', NAMESPACES)
+  return None if value is None else float(value.text)
+
+
+#The rows as they come back from the workbook: numbers as floats, blanks as None and the rest as text.
+def as_read_back(rows):
+  return [[float(value) if isinstance(value, numbers.Number) else (None if value in ['', None] else str(value))
+           for value in row] for row in rows]
+
+
+def example_datasets(example_data, tmp_path):
+  (tmp_path / 'broken.csv').write_text('MIC,Disk\nnot,numbers\n')
+  filenames = [os.path.join(example_data, 'example_dataset.csv'), os.path.join(example_data, 'smalltest.csv'),
+               str(tmp_path / 'broken.csv')]
+  return [(name, current_model, fit_message) for name, current_model, fit_message
+          in workbook_export.fitted_datasets(filenames, command_line.DEFAULT_SETTINGS)]
+
+
+def test_xlsx_workbook_contents(example_data, tmp_path):
+  datasets = example_datasets(example_data, tmp_path)
+  filename = str(tmp_path / 'results.xlsx')
+  assert workbook_export.export_workbook(datasets, filename) == '0'
+  sheets = read_xlsx(filename)
+  assert list(sheets) == ['Summary', 'example_dataset', 'smalltest']
+  summary = sheets['Summary']
+  assert summary[0] == workbook_export.SUMMARY_COLUMNS
+  for row, (name, current_model, fit_message) in zip(summary[1:3], datasets):
+    assert row == as_read_back([workbook_export.summary_row(current_model, name, fit_message)])[0]
+    assert sheets[name] == as_read_back(workbook_export.dataset_rows(current_model, name, fit_message))
+  assert summary[1][5:7] == [datasets[0][1].xcutoffR, datasets[0][1].xcutoffS]
+  #The dataset that couldn't be loaded is listed with the reason, but has no sheet.
+  assert summary[3][0] == 'broken' and summary[3][3] == datasets[2][2] != '0'
+
+
+def test_csv_bundle_contents(example_data, tmp_path):
+  datasets = example_datasets(example_data, tmp_path)
+  filename = str(tmp_path / 'results.zip')
+  assert workbook_export.export_workbook(datasets, filename) == '0'
+  with zipfile.ZipFile(filename) as archive:
+    assert sorted(archive.namelist()) == ['Summary.csv', 'example_dataset.csv', 'smalltest.csv']
+    sheets = {name[:-4]:list(csv.reader(io.TextIOWrapper(archive.open(name), newline='')))
+              for name in archive.namelist()}
+  for name, current_model, fit_message in datasets[:2]:
+    assert sheets[name] == [['' if value is None else str(value) for value in row]
+                            for row in workbook_export.dataset_rows(current_model, name, fit_message)]
+  assert sheets['Summary'][0] == workbook_export.SUMMARY_COLUMNS
+  assert len(sheets['Summary']) == 4
+
+
+#If anything goes wrong part way through, no half-written workbook is left behind.
+def test_failed_export_removes_the_partial_file(example_data, tmp_path):
+  datasets = example_datasets(example_data, tmp_path)
+
+  def failing_datasets():
+    yield datasets[0]
+    raise IOError('The dataset could not be read')
+
+  for extension in ['.xlsx', '.zip']:
+    filename = str(tmp_path / ('results' + extension))
+    assert workbook_export.export_workbook(failing_datasets(), filename) != '0'
+    assert not os.path.exists(filename)
+  assert workbook_export.export_workbook(datasets, str(tmp_path / 'results.ods')) != '0'
+  assert not os.path.exists(str(tmp_path / 'results.ods'))
+
+
+def test_sheet_names_are_valid_and_unique():
+  used_names = {'summary'}
+  names = [workbook_export.sheet_name(name, used_names) for name in
+           ['Summary', 'site: blood/urine', 'a' * 40, 'a' * 40, 'Site: blood/urine']]
+  assert names[0] == 'Summary (2)'
+  assert names[1] == 'site_ blood_urine'
+  assert names[2] == 'a' * 31 and names[3] == 'a' * 27 + ' (2)'
+  assert names[4] == 'Site_ blood_urine (2)'
+  assert all([len(name) <= 31 for name in names])